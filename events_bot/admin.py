@@ -1,4 +1,18 @@
-from django.contrib import admin
+from datetime import timedelta
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Max, Prefetch, Q
+from django.db.models.expressions import RawSQL
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.functional import cached_property
 from .models import (
     TimeSlot,
     Event,
@@ -6,13 +20,116 @@ from .models import (
     Participant,
     Question,
     Donation,
-    ConnectionRequest
+    ConnectionRequest,
+    EventNotification
 )
+from .cache import LRUCache
+from .exports import export_response
+from .schedule_import import CSV_COLUMNS, ScheduleImportError, import_schedule, parse_schedule
+from .search import MATCH_IDS_SQL, RANK_SQL, build_match_query
+
+# Сколько последних мероприятий показывать в фильтре
+EVENT_FILTER_LIMIT = 20
+
+admin_count_cache = LRUCache(maxsize=256, ttl=settings.ADMIN_COUNT_CACHE_TTL)
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator для больших таблиц: не пересчитывает все строки на каждой странице.
+
+    Без фильтров число строк оценивается по наибольшему первичному ключу
+    (один переход по индексу). С фильтрами и поиском считается точно, но
+    результат запоминается на ADMIN_COUNT_CACHE_TTL секунд.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return queryset.model._base_manager.aggregate(last=Max('pk'))['last'] or 0
+        sql, params = queryset.query.sql_with_params()
+        key = (sql, repr(params))
+        count = admin_count_cache.get(key)
+        if count is None:
+            count = queryset.count()
+            admin_count_cache.set(key, count)
+        return count
+
+
+@admin.action(description='Выгрузить выбранное в CSV')
+def export_csv(modeladmin, request, queryset):
+    return export_response(queryset, 'csv')
+
+
+@admin.action(description='Выгрузить выбранное в JSONL')
+def export_jsonl(modeladmin, request, queryset):
+    return export_response(queryset, 'jsonl')
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без полного подсчёта строк для таблиц, которые растут с числом участников."""
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+
+class RecentEventFilter(admin.SimpleListFilter):
+    """Фильтр по мероприятию: только последние EVENT_FILTER_LIMIT мероприятий."""
+    title = 'Мероприятие'
+    parameter_name = 'event'
+
+    def lookups(self, request, model_admin):
+        return Event.objects.order_by('-date').values_list('pk', 'title')[:EVENT_FILTER_LIMIT]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(event_id=self.value())
+        return queryset
+
+
+class EventSpeakerFilter(admin.SimpleListFilter):
+    """Фильтр по спикеру выбранного мероприятия, а без выбора — активного."""
+    title = 'Спикер'
+    parameter_name = 'speaker'
+
+    def lookups(self, request, model_admin):
+        event_id = request.GET.get(RecentEventFilter.parameter_name)
+        if not event_id:
+            event_id = Event.objects.filter(is_active=True).values_list('pk', flat=True).first()
+        if not event_id:
+            return []
+        return Speaker.objects.filter(events=event_id).order_by('name').values_list('pk', 'name')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(speaker_id=self.value())
+        return queryset
+
+
+class PeriodFilter(admin.SimpleListFilter):
+    """Фильтр по давности вместо date_hierarchy, которой нужен перебор всех дат."""
+    title = 'Период'
+    parameter_name = 'period'
+    field_name = 'timestamp'
+    PERIODS = {
+        'day': ('За сутки', timedelta(days=1)),
+        'week': ('За неделю', timedelta(days=7)),
+        'month': ('За месяц', timedelta(days=30)),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(value, label) for value, (label, _) in self.PERIODS.items()]
+
+    def queryset(self, request, queryset):
+        period = self.PERIODS.get(self.value())
+        if period is None:
+            return queryset
+        return queryset.filter(**{f'{self.field_name}__gte': timezone.now() - period[1]})
 
 
 class SpeakerInline(admin.TabularInline):
     model = Speaker.events.through
     extra = 1
+    autocomplete_fields = ('speaker',)
     verbose_name = "Спикер"
     verbose_name_plural = "Спикеры мероприятия"
 
@@ -20,22 +137,94 @@ class SpeakerInline(admin.TabularInline):
 class TimeSlotInline(admin.TabularInline):
     model = TimeSlot
     extra = 1
-    fields = ('speaker', 'title', 'start_time', 'end_time', 'description')
+    fields = ('speaker', 'title', 'start_time', 'end_time', 'room', 'description')
+    autocomplete_fields = ('speaker',)
     ordering = ('start_time',)
     verbose_name = "Временной слот"
     verbose_name_plural = "Расписание выступлений"
 
 
+class ScheduleImportForm(forms.Form):
+    file = forms.FileField(
+        label='Файл расписания',
+        help_text=f"ICS или CSV с колонками {', '.join(CSV_COLUMNS)}; "
+                  "время — «10:00» в день мероприятия или дата и время в ISO 8601",
+    )
+    replace = forms.BooleanField(label='Заменить текущее расписание', required=False)
+
+
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
     list_display = ('title', 'date', 'is_active', 'speakers_list')
     list_filter = ('is_active', 'date')
     search_fields = ('title', 'description')
     inlines = [SpeakerInline, TimeSlotInline]
+    actions = ['import_schedule_action']
     date_hierarchy = 'date'
     list_per_page = 20
 
+    def get_urls(self):
+        return [
+            path(
+                '<path:object_id>/import-schedule/',
+                self.admin_site.admin_view(self.import_schedule_view),
+                name='events_bot_event_import_schedule',
+            ),
+            *super().get_urls(),
+        ]
+
+    @admin.action(description='Импортировать расписание из CSV или ICS')
+    def import_schedule_action(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, 'Выберите одно мероприятие', messages.WARNING)
+            return None
+        return redirect('admin:events_bot_event_import_schedule', queryset.get().pk)
+
+    def import_schedule_view(self, request, object_id):
+        event = self.get_object(request, object_id)
+        if event is None:
+            return self._get_obj_does_not_exist_redirect(request, self.opts, object_id)
+        if not self.has_change_permission(request, event):
+            raise PermissionDenied
+
+        form = ScheduleImportForm(request.POST or None, request.FILES or None)
+        errors = []
+        if request.method == 'POST' and form.is_valid():
+            try:
+                text = form.cleaned_data['file'].read().decode('utf-8-sig')
+                result = import_schedule(
+                    event, parse_schedule(text, event.date), replace=form.cleaned_data['replace']
+                )
+            except UnicodeDecodeError:
+                errors = ['Файл должен быть в кодировке UTF-8']
+            except ScheduleImportError as e:
+                errors = e.errors
+            else:
+                self.message_user(
+                    request,
+                    f'Импортировано слотов: {result.slots_created}, новых спикеров: {result.speakers_created}, '
+                    f'удалено прежних слотов: {result.slots_deleted}',
+                    messages.SUCCESS,
+                )
+                return redirect('admin:events_bot_event_change', event.pk)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'original': event,
+            'title': f'Импорт расписания: {event}',
+            'form': form,
+            'errors': errors,
+        }
+        return TemplateResponse(request, 'admin/events_bot/event/import_schedule.html', context)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('speakers', queryset=Speaker.objects.only('name'))
+        )
+
     def speakers_list(self, obj):
+        # Спикеры страницы загружены одним запросом в get_queryset
         return ", ".join([speaker.name for speaker in obj.speakers.all()])
     speakers_list.short_description = 'Спикеры'
 
@@ -47,34 +236,89 @@ class SpeakerAdmin(admin.ModelAdmin):
     list_per_page = 20
     filter_horizontal = ('events',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            events_total=Count('events')
+        )
+
     def events_count(self, obj):
-        return obj.events.count()
+        return obj.events_total
     events_count.short_description = 'Мероприятий'
+    events_count.admin_order_field = 'events_total'
+
+
+class SearchRankChangeList(ChangeList):
+    """Выдача поиска идёт по релевантности, пока не выбрана сортировка по колонке."""
+
+    def get_ordering(self, request, queryset):
+        if ORDER_VAR not in self.params and 'search_rank' in queryset.query.annotations:
+            return list(queryset.query.order_by)
+        return super().get_ordering(request, queryset)
 
 
 @admin.register(Participant)
-class ParticipantAdmin(admin.ModelAdmin):
-    list_display = ('name', 'telegram_username', 'is_speaker', 'is_event_manager', 'is_subscribed', 'has_profile')
+class ParticipantAdmin(LargeTableAdmin):
+    list_display = (
+        'name', 'telegram_username', 'is_speaker', 'is_event_manager',
+        'is_subscribed', 'has_profile', 'profiles_viewed'
+    )
     list_filter = ('is_speaker', 'is_event_manager', 'is_subscribed')
     search_fields = ('name', 'telegram_username', 'telegram_id')
+    # Как в списке по умолчанию; заодно упорядочивает выдачу автодополнения
+    ordering = ('-pk',)
+    actions = [export_csv, export_jsonl]
     list_per_page = 20
     filter_horizontal = ('registered_events',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            profiles_viewed_count=Count('profile_views')
+        )
+
+    def get_changelist(self, request, **kwargs):
+        return SearchRankChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        """Имя и описание ищутся по индексу FTS5, username и Telegram ID — точным совпадением.
+
+        Результаты упорядочены по bm25; точные совпадения username и ID,
+        у которых нет ранга, идут первыми.
+        """
+        match = build_match_query(search_term)
+        if not match:
+            return super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        condition = (
+            Q(pk__in=RawSQL(MATCH_IDS_SQL, [match]))
+            | Q(telegram_username__iexact=term.lstrip('@'))
+        )
+        if term.isdigit():
+            condition |= Q(telegram_id=int(term))
+        queryset = queryset.filter(condition).annotate(search_rank=RawSQL(RANK_SQL, [match]))
+        return queryset.order_by(F('search_rank').asc(nulls_first=True), '-pk'), False
+
     def has_profile(self, obj):
         return obj.has_profile
     has_profile.boolean = True
     has_profile.short_description = 'Анкета заполнена'
 
+    def profiles_viewed(self, obj):
+        return obj.profiles_viewed_count
+    profiles_viewed.short_description = 'Просмотрено анкет'
+    profiles_viewed.admin_order_field = 'profiles_viewed_count'
+
 
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin):
+class QuestionAdmin(LargeTableAdmin):
     list_display = ('short_text', 'speaker', 'participant', 'timestamp', 'is_answered', 'event')
-    list_filter = ('is_answered', 'speaker', 'event')
+    list_filter = ('is_answered', RecentEventFilter, EventSpeakerFilter, PeriodFilter)
     search_fields = ('text', 'speaker__name', 'participant__name')
+    list_select_related = ('speaker', 'participant', 'event')
+    autocomplete_fields = ('event', 'speaker', 'participant')
     list_editable = ('is_answered',)
     readonly_fields = ('timestamp',)
+    actions = [export_csv, export_jsonl]
     list_per_page = 20
-    date_hierarchy = 'timestamp'
 
     fieldsets = (
         (None, {
@@ -92,19 +336,34 @@ class QuestionAdmin(admin.ModelAdmin):
 
 
 @admin.register(Donation)
-class DonationAdmin(admin.ModelAdmin):
+class DonationAdmin(LargeTableAdmin):
     list_display = ('participant', 'amount', 'timestamp', 'is_confirmed', 'event')
-    list_filter = ('event', 'is_confirmed')
+    list_filter = (RecentEventFilter, 'is_confirmed', PeriodFilter)
     search_fields = ('participant__name', 'payment_id')
+    list_select_related = ('participant', 'event')
+    autocomplete_fields = ('event', 'participant')
+    actions = [export_csv, export_jsonl]
     list_per_page = 20
-    date_hierarchy = 'timestamp'
 
 
 @admin.register(TimeSlot)
 class TimeSlotAdmin(admin.ModelAdmin):
-    list_display = ('event', 'speaker', 'start_time', 'end_time', 'title', 'is_extended')
-    list_filter = ('event', 'speaker')
+    list_display = ('event', 'speaker', 'start_time', 'end_time', 'title', 'room', 'is_extended')
+    list_filter = (RecentEventFilter, EventSpeakerFilter)
     search_fields = ('title', 'speaker__name')
+    list_select_related = ('event', 'speaker')
+    autocomplete_fields = ('event', 'speaker')
     list_per_page = 20
     date_hierarchy = 'start_time'
     list_editable = ('is_extended',)
+
+
+@admin.register(EventNotification)
+class EventNotificationAdmin(LargeTableAdmin):
+    list_display = ('event', 'participant', 'status', 'created_at', 'sent_at')
+    list_filter = ('status', RecentEventFilter)
+    search_fields = ('participant__name', 'participant__telegram_username')
+    list_select_related = ('event', 'participant')
+    autocomplete_fields = ('event', 'participant')
+    readonly_fields = ('created_at', 'sent_at')
+    list_per_page = 20
@@ -5,4 +5,5 @@ class EventsBotConfig(AppConfig):
     name = 'events_bot'
 
     def ready(self):
+        import events_bot.checks
         import events_bot.signals
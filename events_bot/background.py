@@ -0,0 +1,68 @@
+"""Фоновое выполнение задач вне потока обработчика или HTTP-запроса.
+
+Короткие задачи (обновление рекомендаций, уведомления о новичках) и
+долгие рассылки outbox идут в разные очереди со своими потоками, чтобы
+рассылка на всех подписчиков не задерживала короткие задачи.
+"""
+import logging
+import queue
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundDispatcher:
+    """Очередь задач, которую разбирает один фоновый поток.
+
+    Поток стартует при первой задаче. Задачи выполняются по порядку,
+    исключения логируются и не останавливают поток.
+    """
+
+    def __init__(self, name='background'):
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        self._ensure_started()
+        self._queue.put((func, args, kwargs))
+
+    def join(self):
+        """Ждёт, пока очередь опустеет."""
+        self._queue.join()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            close_old_connections()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception('Ошибка фоновой задачи %s', getattr(func, '__name__', func))
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+
+dispatcher = BackgroundDispatcher()
+delivery_dispatcher = BackgroundDispatcher('background-delivery')
+
+
+def run_in_background(func, *args, **kwargs):
+    dispatcher.submit(func, *args, **kwargs)
+
+
+def run_delivery_in_background(func, *args, **kwargs):
+    """Долгая задача отправки сообщений: выполняется в отдельной очереди."""
+    delivery_dispatcher.submit(func, *args, **kwargs)
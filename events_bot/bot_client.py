@@ -0,0 +1,132 @@
+"""Общий на процесс клиент Telegram с пулом HTTP-соединений.
+
+Один экземпляр бота используется диспетчером, рассылками, сигналами и
+views, поэтому TLS-соединения с api.telegram.org переиспользуются, а
+не открываются заново на каждое действие.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from telegram.ext import ExtBot
+from telegram.utils.request import Request
+
+from events_bot.metrics import telegram_api_duration, telegram_api_errors
+
+logger = logging.getLogger(__name__)
+
+_bot = None
+_lock = threading.Lock()
+
+# Не чаще раза в столько секунд предупреждаем о нехватке соединений
+SATURATION_LOG_INTERVAL = 60
+
+
+def required_pool_size():
+    """Сколько запросов к Telegram может идти одновременно.
+
+    Обработчики обновлений, потоки двух рассылок и getUpdates.
+    """
+    return settings.TG_HANDLER_WORKERS + 2 * settings.TG_BROADCAST_WORKERS + 1
+
+
+class PoolStats:
+    """Счётчики занятости пула соединений."""
+
+    def __init__(self, size):
+        self.size = size
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.saturated = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._last_warning = None
+
+    def acquire(self):
+        with self._lock:
+            warn = False
+            if self.in_flight >= self.size:
+                self.saturated += 1
+                now = time.monotonic()
+                if self._last_warning is None or now - self._last_warning >= SATURATION_LOG_INTERVAL:
+                    self._last_warning = now
+                    warn = True
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            in_flight, saturated = self.in_flight, self.saturated
+        if warn:
+            logger.warning(
+                'Пул соединений с Telegram исчерпан: %s запросов при TG_CON_POOL_SIZE=%s '
+                '(всего ожиданий соединения: %s)', in_flight, self.size, saturated
+            )
+
+    def release(self, failed=False):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'requests': self.requests,
+                'saturated': self.saturated,
+                'errors': self.errors,
+            }
+
+
+class PooledRequest(Request):
+    """Request, который ведёт статистику использования пула и метрики по методам API."""
+
+    __slots__ = ('stats',)
+
+    def __init__(self, con_pool_size, **kwargs):
+        super().__init__(con_pool_size=con_pool_size, **kwargs)
+        self.stats = PoolStats(con_pool_size)
+
+    def _request_wrapper(self, *args, **kwargs):
+        # args — (HTTP-метод, url, ...); последний сегмент url — метод Bot API
+        method = str(args[1]).rsplit('/', 1)[-1] if len(args) > 1 else 'unknown'
+        self.stats.acquire()
+        failed = True
+        try:
+            with telegram_api_duration.time(method=method):
+                result = super()._request_wrapper(*args, **kwargs)
+            failed = False
+            return result
+        except Exception as e:
+            telegram_api_errors.inc(method=method, error=type(e).__name__)
+            raise
+        finally:
+            self.stats.release(failed=failed)
+
+
+def build_request():
+    return PooledRequest(
+        con_pool_size=settings.TG_CON_POOL_SIZE,
+        connect_timeout=settings.TG_CONNECT_TIMEOUT,
+        read_timeout=settings.TG_READ_TIMEOUT,
+    )
+
+
+def get_bot():
+    """Возвращает единственный на процесс экземпляр бота, создавая его при первом вызове."""
+    global _bot
+    if _bot is None:
+        with _lock:
+            if _bot is None:
+                _bot = ExtBot(token=settings.TG_BOT_TOKEN, request=build_request())
+    return _bot
+
+
+def pool_stats():
+    """Текущие счётчики пула соединений общего клиента."""
+    if _bot is None:
+        return PoolStats(settings.TG_CON_POOL_SIZE).as_dict()
+    return _bot.request.stats.as_dict()
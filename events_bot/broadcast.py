@@ -0,0 +1,210 @@
+"""Массовые рассылки с ограничением скорости и отчётом о прогрессе."""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connections
+from telegram.error import RetryAfter, TelegramError, Unauthorized
+
+from events_bot.metrics import broadcast_messages, broadcasts_running
+
+logger = logging.getLogger(__name__)
+
+MAX_SEND_ATTEMPTS = 3
+
+
+class RateLimiter:
+    """Потокобезопасный token bucket: не больше `rate` вызовов в секунду."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+# Лимит Telegram действует на бота целиком, поэтому все рассылки и outbox
+# процесса берут токены из одного ведра
+rate_limiter = RateLimiter(settings.TG_BROADCAST_RATE)
+
+
+@dataclass
+class BroadcastResult:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+
+    @property
+    def processed(self):
+        return self.sent + self.failed + self.blocked
+
+
+class Broadcast:
+    """Рассылка одного текста по потоку telegram_id.
+
+    Получатели читаются из базы порциями по `chunk_size`, сообщения
+    отправляются пулом из `workers` потоков, темп ограничен общим для
+    процесса rate_limiter. `on_progress(result)` вызывается не чаще раза
+    в `progress_interval` секунд и один раз в конце.
+    """
+
+    def __init__(self, bot, text, recipients=None, parse_mode='HTML',
+                 on_progress=None, workers=None, chunk_size=None,
+                 progress_interval=None):
+        self.bot = bot
+        self.text = text
+        self.recipients = recipients
+        self.parse_mode = parse_mode
+        self.on_progress = on_progress
+        self.workers = workers or settings.TG_BROADCAST_WORKERS
+        self.chunk_size = chunk_size or settings.TG_BROADCAST_CHUNK_SIZE
+        self.progress_interval = (
+            settings.TG_BROADCAST_PROGRESS_INTERVAL
+            if progress_interval is None else progress_interval
+        )
+        self.result = BroadcastResult()
+        self._lock = threading.Lock()
+        self._last_report = 0.0
+
+    def iter_chat_ids(self):
+        """telegram_id получателей порциями по первичному ключу.
+
+        Каждая порция — отдельный короткий запрос, курсор не держится
+        открытым, пока идёт отправка.
+        """
+        last_pk = 0
+        while True:
+            rows = list(
+                self.recipients.filter(pk__gt=last_pk).order_by('pk').values_list(
+                    'pk', 'telegram_id'
+                )[:self.chunk_size]
+            )
+            for _, chat_id in rows:
+                yield chat_id
+            if len(rows) < self.chunk_size:
+                return
+            last_pk = rows[-1][0]
+
+    def send(self, chat_id):
+        """Отправляет одно сообщение.
+
+        Возвращает пару (статус, текст ошибки), где статус — 'sent',
+        'blocked' или 'failed'.
+        """
+        error = ''
+        for _ in range(MAX_SEND_ATTEMPTS):
+            rate_limiter.acquire()
+            try:
+                self.bot.send_message(
+                    chat_id=chat_id,
+                    text=self.text,
+                    parse_mode=self.parse_mode
+                )
+                return 'sent', ''
+            except RetryAfter as e:
+                error = str(e)
+                time.sleep(e.retry_after)
+            except Unauthorized as e:
+                return 'blocked', str(e)
+            except TelegramError as e:
+                logger.warning('Не удалось отправить сообщение %s: %s', chat_id, e)
+                return 'failed', str(e)
+        return 'failed', error
+
+    def send_batch(self, chat_ids):
+        """Отправляет порцию сообщений пулом потоков; возвращает {chat_id: (статус, ошибка)}."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return dict(zip(chat_ids, pool.map(self.send, chat_ids)))
+
+    def _deliver(self, chat_id, slots):
+        try:
+            status, _ = self.send(chat_id)
+            broadcast_messages.inc(status=status)
+            with self._lock:
+                setattr(self.result, status, getattr(self.result, status) + 1)
+            self._report()
+        finally:
+            slots.release()
+
+    def _report(self, force=False):
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < self.progress_interval:
+                return
+            self._last_report = now
+        try:
+            self.on_progress(self.result)
+        except TelegramError as e:
+            logger.warning('Не удалось обновить статус рассылки: %s', e)
+
+    def run(self):
+        self.result.total = self.recipients.count()
+        # Первый отчёт — через progress_interval после старта, а не сразу
+        self._last_report = time.monotonic()
+        # Ограничиваем число задач в очереди, чтобы не держать в памяти весь список
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        broadcasts_running.inc()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for chat_id in self.iter_chat_ids():
+                    slots.acquire()
+                    pool.submit(self._deliver, chat_id, slots)
+        finally:
+            broadcasts_running.dec()
+        self._report(force=True)
+        return self.result
+
+    def start(self, on_done=None):
+        """Запускает рассылку в фоновом потоке."""
+        def target():
+            try:
+                result = self.run()
+                if on_done:
+                    on_done(result)
+            except Exception:
+                logger.exception('Рассылка прервана')
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=target, name='broadcast', daemon=True)
+        thread.start()
+        return thread
+
+
+def format_progress(result):
+    return (
+        f"⏳ <b>Рассылка идёт...</b>\n\n"
+        f"Отправлено: {result.sent} из {result.total}\n"
+        f"Не доставлено: {result.failed + result.blocked}"
+    )
+
+
+def format_result(result):
+    return (
+        f"✅ <b>Рассылка завершена</b>\n\n"
+        f"Отправлено: {result.sent} из {result.total}\n"
+        f"Заблокировали бота: {result.blocked}\n"
+        f"Ошибки: {result.failed}"
+    )
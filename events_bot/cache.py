@@ -0,0 +1,289 @@
+"""Кэши в памяти процесса для горячих путей бота.
+
+Записи сбрасываются сигналами моделей (см. signals.py). Изменения из
+другого процесса (например, из админки) становятся видны не позже,
+чем через TTL.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+from dataclasses import dataclass
+from datetime import date, datetime
+from types import MappingProxyType
+
+from django.conf import settings
+from django.utils import timezone
+
+from events_bot.models import Event, Participant, format_program
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с ограничением времени жизни записей."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                self._data.pop(key, None)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+@dataclass(frozen=True)
+class CachedParticipant:
+    """Неизменяемый снимок участника с полями, нужными меню."""
+    id: int
+    telegram_id: int
+    telegram_username: str
+    name: str
+    bio: str
+    is_speaker: bool
+    is_event_manager: bool
+    is_subscribed: bool
+    registered_event_ids: frozenset
+
+    @classmethod
+    def from_model(cls, participant, registered_event_ids=None):
+        if registered_event_ids is None:
+            registered_event_ids = participant.registered_events.values_list('id', flat=True)
+        return cls(
+            id=participant.id,
+            telegram_id=participant.telegram_id,
+            telegram_username=participant.telegram_username,
+            name=participant.name,
+            bio=participant.bio,
+            is_speaker=participant.is_speaker,
+            is_event_manager=participant.is_event_manager,
+            is_subscribed=participant.is_subscribed,
+            registered_event_ids=frozenset(registered_event_ids),
+        )
+
+    @property
+    def has_profile(self):
+        return bool(self.name and self.bio)
+
+
+participant_cache = LRUCache(
+    maxsize=settings.PARTICIPANT_CACHE_SIZE,
+    ttl=settings.PARTICIPANT_CACHE_TTL,
+)
+
+
+def get_participant(telegram_id):
+    """Участник по telegram_id из кэша или базы.
+
+    Как и Participant.objects.get, бросает Participant.DoesNotExist,
+    если участника нет.
+    """
+    cached = participant_cache.get(telegram_id)
+    if cached is None:
+        cached = CachedParticipant.from_model(
+            Participant.objects.get(telegram_id=telegram_id)
+        )
+        participant_cache.set(telegram_id, cached)
+    return cached
+
+
+def get_or_create_participant(user):
+    """Участник для пользователя Telegram; создаётся при первом обращении."""
+    cached = participant_cache.get(user.id)
+    if cached is None:
+        participant, created = Participant.objects.get_or_create(
+            telegram_id=user.id,
+            defaults={
+                'telegram_username': user.username,
+                'name': user.first_name or 'Аноним'
+            }
+        )
+        cached = CachedParticipant.from_model(
+            participant, registered_event_ids=() if created else None
+        )
+        participant_cache.set(user.id, cached)
+    return cached
+
+
+@dataclass(frozen=True)
+class SpeakerInfo:
+    id: int
+    name: str
+    telegram_username: str
+    telegram_id: int
+    bio: str
+
+    @classmethod
+    def from_model(cls, speaker):
+        return cls(
+            id=speaker.id,
+            name=speaker.name,
+            telegram_username=speaker.telegram_username,
+            telegram_id=speaker.telegram_id,
+            bio=speaker.bio,
+        )
+
+
+@dataclass(frozen=True)
+class SlotInfo:
+    id: int
+    title: str
+    description: str
+    start_time: datetime
+    end_time: datetime
+    is_extended: bool
+    speaker: SpeakerInfo
+
+
+class SlotTimeline:
+    """Слоты, отсортированные по началу, для поиска текущего выступления бинарным поиском.
+
+    Параллельно хранится префиксный максимум времени окончания: первый
+    индекс, где он не меньше `now`, — это самый ранний по началу слот,
+    который ещё идёт.
+    """
+
+    def __init__(self, slots):
+        self.slots = tuple(sorted(slots, key=lambda slot: (slot.start_time, slot.id)))
+        self._starts = tuple(slot.start_time for slot in self.slots)
+        self._max_ends = tuple(accumulate((slot.end_time for slot in self.slots), max))
+        self.extended = next((slot for slot in self.slots if slot.is_extended), None)
+
+    def current(self, now):
+        """Продлённое выступление, если есть, иначе слот, идущий в момент `now`."""
+        if self.extended:
+            return self.extended
+        started = bisect_right(self._starts, now)
+        index = bisect_left(self._max_ends, now, hi=started)
+        return self.slots[index] if index < started else None
+
+    def next(self, now):
+        """Ближайший слот, который начнётся после `now`."""
+        index = bisect_right(self._starts, now)
+        return self.slots[index] if index < len(self.slots) else None
+
+
+@dataclass(frozen=True)
+class ActiveEventSnapshot:
+    """Неизменяемый снимок активного мероприятия для меню бота."""
+    id: int
+    title: str
+    date: date
+    program_text: str
+    speakers: tuple
+    speakers_by_username: MappingProxyType
+    time_slots: tuple
+    timeline: SlotTimeline
+
+    @classmethod
+    def build(cls, event):
+        speakers = {
+            speaker.id: SpeakerInfo.from_model(speaker)
+            for speaker in event.speakers.all()
+        }
+        event_speakers = tuple(speakers.values())
+
+        time_slots = []
+        for slot in event.time_slots.select_related('speaker'):
+            if slot.speaker_id not in speakers:
+                speakers[slot.speaker_id] = SpeakerInfo.from_model(slot.speaker)
+            time_slots.append(SlotInfo(
+                id=slot.id,
+                title=slot.title,
+                description=slot.description,
+                start_time=slot.start_time,
+                end_time=slot.end_time,
+                is_extended=slot.is_extended,
+                speaker=speakers[slot.speaker_id],
+            ))
+
+        return cls(
+            id=event.id,
+            title=event.title,
+            date=event.date,
+            program_text=format_program(time_slots),
+            speakers=event_speakers,
+            speakers_by_username=MappingProxyType({
+                speaker.telegram_username: speaker
+                for speaker in event_speakers if speaker.telegram_username
+            }),
+            time_slots=tuple(time_slots),
+            timeline=SlotTimeline(time_slots),
+        )
+
+    def get_current_slot(self, now=None):
+        """Текущий слот: продлённое выступление или слот по расписанию."""
+        return self.timeline.current(now or timezone.now())
+
+    def get_next_slot(self, now=None):
+        return self.timeline.next(now or timezone.now())
+
+
+class ActiveEventCache:
+    """Хранит снимок активного мероприятия до изменения Event, TimeSlot или Speaker.
+
+    TTL ограничивает задержку для изменений, сделанных в другом процессе.
+    """
+
+    _missing = object()
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._snapshot = self._missing
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not self._missing and self._expires > time.monotonic():
+            self.hits += 1
+            return snapshot
+        with self._lock:
+            if self._snapshot is self._missing or self._expires <= time.monotonic():
+                self.misses += 1
+                event = Event.objects.filter(is_active=True).first()
+                self._snapshot = ActiveEventSnapshot.build(event) if event else None
+                self._expires = time.monotonic() + self.ttl
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = self._missing
+
+
+active_event_cache = ActiveEventCache(ttl=settings.ACTIVE_EVENT_CACHE_TTL)
+
+
+def get_active_event():
+    """Снимок активного мероприятия или None, если активных нет."""
+    return active_event_cache.get()
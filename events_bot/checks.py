@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.checks import Info, Tags, Warning, register
+from django.db import connections
+
+from events_bot.bot_client import required_pool_size
+from events_bot.sqlite import get_pragmas, read_pragmas
+
+# Почему прагма могла не примениться
+PRAGMA_HINTS = {
+    'journal_mode': 'В базе в памяти WAL недоступен; для файла проверьте права на каталог базы.',
+    'busy_timeout': 'Проверьте SQLITE_BUSY_TIMEOUT: значение должно быть целым числом миллисекунд.',
+    'synchronous': 'Проверьте SQLITE_SYNCHRONOUS: допустимы OFF, NORMAL, FULL и EXTRA.',
+    'mmap_size': 'В базе в памяти mmap не используется; иначе SQLite собран без mmap '
+                 'или урезает значение до SQLITE_MAX_MMAP_SIZE.',
+    'cache_size': 'Проверьте SQLITE_CACHE_SIZE: отрицательное значение задаёт размер в КиБ.',
+}
+
+
+@register(Tags.database)
+def check_sqlite_pragmas(app_configs, databases=None, **kwargs):
+    """Показывает действующие прагмы SQLite и предупреждает о расхождении с настройками."""
+    messages = []
+    for alias in databases or ():
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            continue
+        expected = get_pragmas()
+        active = read_pragmas(connection)
+        messages.append(Info(
+            f"SQLite '{alias}': " + ', '.join(f'{name}={value}' for name, value in active.items()),
+            id='events_bot.I001',
+        ))
+        for name, value in expected.items():
+            if str(active[name]).lower() != str(value).lower():
+                messages.append(Warning(
+                    f"SQLite '{alias}': PRAGMA {name} = {active[name]}, ожидалось {value}",
+                    hint=PRAGMA_HINTS[name],
+                    id='events_bot.W001',
+                ))
+    return messages
+
+
+@register()
+def check_telegram_pool_size(app_configs, **kwargs):
+    """Предупреждает, если пул соединений с Telegram меньше числа потоков, которые его делят."""
+    required = required_pool_size()
+    if settings.TG_CON_POOL_SIZE >= required:
+        return []
+    return [Warning(
+        f'TG_CON_POOL_SIZE = {settings.TG_CON_POOL_SIZE}, а одновременно к Telegram могут '
+        f'обращаться {required} потоков',
+        hint='Увеличьте TG_CON_POOL_SIZE или уменьшите TG_HANDLER_WORKERS и TG_BROADCAST_WORKERS.',
+        id='events_bot.W002',
+    )]
@@ -0,0 +1,116 @@
+"""Потоковая выгрузка участников, вопросов и донатов в CSV и JSONL.
+
+Строки читаются из базы порциями по EXPORT_CHUNK_SIZE через
+values_list().iterator() и сразу отдаются построчно, поэтому память не
+зависит от размера выгрузки. Используется действиями админки и командой
+export_data.
+"""
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from events_bot.models import Donation, Participant, Question
+
+# Колонки выгрузки: (заголовок, поле для values_list)
+COLUMNS = {
+    Participant: (
+        ('id', 'id'),
+        ('telegram_id', 'telegram_id'),
+        ('telegram_username', 'telegram_username'),
+        ('name', 'name'),
+        ('bio', 'bio'),
+        ('is_speaker', 'is_speaker'),
+        ('is_event_manager', 'is_event_manager'),
+        ('is_subscribed', 'is_subscribed'),
+    ),
+    Question: (
+        ('id', 'id'),
+        ('event', 'event__title'),
+        ('speaker', 'speaker__name'),
+        ('participant', 'participant__name'),
+        ('participant_username', 'participant__telegram_username'),
+        ('text', 'text'),
+        ('timestamp', 'timestamp'),
+        ('is_answered', 'is_answered'),
+    ),
+    Donation: (
+        ('id', 'id'),
+        ('event', 'event__title'),
+        ('participant', 'participant__name'),
+        ('participant_username', 'participant__telegram_username'),
+        ('amount', 'amount'),
+        ('timestamp', 'timestamp'),
+        ('payment_id', 'payment_id'),
+        ('is_confirmed', 'is_confirmed'),
+    ),
+}
+
+# С этих символов Excel и LibreOffice начинают формулу (OWASP, CSV Injection)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, chunk_size=None):
+    fields = [field for _, field in COLUMNS[queryset.model]]
+    return queryset.order_by('pk').values_list(*fields).iterator(
+        chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE
+    )
+
+
+def escape_formula(value):
+    """Текст, который табличный редактор принял бы за формулу, начинается с апострофа."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(queryset, chunk_size=None):
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel открыл кириллицу без выбора кодировки
+    yield '\ufeff' + writer.writerow([header for header, _ in COLUMNS[queryset.model]])
+    for row in iter_rows(queryset, chunk_size):
+        # Имена, анкеты и вопросы вводят пользователи бота
+        yield writer.writerow([escape_formula(value) for value in row])
+
+
+def iter_jsonl(queryset, chunk_size=None):
+    headers = [header for header, _ in COLUMNS[queryset.model]]
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in iter_rows(queryset, chunk_size):
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+def iter_export(queryset, export_format, chunk_size=None):
+    if export_format == 'csv':
+        return iter_csv(queryset, chunk_size)
+    if export_format == 'jsonl':
+        return iter_jsonl(queryset, chunk_size)
+    raise ValueError(f'Неизвестный формат выгрузки: {export_format}')
+
+
+def export_filename(model, export_format):
+    return f"{model._meta.model_name}s-{timezone.localdate():%Y-%m-%d}.{export_format}"
+
+
+def export_response(queryset, export_format):
+    """StreamingHttpResponse с выгрузкой queryset в CSV или JSONL."""
+    response = StreamingHttpResponse(
+        iter_export(queryset, export_format), content_type=FORMATS[export_format]
+    )
+    filename = export_filename(queryset.model, export_format)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
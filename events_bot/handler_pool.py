@@ -0,0 +1,171 @@
+"""Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+Обновления разных пользователей обрабатываются пулом потоков, а
+обновления одного пользователя — строго по очереди, поэтому состояния
+ConversationHandler и user_data не гоняются между потоками. Медленный
+обработчик (платёж, рассылка) задерживает только своего пользователя.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from telegram.ext import Dispatcher
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class HandlerPoolStats:
+    """Счётчики пула обработчиков: глубина очереди и время ожидания."""
+
+    def __init__(self, size):
+        self.size = size
+        self.queued = 0
+        self.active = 0
+        self.processed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def submitted(self):
+        with self._lock:
+            self.queued += 1
+
+    def started(self, wait):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def finished(self):
+        with self._lock:
+            self.active -= 1
+            self.processed += 1
+
+    def as_dict(self):
+        with self._lock:
+            started = self.processed + self.active
+            return {
+                'size': self.size,
+                'queued': self.queued,
+                'active': self.active,
+                'processed': self.processed,
+                'avg_wait_ms': round(self.total_wait / started * 1000, 2) if started else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+            }
+
+
+class KeyedPool:
+    """Пул потоков, в котором задачи с одинаковым ключом выполняются последовательно.
+
+    У каждого ключа своя очередь задач. В общую очередь готовых ключей
+    ключ попадает, только пока его задачу никто не выполняет, поэтому
+    одновременно задачи одного ключа берёт не больше одного потока.
+    """
+
+    def __init__(self, size, name='handlers'):
+        self.stats = HandlerPoolStats(size)
+        self._pending = {}
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._threads = [
+            threading.Thread(target=self._work, name=f'{name}-{i}', daemon=True)
+            for i in range(size)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, func, *args):
+        task = (time.monotonic(), func, args)
+        self.stats.submitted()
+        with self._lock:
+            tasks = self._pending.get(key)
+            if tasks is None:
+                self._pending[key] = deque([task])
+                self._ready.put(key)
+            else:
+                tasks.append(task)
+
+    def join(self):
+        """Ждёт, пока не будут выполнены все поставленные задачи."""
+        with self._idle:
+            while self._pending:
+                self._idle.wait()
+
+    def shutdown(self):
+        self.join()
+        for _ in self._threads:
+            self._ready.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            key = self._ready.get()
+            if key is _STOP:
+                return
+            with self._lock:
+                submitted_at, func, args = self._pending[key].popleft()
+            self.stats.started(time.monotonic() - submitted_at)
+            close_old_connections()
+            try:
+                func(*args)
+            except Exception:
+                logger.exception('Ошибка при обработке обновления')
+            finally:
+                close_old_connections()
+                self.stats.finished()
+                with self._lock:
+                    if self._pending[key]:
+                        # Следующая задача ключа встаёт в конец общей очереди
+                        self._ready.put(key)
+                    else:
+                        del self._pending[key]
+                        if not self._pending:
+                            self._idle.notify_all()
+
+
+def update_key(update):
+    """Ключ упорядочивания: пользователь, иначе чат."""
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return ('user', user.id)
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return ('chat', chat.id)
+    return None
+
+
+class OrderedDispatcher(Dispatcher):
+    """Dispatcher, который обрабатывает обновления в KeyedPool."""
+
+    def __init__(self, *args, pool_size=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = KeyedPool(pool_size or settings.TG_HANDLER_WORKERS)
+
+    def process_update(self, update):
+        self.pool.submit(update_key(update), super().process_update, update)
+
+    def stop(self):
+        super().stop()
+        self.pool.join()
+
+
+def handler_pool_stats():
+    """Счётчики пула обработчиков работающего диспетчера."""
+    try:
+        dp = OrderedDispatcher.get_instance()
+    except RuntimeError:
+        dp = None
+    # Первым мог быть создан обычный Dispatcher (тесты, benchmark_dispatch)
+    pool = getattr(dp, 'pool', None)
+    if pool is None:
+        return HandlerPoolStats(settings.TG_HANDLER_WORKERS).as_dict()
+    return pool.stats.as_dict()
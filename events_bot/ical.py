@@ -0,0 +1,172 @@
+"""Календари мероприятий в формате iCalendar.
+
+Лента мероприятия строится по его слотам, личная лента участника — по
+слотам мероприятий, на которые он зарегистрирован. ETag и Last-Modified
+считаются одним агрегирующим запросом по updated_at мероприятий и слотов
+и хранятся в памяти процесса, пока их не сбросят сигналы (см.
+signals.py), но не дольше ICS_FEED_CACHE_TTL секунд. Календари опрашивают
+ленту раз в несколько минут и почти всегда получают 304 без запросов к
+базе.
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Count, Max
+from django.urls import reverse
+
+from events_bot.cache import LRUCache
+from events_bot.models import Event, Participant, TimeSlot
+
+PRODID = '-//PythonMeetup//events_bot//RU'
+TOKEN_SALT = 'events_bot.ical.participant'
+# Длина строки iCalendar в октетах без CRLF (RFC 5545, 3.1)
+LINE_LIMIT = 75
+
+feed_validators = LRUCache(maxsize=10000, ttl=settings.ICS_FEED_CACHE_TTL)
+
+
+@dataclass(frozen=True)
+class FeedValidators:
+    event_ids: tuple
+    etag: str
+    last_modified: datetime
+
+
+def get_signer():
+    return signing.Signer(salt=TOKEN_SALT, sep='.')
+
+
+def participant_token(participant_id):
+    return get_signer().sign(str(participant_id))
+
+
+def participant_id_from_token(token):
+    try:
+        return int(get_signer().unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def event_feed_url(event_id):
+    return settings.ICS_BASE_URL.rstrip('/') + reverse('event-calendar', args=[event_id])
+
+
+def participant_feed_url(participant_id):
+    return settings.ICS_BASE_URL.rstrip('/') + reverse('participant-calendar', args=[participant_token(participant_id)])
+
+
+def compute_validators(scope, event_ids):
+    stats = Event.objects.filter(pk__in=event_ids).aggregate(
+        events_updated=Max('updated_at'),
+        slots_updated=Max('time_slots__updated_at'),
+        slots=Count('time_slots'),
+    )
+    changes = [stamp for stamp in (stats['events_updated'], stats['slots_updated']) if stamp]
+    last_modified = max(changes) if changes else datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+    # Число слотов в ETag: удаление слота меняет ленту, даже если остальные не менялись
+    digest = hashlib.sha1(
+        f"{scope}|{','.join(map(str, event_ids))}|{last_modified.isoformat()}|{stats['slots']}".encode()
+    ).hexdigest()
+    return FeedValidators(event_ids=tuple(event_ids), etag=f'"{digest}"', last_modified=last_modified)
+
+
+def get_event_validators(event_id):
+    """Валидаторы ленты мероприятия или None, если его нет."""
+    key = ('event', event_id)
+    validators = feed_validators.get(key)
+    if validators is None:
+        if not Event.objects.filter(pk=event_id).exists():
+            return None
+        validators = compute_validators('event', [event_id])
+        feed_validators.set(key, validators)
+    return validators
+
+
+def get_participant_validators(participant_id):
+    """Валидаторы личной ленты участника или None, если его нет."""
+    key = ('participant', participant_id)
+    validators = feed_validators.get(key)
+    if validators is None:
+        event_ids = list(
+            Participant.registered_events.through.objects.filter(
+                participant_id=participant_id
+            ).order_by('event_id').values_list('event_id', flat=True)
+        )
+        if not event_ids and not Participant.objects.filter(pk=participant_id).exists():
+            return None
+        validators = compute_validators('participant', event_ids)
+        feed_validators.set(key, validators)
+    return validators
+
+
+def escape_text(value):
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Переносит строку длиннее LINE_LIMIT октетов, не разрывая символы UTF-8."""
+    if len(line.encode()) <= LINE_LIMIT:
+        return line
+    parts, current, size = [], '', 0
+    for char in line:
+        char_size = len(char.encode())
+        # Продолжение начинается с пробела, он тоже занимает октет
+        limit = LINE_LIMIT if not parts else LINE_LIMIT - 1
+        if size + char_size > limit:
+            parts.append(current)
+            current, size = '', 0
+        current += char
+        size += char_size
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+
+def format_utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_calendar(name, slots):
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(name)}',
+        f'X-WR-TIMEZONE:{settings.TIME_ZONE}',
+    ]
+    for slot in slots:
+        description = slot.description or ''
+        if slot.event.title:
+            description = f'{slot.event.title}\n{description}'.strip()
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:timeslot-{slot.pk}@pythonmeetup',
+            f'DTSTAMP:{format_utc(slot.updated_at)}',
+            f'LAST-MODIFIED:{format_utc(slot.updated_at)}',
+            f'DTSTART:{format_utc(slot.start_time)}',
+            f'DTEND:{format_utc(slot.end_time)}',
+            f'SUMMARY:{escape_text(f"{slot.title} — {slot.speaker.name}")}',
+            f'DESCRIPTION:{escape_text(description)}',
+            f'X-SPEAKER:{escape_text(slot.speaker.name)}',
+        ]
+        if slot.speaker.telegram_username:
+            lines.append(f'X-SPEAKER-TELEGRAM:{escape_text(slot.speaker.telegram_username)}')
+        if slot.room:
+            lines.append(f'LOCATION:{escape_text(slot.room)}')
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(fold(line) for line in lines) + '\r\n'
+
+
+def render_feed(name, event_ids):
+    slots = TimeSlot.objects.filter(event_id__in=event_ids).select_related(
+        'event', 'speaker'
+    ).order_by('start_time')
+    return render_calendar(name, slots)
@@ -0,0 +1,183 @@
+"""Замеры обработчиков бота: время, число SQL-запросов и время в SQL.
+
+instrument_dispatcher оборачивает callback каждого обработчика,
+зарегистрированного в setup_dispatcher, включая вложенные в
+ConversationHandler и MenuRouter. Запросы считаются через
+connection.execute_wrapper. Сводка по обработчикам пишется в лог раз в
+HANDLER_STATS_INTERVAL секунд; вызовы, превысившие пороги, логируются
+сразу. Те же замеры попадают в метрики (см. metrics.py).
+"""
+import functools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection
+from telegram.ext import ConversationHandler
+
+from events_bot.metrics import handler_duration, handler_queries
+from events_bot.router import MenuRouter
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """execute_wrapper, который считает запросы и время их выполнения."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+@dataclass
+class HandlerSummary:
+    calls: int = 0
+    duration: float = 0.0
+    max_duration: float = 0.0
+    queries: int = 0
+    sql_duration: float = 0.0
+    flagged: int = 0
+
+    def add(self, duration, queries, sql_duration, flagged):
+        self.calls += 1
+        self.duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        self.queries += queries
+        self.sql_duration += sql_duration
+        self.flagged += flagged
+
+    def format(self, name):
+        return (
+            f"{name}: {self.calls} вызовов, "
+            f"ср. {self.duration / self.calls * 1000:.1f} мс, "
+            f"макс. {self.max_duration * 1000:.1f} мс, "
+            f"SQL {self.queries / self.calls:.1f} запросов / {self.sql_duration / self.calls * 1000:.1f} мс, "
+            f"превышений {self.flagged}"
+        )
+
+
+class HandlerStats:
+    """Сводка по обработчикам за текущий интервал."""
+
+    def __init__(self, slow_ms, max_queries):
+        self.slow_ms = slow_ms
+        self.max_queries = max_queries
+        self._summaries = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration, queries, sql_duration):
+        handler_duration.observe(duration, handler=name)
+        handler_queries.inc(queries, handler=name)
+        flagged = duration * 1000 > self.slow_ms or queries > self.max_queries
+        if flagged:
+            logger.warning(
+                'Обработчик %s превысил порог: %.1f мс, %s SQL-запросов (%.1f мс в SQL)',
+                name, duration * 1000, queries, sql_duration * 1000
+            )
+        with self._lock:
+            self._summaries.setdefault(name, HandlerSummary()).add(
+                duration, queries, sql_duration, flagged
+            )
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            summaries = self._summaries
+            if reset:
+                self._summaries = {}
+            else:
+                summaries = dict(summaries)
+        return summaries
+
+    def log_summary(self):
+        summaries = self.snapshot(reset=True)
+        if not summaries:
+            return
+        lines = [
+            summary.format(name)
+            for name, summary in sorted(
+                summaries.items(), key=lambda item: item[1].duration, reverse=True
+            )
+        ]
+        logger.info('Сводка по обработчикам:\n%s', '\n'.join(lines))
+
+
+handler_stats = HandlerStats(
+    slow_ms=settings.HANDLER_SLOW_MS,
+    max_queries=settings.HANDLER_MAX_QUERIES,
+)
+
+
+def instrument(callback, name=None):
+    """Оборачивает callback обработчика замером времени и SQL-запросов."""
+    if getattr(callback, 'instrumented', False):
+        return callback
+    name = name or getattr(callback, '__name__', repr(callback))
+
+    @functools.wraps(callback)
+    def wrapper(update, context):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                return callback(update, context)
+        finally:
+            handler_stats.record(name, time.perf_counter() - started, counter.count, counter.duration)
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument_handler(handler):
+    if isinstance(handler, ConversationHandler):
+        nested = [*handler.entry_points, *handler.fallbacks]
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for nested_handler in nested:
+            instrument_handler(nested_handler)
+    elif isinstance(handler, MenuRouter):
+        for label, callback in handler.routes.items():
+            handler.routes[label] = instrument(callback)
+        handler.patterns = [(pattern, instrument(callback)) for pattern, callback in handler.patterns]
+    elif handler.callback is not None:
+        handler.callback = instrument(handler.callback)
+
+
+_reporter = None
+_reporter_lock = threading.Lock()
+
+
+def _report_periodically(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            handler_stats.log_summary()
+        except Exception:
+            logger.exception('Не удалось записать сводку по обработчикам')
+
+
+def instrument_dispatcher(dp):
+    """Оборачивает все обработчики диспетчера и запускает периодическую сводку."""
+    global _reporter
+    for handlers in dp.handlers.values():
+        for handler in handlers:
+            instrument_handler(handler)
+
+    with _reporter_lock:
+        if _reporter is None and settings.HANDLER_STATS_INTERVAL > 0:
+            _reporter = threading.Thread(
+                target=_report_periodically,
+                args=(settings.HANDLER_STATS_INTERVAL,),
+                name='handler-stats',
+                daemon=True,
+            )
+            _reporter.start()
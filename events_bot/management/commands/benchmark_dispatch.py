@@ -0,0 +1,89 @@
+import re
+import time
+import queue
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from telegram import Update
+from telegram.ext import DictPersistence, Dispatcher, ExtBot, Filters, MessageHandler
+
+from events_bot.router import MenuRouter
+from events_bot.telegram_bot import setup_dispatcher
+
+# Текстовые обработчики, которые регистрировались по одному до MenuRouter (с повторами)
+LEGACY_LABELS = [
+    '📅 Мероприятие', '📝 Регистрация', '🙋 Пообщаться', '🎁 Поддержать',
+    '❓ Мои вопросы', '📢 Сделать рассылку', '📜 Программа', '📋 Мои мероприятия',
+    '❓ Задать вопрос спикеру', '🎤 Кто выступает сейчас?', '✅ Подписаться на рассылку',
+    '❌ Отписаться от рассылки', '🔙 Назад', '👤 Зарегистрироваться участником',
+    '🎤 Зарегистрироваться спикером', '🔙 Назад',
+]
+
+SAMPLE_TEXTS = [
+    '📅 Мероприятие', '📜 Программа', '🎤 Кто выступает сейчас?', '🔙 Назад',
+    '❓ Мои вопросы', '🎁 Поддержать', 'просто текст', 'Python-разработчик',
+]
+
+
+def make_update(update_id, text):
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': 1, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text,
+        },
+    }, None)
+
+
+def select_handler(handlers, update):
+    """Поиск обработчика так же, как в Dispatcher.process_update, без вызова callback."""
+    for handler in handlers:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            return handler
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Замеряет стоимость выбора обработчика для одного обновления: цепочка regex против MenuRouter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        updates = [make_update(i, text) for i, text in enumerate(SAMPLE_TEXTS, start=1)]
+
+        legacy = [
+            MessageHandler(Filters.regex(f'^{re.escape(label)}$'), lambda update, context: None)
+            for label in LEGACY_LABELS
+        ]
+        router = MenuRouter()
+        for label in LEGACY_LABELS:
+            router.add_route(label, lambda update, context: None)
+
+        bot = ExtBot(token=settings.TG_BOT_TOKEN)
+        dp = Dispatcher(bot, queue.Queue(), use_context=True, persistence=DictPersistence())
+        setup_dispatcher(dp)
+        full_chain = [handler for group in sorted(dp.handlers) for handler in dp.handlers[group]]
+        # Тот же диспетчер, где вместо MenuRouter стоит прежняя цепочка regex
+        legacy_chain = []
+        for handler in full_chain:
+            legacy_chain.extend(legacy if isinstance(handler, MenuRouter) else [handler])
+
+        for title, handlers in (
+            ('Кнопки меню, цепочка regex (до)', legacy),
+            ('Кнопки меню, MenuRouter (после)', [router]),
+            ('Диспетчер целиком (до)', legacy_chain),
+            ('Диспетчер целиком (после)', full_chain),
+        ):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                for update in updates:
+                    select_handler(handlers, update)
+            elapsed = time.perf_counter() - started
+            per_update = elapsed / (iterations * len(updates)) * 1e6
+            self.stdout.write(f'{title}: {len(handlers)} обработчиков, {per_update:.2f} мкс на обновление')
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from events_bot.exports import FORMATS, export_filename, iter_export
+from events_bot.models import Donation, Participant, Question
+
+MODELS = {
+    'participants': Participant,
+    'questions': Question,
+    'donations': Donation,
+}
+
+
+class Command(BaseCommand):
+    help = 'Выгружает участников, вопросы или донаты в CSV или JSONL без загрузки всей таблицы в память'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=MODELS)
+        parser.add_argument('--format', choices=FORMATS, default='csv', dest='export_format')
+        parser.add_argument(
+            '--output', '-o',
+            help='Файл для выгрузки; "-" — стандартный вывод. По умолчанию <модель>-<дата>.<формат>'
+        )
+        parser.add_argument('--event', type=int, help='Только вопросы и донаты этого мероприятия')
+        parser.add_argument('--chunk-size', type=int, help='Строк на одно чтение из базы')
+
+    def handle(self, *args, **options):
+        model = MODELS[options['model']]
+        export_format = options['export_format']
+        queryset = model.objects.all()
+        if options['event']:
+            if model is Participant:
+                queryset = queryset.filter(registered_events=options['event'])
+            else:
+                queryset = queryset.filter(event_id=options['event'])
+
+        output = options['output'] or export_filename(model, export_format)
+        lines = iter_export(queryset, export_format, options['chunk_size'])
+        if output == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        written = 0
+        with open(output, 'w', encoding='utf-8', newline='') as file:
+            for line in lines:
+                file.write(line)
+                written += 1
+        self.stderr.write(f'Записано строк: {written} → {output}')
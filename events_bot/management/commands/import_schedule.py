@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from events_bot.models import Event
+from events_bot.schedule_import import CSV_COLUMNS, ScheduleImportError, import_schedule, parse_schedule
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует расписание мероприятия из ICS или CSV '
+        f"(колонки: {', '.join(CSV_COLUMNS)}) с проверкой пересечений"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--replace', action='store_true', help='Заменить текущее расписание мероприятия')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл, ничего не записывая')
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.get(pk=options['event_id'])
+        except Event.DoesNotExist:
+            raise CommandError(f"Мероприятие {options['event_id']} не найдено")
+        with open(options['path'], encoding='utf-8-sig') as file:
+            text = file.read()
+
+        try:
+            with transaction.atomic():
+                result = import_schedule(event, parse_schedule(text, event.date), replace=options['replace'])
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        except ScheduleImportError as e:
+            raise CommandError('Расписание не импортировано:\n' + '\n'.join(e.errors))
+
+        prefix = 'Проверка пройдена, было бы импортировано' if options['dry_run'] else 'Импортировано'
+        self.stdout.write(
+            f'{prefix} слотов: {result.slots_created}, новых спикеров: {result.speakers_created}, '
+            f'удалено прежних слотов: {result.slots_deleted}'
+        )
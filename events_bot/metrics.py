@@ -0,0 +1,329 @@
+"""Метрики процесса в текстовом формате Prometheus.
+
+Счётчики и гистограммы обновляются там, где происходят события:
+обработчики бота (instrumentation.py), запросы к Telegram API
+(bot_client.py), рассылки (broadcast.py) и SQL-запросы всех соединений
+(signals.py). Показатели, которые объекты ведут сами — попадания в
+кэши, занятость пулов, — считываются в момент запроса метрик.
+
+Django отдаёт метрики по /metrics/; бот в режиме polling — отдельным
+HTTP-сервером на METRICS_PORT. Без METRICS_TOKEN метрики наружу не
+отдаются: Django отвечает 404, а отдельный сервер слушает только
+loopback.
+"""
+import hmac
+import ipaddress
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        )
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток."""
+
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Пары (суффикс имени, метки, значение) для вывода."""
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in sorted(values):
+            yield '', tuple(zip(self.labelnames, key)), value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{format_labels(labels)} {format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Выставляет значение счётчика, который ведёт сам объект (кэш, пул)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Счётчики по корзинам (последняя — +Inf), сумма и число наблюдений
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        for key, counts, total, count in sorted(values):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                yield '_bucket', labels + (('le', format_value(float(bound))),), cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    """Набор метрик процесса и функций, обновляющих их перед выводом."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Метрика {metric.name} уже зарегистрирована')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception('Не удалось собрать метрики %s', collector)
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+handler_duration = registry.histogram(
+    'bot_handler_duration_seconds', 'Время работы обработчика бота', ['handler']
+)
+handler_queries = registry.counter(
+    'bot_handler_db_queries_total', 'SQL-запросы, сделанные обработчиками бота', ['handler']
+)
+db_queries = registry.counter(
+    'db_queries_total', 'SQL-запросы процесса', ['alias']
+)
+db_query_seconds = registry.counter(
+    'db_query_seconds_total', 'Суммарное время SQL-запросов процесса', ['alias']
+)
+telegram_api_duration = registry.histogram(
+    'telegram_api_request_duration_seconds', 'Время запроса к Telegram Bot API', ['method'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+telegram_api_errors = registry.counter(
+    'telegram_api_errors_total', 'Ошибки запросов к Telegram Bot API', ['method', 'error']
+)
+broadcast_messages = registry.counter(
+    'broadcast_messages_total', 'Сообщения рассылок по результату отправки', ['status']
+)
+broadcasts_running = registry.gauge(
+    'broadcasts_running', 'Рассылки, которые идут сейчас'
+)
+cache_hits = registry.counter(
+    'cache_hits_total', 'Попадания в кэши процесса', ['cache']
+)
+cache_misses = registry.counter(
+    'cache_misses_total', 'Промахи кэшей процесса', ['cache']
+)
+cache_hit_ratio = registry.gauge(
+    'cache_hit_ratio', 'Доля попаданий в кэш с запуска процесса', ['cache']
+)
+handler_pool = registry.gauge(
+    'bot_handler_pool', 'Пул обработчиков: размер, очередь и занятые потоки', ['state']
+)
+telegram_pool = registry.gauge(
+    'telegram_connection_pool', 'Пул соединений с Telegram: размер и занятые соединения', ['state']
+)
+
+
+def observe_query(execute, sql, params, many, context):
+    """execute_wrapper, который считает все SQL-запросы соединения."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        alias = context['connection'].alias
+        db_queries.inc(alias=alias)
+        db_query_seconds.inc(time.perf_counter() - started, alias=alias)
+
+
+def track_queries(connection):
+    if observe_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, observe_query)
+
+
+def collect_runtime_stats():
+    # Импорты здесь: эти модули сами пишут в метрики
+    from events_bot.bot_client import pool_stats
+    from events_bot.cache import active_event_cache, participant_cache
+    from events_bot.handler_pool import handler_pool_stats
+
+    for name, cache in (('participant', participant_cache), ('active_event', active_event_cache)):
+        hits, misses = cache.hits, cache.misses
+        cache_hits.set(hits, cache=name)
+        cache_misses.set(misses, cache=name)
+        cache_hit_ratio.set(hits / (hits + misses) if hits + misses else 0.0, cache=name)
+
+    stats = handler_pool_stats()
+    for state in ('size', 'queued', 'active'):
+        handler_pool.set(stats[state], state=state)
+
+    stats = pool_stats()
+    for state in ('size', 'in_flight', 'peak_in_flight'):
+        telegram_pool.set(stats[state], state=state)
+
+
+registry.add_collector(collect_runtime_stats)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/metrics/'):
+            self.send_error(404)
+            return
+        if self.server.token:
+            token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+            if not hmac.compare_digest(token.encode(), self.server.token.encode()):
+                self.send_error(403)
+                return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('metrics: ' + format, *args)
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def start_metrics_server(port, host='127.0.0.1', token=''):
+    """Отдаёт /metrics из процесса без Django-сервера (бот в режиме polling).
+
+    Без token сервер запускается только на loopback-адресе.
+    """
+    if not token and not is_loopback(host):
+        logger.error('Метрики на %s не запущены: без METRICS_TOKEN доступен только loopback', host)
+        return None
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.token = token
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info('Метрики доступны на http://%s:%s/metrics', host, port)
+    return server
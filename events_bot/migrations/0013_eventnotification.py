@@ -0,0 +1,32 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events_bot', '0012_rename_notified_about_newcommers_participant_notified_about_newcomers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает отправки'), ('sent', 'Отправлено'), ('failed', 'Ошибка'), ('blocked', 'Бот заблокирован')], default='pending', max_length=10, verbose_name='Статус')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Отправлено')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='events_bot.event', verbose_name='Мероприятие')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='events_bot.participant', verbose_name='Участник')),
+            ],
+            options={
+                'verbose_name': 'Уведомление о мероприятии',
+                'verbose_name_plural': 'Уведомления о мероприятиях',
+                'indexes': [models.Index(fields=['status', 'event'], name='events_bot__status_8bc160_idx')],
+                'unique_together': {('event', 'participant')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events_bot', '0013_eventnotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileView',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now_add=True, verbose_name='Время просмотра')),
+                ('viewed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='viewed_by', to='events_bot.participant', verbose_name='Чья анкета')),
+                ('viewer', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='profile_views', to='events_bot.participant', verbose_name='Кто смотрел')),
+            ],
+            options={
+                'verbose_name': 'Просмотр анкеты',
+                'verbose_name_plural': 'Просмотры анкет',
+                'unique_together': {('viewer', 'viewed')},
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Полнотекстовый индекс FTS5 по имени и описанию участников.
+
+    Таблица хранит только индекс (external content), строки читаются из
+    events_bot_participant. Триггеры поддерживают индекс при любом
+    изменении участника — из бота, админки или shell.
+    """
+
+    dependencies = [
+        ('events_bot', '0014_profileview'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE VIRTUAL TABLE events_bot_participant_fts USING fts5(
+                    name, bio,
+                    content='events_bot_participant',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+                """,
+                """
+                CREATE TRIGGER events_bot_participant_fts_ai
+                AFTER INSERT ON events_bot_participant BEGIN
+                    INSERT INTO events_bot_participant_fts(rowid, name, bio)
+                    VALUES (new.id, new.name, new.bio);
+                END
+                """,
+                """
+                CREATE TRIGGER events_bot_participant_fts_ad
+                AFTER DELETE ON events_bot_participant BEGIN
+                    INSERT INTO events_bot_participant_fts(events_bot_participant_fts, rowid, name, bio)
+                    VALUES ('delete', old.id, old.name, old.bio);
+                END
+                """,
+                """
+                CREATE TRIGGER events_bot_participant_fts_au
+                AFTER UPDATE OF name, bio ON events_bot_participant BEGIN
+                    INSERT INTO events_bot_participant_fts(events_bot_participant_fts, rowid, name, bio)
+                    VALUES ('delete', old.id, old.name, old.bio);
+                    INSERT INTO events_bot_participant_fts(rowid, name, bio)
+                    VALUES (new.id, new.name, new.bio);
+                END
+                """,
+                "INSERT INTO events_bot_participant_fts(events_bot_participant_fts) VALUES ('rebuild')",
+            ],
+            reverse_sql=[
+                'DROP TRIGGER IF EXISTS events_bot_participant_fts_au',
+                'DROP TRIGGER IF EXISTS events_bot_participant_fts_ad',
+                'DROP TRIGGER IF EXISTS events_bot_participant_fts_ai',
+                'DROP TABLE IF EXISTS events_bot_participant_fts',
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:18
+
+from django.db import migrations, models
+
+
+def fill_profiles_count(apps, schema_editor):
+    Participant = apps.get_model('events_bot', 'Participant')
+    NetworkingStats = apps.get_model('events_bot', 'NetworkingStats')
+    profiles_count = Participant.objects.filter(bio__isnull=False).exclude(bio='').count()
+    NetworkingStats.objects.update_or_create(pk=1, defaults={'profiles_count': profiles_count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events_bot', '0015_participant_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetworkingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profiles_count', models.PositiveIntegerField(default=0, verbose_name='Заполненных анкет')),
+            ],
+            options={
+                'verbose_name': 'Статистика знакомств',
+                'verbose_name_plural': 'Статистика знакомств',
+            },
+        ),
+        migrations.RunPython(fill_profiles_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events_bot', '0016_networkingstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserData',
+            fields=[
+                ('user_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='Telegram ID')),
+                ('data', models.BinaryField(verbose_name='Данные')),
+            ],
+            options={
+                'verbose_name': 'Данные пользователя бота',
+                'verbose_name_plural': 'Данные пользователей бота',
+            },
+        ),
+        migrations.CreateModel(
+            name='ConversationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, verbose_name='Диалог')),
+                ('key', models.CharField(max_length=64, verbose_name='Ключ')),
+                ('state', models.IntegerField(blank=True, null=True, verbose_name='Состояние')),
+            ],
+            options={
+                'verbose_name': 'Состояние диалога',
+                'verbose_name_plural': 'Состояния диалогов',
+                'unique_together': {('name', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events_bot', '0017_conversationstate_userdata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donation',
+            index=models.Index(fields=['timestamp'], name='events_bot__timesta_54fe5f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['timestamp'], name='events_bot__timesta_15a722_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events_bot', '0018_question_donation_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeslot',
+            name='room',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Зал'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events_bot', '0020_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventnotification',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Взято в отправку'),
+        ),
+        migrations.AlterField(
+            model_name='eventnotification',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает отправки'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Ошибка'), ('blocked', 'Бот заблокирован')], default='pending', max_length=10, verbose_name='Статус'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.20 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events_bot', '0021_eventnotification_claimed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersistenceLease',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Имя')),
+                ('owner', models.CharField(max_length=128, verbose_name='Процесс')),
+                ('expires_at', models.DateTimeField(verbose_name='Действует до')),
+            ],
+            options={
+                'verbose_name': 'Владелец состояний бота',
+                'verbose_name_plural': 'Владельцы состояний бота',
+            },
+        ),
+    ]
@@ -1,28 +1,36 @@
-from django.db import models
+from contextlib import nullcontext
+
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
 
 
+def format_program(time_slots):
+    """Текст программы по слотам, упорядоченным по времени начала."""
+    program = []
+    for slot in time_slots:
+        start_local = timezone.localtime(slot.start_time)
+        end_local = timezone.localtime(slot.end_time)
+        program.append(
+            f"{start_local.strftime('%H:%M')} - {end_local.strftime('%H:%M')}: "
+            f"{slot.title} ({slot.speaker.name})"
+        )
+    return "\n".join(program) if program else "Программа пока не доступна."
+
+
 class Event(models.Model):
     title = models.CharField(max_length=255, verbose_name="Название мероприятия")
     description = models.TextField(verbose_name="Описание")
     date = models.DateField(auto_now_add=False, verbose_name="Дата проведения")
     is_active = models.BooleanField(default=True, verbose_name="Активно")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
 
     def __str__(self):
         return self.title
 
     def get_program(self):
         """Формирует программу мероприятия из слотов времени."""
-        time_slots = self.time_slots.select_related('speaker').all()
-        program = []
-        for slot in time_slots:
-            start_local = timezone.localtime(slot.start_time)
-            end_local = timezone.localtime(slot.end_time)
-            program.append(
-                f"{start_local.strftime('%H:%M')} - {end_local.strftime('%H:%M')}: "
-                f"{slot.title} ({slot.speaker.name})"
-            )
-        return "\n".join(program) if program else "Программа пока не доступна."
+        return format_program(self.time_slots.select_related('speaker').all())
 
     def get_current_speaker(self):
         if not self.is_active:
@@ -106,11 +114,13 @@ class TimeSlot(models.Model):
     end_time = models.DateTimeField(verbose_name="Время окончания")
     title = models.CharField(max_length=255, verbose_name="Название доклада")
     description = models.TextField(blank=True, verbose_name="Описание доклада")
+    room = models.CharField(max_length=100, blank=True, verbose_name="Зал")
     is_extended = models.BooleanField(
         default=False,
         verbose_name="Выступление продлено",
         help_text="Если отмечено, спикер будет считаться текущим вне зависимости от расписания"
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
 
     class Meta:
         ordering = ['start_time']
@@ -167,13 +177,53 @@ class Participant(models.Model):
         verbose_name='Зарегистрированные мероприятия'
     )
 
-    def save(self, *args, **kwargs):
-        is_new = self._state.adding
-        super().save(*args, **kwargs)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Для отложенного поля (.only(), .defer()) сохранённое значение неизвестно
+        if 'bio' in instance.__dict__:
+            instance._saved_bio = instance.bio
+        return instance
+
+    def _profile_delta(self, update_fields):
+        """На сколько сохранение изменит счётчик анкет: -1, 0 или 1."""
+        if update_fields is not None and 'bio' not in update_fields:
+            return 0
+        if self._state.adding:
+            saved_bio = None
+        elif hasattr(self, '_saved_bio'):
+            saved_bio = self._saved_bio
+        elif 'bio' not in self.__dict__:
+            # bio не загружали и не меняли, Django его не запишет
+            return 0
+        else:
+            saved_bio = Participant.objects.filter(pk=self.pk).values_list('bio', flat=True).first()
+        return bool(self.bio) - bool(saved_bio)
 
-        if is_new and self.bio:
-            from events_bot.telegram_bot import check_for_newcomers
-            check_for_newcomers()
+    def save(self, *args, **kwargs):
+        from events_bot.cache import participant_cache
+        from events_bot.networking import on_profile_added
+
+        # Счётчик анкет меняется, только когда анкета появилась или исчезла
+        update_fields = kwargs.get('update_fields')
+        delta = self._profile_delta(update_fields)
+        profiles_count = None
+        with transaction.atomic() if delta else nullcontext():
+            if delta:
+                profiles_count = NetworkingStats.change_profiles_count(delta)
+                if delta > 0:
+                    self.is_first_in_networking = profiles_count == 1
+                    if kwargs.get('update_fields') is not None:
+                        kwargs['update_fields'] = {*kwargs['update_fields'], 'is_first_in_networking'}
+            super().save(*args, **kwargs)
+        if 'bio' in self.__dict__ and (update_fields is None or 'bio' in update_fields):
+            self._saved_bio = self.bio
+        telegram_id = self.telegram_id
+        transaction.on_commit(lambda: participant_cache.invalidate(telegram_id))
+
+        if delta > 0:
+            # Уведомление уходит только после коммита анкеты, которая дошла до порога
+            transaction.on_commit(lambda: on_profile_added(profiles_count))
 
     @property
     def has_profile(self):
@@ -188,6 +238,60 @@ class Participant(models.Model):
         verbose_name_plural = "Участники"
 
 
+class NetworkingStats(models.Model):
+    """Единственная строка со счётчиком заполненных анкет.
+
+    Счётчик меняется атомарным UPDATE, поэтому сохранение анкеты не
+    требует COUNT по таблице участников.
+    """
+    profiles_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Заполненных анкет'
+    )
+
+    @classmethod
+    def change_profiles_count(cls, delta):
+        """Изменяет счётчик на delta и возвращает новое значение."""
+        with transaction.atomic():
+            updated = cls.objects.filter(pk=1).update(profiles_count=F('profiles_count') + delta)
+            if not updated:
+                cls.objects.create(pk=1, profiles_count=max(delta, 0))
+            return cls.objects.values_list('profiles_count', flat=True).get(pk=1)
+
+    def __str__(self):
+        return f"Заполненных анкет: {self.profiles_count}"
+
+    class Meta:
+        verbose_name = "Статистика знакомств"
+        verbose_name_plural = "Статистика знакомств"
+
+
+class ProfileView(models.Model):
+    viewer = models.ForeignKey(
+        Participant,
+        on_delete=models.CASCADE,
+        related_name='profile_views',
+        # Покрывается составным уникальным индексом (viewer, viewed)
+        db_index=False,
+        verbose_name="Кто смотрел"
+    )
+    viewed = models.ForeignKey(
+        Participant,
+        on_delete=models.CASCADE,
+        related_name='viewed_by',
+        verbose_name="Чья анкета"
+    )
+    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="Время просмотра")
+
+    class Meta:
+        unique_together = [['viewer', 'viewed']]
+        verbose_name = "Просмотр анкеты"
+        verbose_name_plural = "Просмотры анкет"
+
+    def __str__(self):
+        return f"{self.viewer.name} смотрел(а) анкету {self.viewed.name}"
+
+
 class Question(models.Model):
     event = models.ForeignKey(
         Event,
@@ -213,6 +317,9 @@ class Question(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp']),
+        ]
         verbose_name = "Вопрос"
         verbose_name_plural = "Вопросы"
 
@@ -253,6 +360,9 @@ class Donation(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp']),
+        ]
         verbose_name = "Донат"
         verbose_name_plural = "Донаты"
 
@@ -285,3 +395,94 @@ class ConnectionRequest(models.Model):
 
     def __str__(self):
         return f"Запрос на знакомство от {self.participant.name} к {self.target_participant.name}"
+
+
+class EventNotification(models.Model):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    BLOCKED = 'blocked'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает отправки'),
+        (SENDING, 'Отправляется'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Ошибка'),
+        (BLOCKED, 'Бот заблокирован'),
+    ]
+
+    event = models.ForeignKey(
+        Event,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name="Мероприятие"
+    )
+    participant = models.ForeignKey(
+        Participant,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name="Участник"
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name="Статус"
+    )
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    claimed_at = models.DateTimeField(blank=True, null=True, verbose_name="Взято в отправку")
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name="Отправлено")
+
+    class Meta:
+        unique_together = [['event', 'participant']]
+        indexes = [
+            models.Index(fields=['status', 'event']),
+        ]
+        verbose_name = "Уведомление о мероприятии"
+        verbose_name_plural = "Уведомления о мероприятиях"
+
+    def __str__(self):
+        return f"{self.event} → {self.participant} ({self.get_status_display()})"
+
+
+class ConversationState(models.Model):
+    """Состояние ConversationHandler для одного ключа (чат, пользователь)."""
+    name = models.CharField(max_length=64, verbose_name="Диалог")
+    key = models.CharField(max_length=64, verbose_name="Ключ")
+    state = models.IntegerField(blank=True, null=True, verbose_name="Состояние")
+
+    def __str__(self):
+        return f"{self.name} {self.key}: {self.state}"
+
+    class Meta:
+        verbose_name = "Состояние диалога"
+        verbose_name_plural = "Состояния диалогов"
+        unique_together = [['name', 'key']]
+
+
+class UserData(models.Model):
+    """Сериализованный context.user_data пользователя Telegram."""
+    user_id = models.BigIntegerField(primary_key=True, verbose_name="Telegram ID")
+    data = models.BinaryField(verbose_name="Данные")
+
+    def __str__(self):
+        return f"user_data {self.user_id}"
+
+    class Meta:
+        verbose_name = "Данные пользователя бота"
+        verbose_name_plural = "Данные пользователей бота"
+
+
+class PersistenceLease(models.Model):
+    """Процесс бота, который сейчас ведёт состояния диалогов и user_data."""
+    name = models.CharField(max_length=64, primary_key=True, verbose_name="Имя")
+    owner = models.CharField(max_length=128, verbose_name="Процесс")
+    expires_at = models.DateTimeField(verbose_name="Действует до")
+
+    def __str__(self):
+        return f"{self.name}: {self.owner}"
+
+    class Meta:
+        verbose_name = "Владелец состояний бота"
+        verbose_name_plural = "Владельцы состояний бота"
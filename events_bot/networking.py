@@ -0,0 +1,47 @@
+"""Уведомление первого участника знакомств о появлении новых анкет."""
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from events_bot.background import run_in_background
+from events_bot.bot_client import get_bot
+from events_bot.models import Participant
+
+logger = logging.getLogger(__name__)
+
+# Сколько анкет должно появиться после первой, чтобы позвать первого участника
+NEWCOMERS_THRESHOLD = 5
+
+
+def on_profile_added(profiles_count):
+    """Вызывается после коммита новой анкеты с новым значением счётчика.
+
+    Порог проверяется по счётчику в памяти: ровно одно сохранение
+    получает значение, равное порогу, и только оно ставит уведомление
+    в фоновую очередь.
+    """
+    if profiles_count == NEWCOMERS_THRESHOLD + 1:
+        run_in_background(notify_about_newcomers)
+
+
+def notify_about_newcomers():
+    """Сообщает первому участнику знакомств, что появились новые анкеты."""
+    first_user = Participant.objects.filter(
+        is_first_in_networking=True, notified_about_newcomers=False
+    ).first()
+    if not first_user:
+        return
+
+    try:
+        get_bot().send_message(
+            chat_id=first_user.telegram_id,
+            text=f"🎉 Теперь есть {NEWCOMERS_THRESHOLD} новых участников! Пришло время познакомиться.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("👀 Посмотреть анкеты", callback_data="view_profiles")]
+            ])
+        )
+    except Exception:
+        logger.exception('Не удалось уведомить первого участника о новых анкетах')
+        return
+
+    Participant.objects.filter(pk=first_user.pk).update(notified_about_newcomers=True)
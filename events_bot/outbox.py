@@ -0,0 +1,143 @@
+"""Outbox уведомлений о новых мероприятиях.
+
+На каждого подписчика заводится строка EventNotification в статусе
+pending. Воркер забирает их порциями (статус sending), отправляет и
+сразу фиксирует результат, поэтому после перезапуска доставка
+продолжается с того места, где остановилась: уже отправленные не
+дублируются, оставшиеся не теряются. Несколько воркеров одновременно
+не отправят одно уведомление дважды.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from events_bot.bot_client import get_bot
+from events_bot.broadcast import Broadcast
+from events_bot.models import Event, EventNotification, Participant
+
+logger = logging.getLogger(__name__)
+
+
+def format_event_notification(event):
+    return (
+        f"🎉 <b>Новое мероприятие анонсировано!</b>\n\n"
+        f"📅 <b>{event.title}</b>\n"
+        f"🕒 Дата: {event.date.strftime('%d.%m.%Y')}\n"
+        f"📜 Программа:\n{event.get_program()}\n\n"
+        f"<i>Зарегистрируйтесь или задайте вопросы спикерам через бота!</i>"
+    )
+
+
+def enqueue_event_notification(event):
+    """Ставит в очередь уведомление о мероприятии всем подписчикам.
+
+    Повторный вызов безопасен: уже существующие строки не трогаются.
+    """
+    chunk_size = settings.TG_BROADCAST_CHUNK_SIZE
+    subscriber_ids = Participant.objects.filter(
+        is_subscribed=True
+    ).order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+
+    batch = []
+    for participant_id in subscriber_ids:
+        batch.append(EventNotification(event=event, participant_id=participant_id))
+        if len(batch) >= chunk_size:
+            EventNotification.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        EventNotification.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def claim_batch(event=None, batch_size=None):
+    """Забирает в отправку порцию ожидающих уведомлений.
+
+    Строки переводятся в статус sending одним UPDATE с условием на
+    статус, поэтому одну строку забирает только один воркер, даже если
+    outbox разбирают несколько процессов сразу. Строки, застрявшие в
+    sending дольше TG_OUTBOX_LEASE секунд, забираются заново.
+    Возвращает список (pk, event_id, telegram_id) забранных строк.
+    """
+    batch_size = batch_size or settings.TG_OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    available = EventNotification.objects.filter(
+        Q(status=EventNotification.PENDING)
+        | Q(
+            status=EventNotification.SENDING,
+            claimed_at__lt=now - timedelta(seconds=settings.TG_OUTBOX_LEASE)
+        )
+    )
+    if event is not None:
+        available = available.filter(event=event)
+
+    while True:
+        candidates = list(available.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not candidates:
+            return []
+        claimed = available.filter(pk__in=candidates).update(
+            status=EventNotification.SENDING, claimed_at=now
+        )
+        if claimed:
+            return list(
+                EventNotification.objects.filter(
+                    pk__in=candidates, status=EventNotification.SENDING, claimed_at=now
+                ).order_by('pk').values_list('pk', 'event_id', 'participant__telegram_id')
+            )
+        # Всю порцию успел забрать другой воркер, берём следующую
+
+
+def deliver_pending_notifications(bot, event=None, batch_size=None):
+    """Отправляет все ожидающие уведомления; возвращает число доставленных.
+
+    Порции забираются claim_batch, результат каждой сохраняется одним
+    bulk_update. При падении процесса недоставленными остаются не больше
+    одной порции, их заберёт следующий запуск после TG_OUTBOX_LEASE.
+    """
+    broadcasts = {}
+    sent_count = 0
+    while True:
+        rows = claim_batch(event, batch_size)
+        if not rows:
+            break
+
+        by_event = {}
+        for pk, event_id, chat_id in rows:
+            by_event.setdefault(event_id, []).append((pk, chat_id))
+
+        now = timezone.now()
+        updated = []
+        for event_id, items in by_event.items():
+            if event_id not in broadcasts:
+                text = format_event_notification(Event.objects.get(pk=event_id))
+                broadcasts[event_id] = Broadcast(bot, text)
+            results = broadcasts[event_id].send_batch(
+                [chat_id for _, chat_id in items]
+            )
+            for pk, chat_id in items:
+                status, error = results[chat_id]
+                updated.append(EventNotification(
+                    pk=pk,
+                    status=status,
+                    error=error,
+                    sent_at=now if status == EventNotification.SENT else None
+                ))
+                if status == EventNotification.SENT:
+                    sent_count += 1
+
+        EventNotification.objects.bulk_update(
+            updated, ['status', 'error', 'sent_at']
+        )
+
+    logger.info('Доставлено уведомлений о мероприятиях: %s', sent_count)
+    return sent_count
+
+
+def notify_about_event(event_id):
+    """Ставит в очередь и рассылает уведомление о мероприятии общим клиентом бота."""
+    event = Event.objects.filter(pk=event_id).first()
+    if event is None:
+        return 0
+    enqueue_event_notification(event)
+    return deliver_pending_notifications(get_bot(), event)
@@ -0,0 +1,267 @@
+"""Хранение состояний диалогов и user_data бота в базе Django.
+
+Диспетчер сообщает об изменениях после каждого обновления, но в базу
+они попадают не сразу: изменённые записи копятся в буфере и раз в
+TG_PERSISTENCE_FLUSH_INTERVAL секунд пишутся пачкой через bulk_update
+(новые — через bulk_create). При остановке бота буфер сбрасывается
+целиком.
+
+Из-за буфера состояния может вести только один процесс: он держит
+аренду PersistenceLease и продлевает её при каждом сбросе. Процесс
+берёт аренду методом acquire() до того, как соберёт диспетчер и
+загрузит состояния; acquire() ждёт, пока аренду не отпустят или она не
+истечёт (например, после падения прошлого процесса). Если аренду
+перехватили, пока процесс стоял, его буфер отбрасывается.
+"""
+import json
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from telegram.ext import BasePersistence
+
+from events_bot.models import ConversationState, PersistenceLease, UserData
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'bot'
+# Пауза между попытками взять аренду, секунды: от первой до последней, удваиваясь
+LEASE_RETRY_DELAY = (0.1, 5.0)
+
+
+class PersistenceLocked(Exception):
+    """Состояния бота ведёт другой процесс."""
+
+
+def dump_data(data):
+    return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def dump_key(key):
+    return json.dumps(key, separators=(',', ':'))
+
+
+class DjangoPersistence(BasePersistence):
+    """Persistence для диспетчера с отложенной пакетной записью."""
+
+    def __init__(self, flush_interval=None, batch_size=500, lease_ttl=None):
+        super().__init__(store_user_data=True, store_chat_data=False, store_bot_data=False)
+        self.flush_interval = flush_interval or settings.TG_PERSISTENCE_FLUSH_INTERVAL
+        self.batch_size = batch_size
+        self.lease_ttl = lease_ttl or settings.TG_PERSISTENCE_LEASE
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._lease_held = False
+        self._user_data = None
+        self._conversations = {}
+        # Что уже лежит в базе: хэш сериализованных user_data и (pk, состояние) диалогов
+        self._stored_user_data = {}
+        self._stored_states = {}
+        self._dirty_user_data = {}
+        self._dirty_states = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._timer = None
+
+    def get_user_data(self):
+        if self._user_data is None:
+            self._user_data = defaultdict(dict)
+            for user_id, data in UserData.objects.values_list('user_id', 'data').iterator(chunk_size=2000):
+                data = bytes(data)
+                self._user_data[user_id] = pickle.loads(data)
+                self._stored_user_data[user_id] = hash(data)
+            self._start_timer()
+        return self._user_data
+
+    def get_chat_data(self):
+        return defaultdict(dict)
+
+    def get_bot_data(self):
+        return {}
+
+    def get_conversations(self, name):
+        if name not in self._conversations:
+            conversations = {}
+            for pk, key, state in ConversationState.objects.filter(name=name).values_list('pk', 'key', 'state'):
+                key = tuple(json.loads(key))
+                self._stored_states[(name, key)] = (pk, state)
+                if state is not None:
+                    conversations[key] = state
+            self._conversations[name] = conversations
+            self._start_timer()
+        return self._conversations[name]
+
+    def update_conversation(self, name, key, new_state):
+        # Словарь диалогов ConversationHandler уже обновил сам, здесь только буфер записи
+        stored = self._stored_states.get((name, key))
+        with self._lock:
+            if stored is not None and stored[1] == new_state:
+                self._dirty_states.pop((name, key), None)
+            else:
+                self._dirty_states[(name, key)] = new_state
+
+    def update_user_data(self, user_id, data):
+        # Вызывается после каждого обновления; пишем, только если данные изменились
+        serialized = dump_data(data)
+        if self._stored_user_data.get(user_id) == hash(serialized):
+            with self._lock:
+                self._dirty_user_data.pop(user_id, None)
+            return
+        with self._lock:
+            self._dirty_user_data[user_id] = serialized
+
+    def update_chat_data(self, chat_id, data):
+        pass
+
+    def update_bot_data(self, data):
+        pass
+
+    def flush(self):
+        """Продлевает аренду и записывает накопленные изменения в базу."""
+        if not self._lease_held:
+            with self._lock:
+                if not self._dirty_user_data and not self._dirty_states:
+                    return
+            # Аренду не брали заранее: пробуем сейчас, буфер остаётся до следующей попытки
+            self.acquire(timeout=0)
+        with self._flush_lock:
+            with self._lock:
+                dirty_user_data, self._dirty_user_data = self._dirty_user_data, {}
+                dirty_states, self._dirty_states = self._dirty_states, {}
+            try:
+                with transaction.atomic():
+                    self._renew_lease()
+                    self._write_user_data(dirty_user_data)
+                    self._write_states(dirty_states)
+            except PersistenceLocked:
+                # Данные уже ведёт другой процесс, наш буфер устарел
+                logger.error(
+                    'Аренда состояний бота потеряна, не сохранено: user_data %s, диалогов %s',
+                    len(dirty_user_data), len(dirty_states)
+                )
+                raise
+            except Exception:
+                # Возвращаем несохранённое в буфер, если его не перезаписали более свежие данные
+                with self._lock:
+                    self._dirty_user_data = {**dirty_user_data, **self._dirty_user_data}
+                    self._dirty_states = {**dirty_states, **self._dirty_states}
+                raise
+
+    def stop(self):
+        self._stopped.set()
+        try:
+            self.flush()
+        except PersistenceLocked as e:
+            logger.error('Состояния бота не сохранены при остановке: %s', e)
+        finally:
+            self._release_lease()
+
+    def acquire(self, timeout=None):
+        """Берёт аренду состояний, дожидаясь её освобождения или истечения.
+
+        timeout — сколько секунд ждать (None — без ограничения, 0 — одна
+        попытка); по его истечении бросает PersistenceLocked.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay, max_delay = LEASE_RETRY_DELAY
+        logged = False
+        while True:
+            owner = self._try_acquire()
+            if owner is None:
+                if logged:
+                    logger.info('Аренда состояний бота получена')
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                raise PersistenceLocked(f'Состояния бота ведёт процесс {owner}')
+            if not logged:
+                logger.info('Состояния бота ведёт процесс %s, ждём аренду', owner)
+                logged = True
+            pause = delay if deadline is None else min(delay, max(deadline - time.monotonic(), 0))
+            time.sleep(pause)
+            delay = min(delay * 2, max_delay)
+
+    def _try_acquire(self):
+        """Одна попытка взять аренду; возвращает None или текущего владельца."""
+        if self._lease_held:
+            return None
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.lease_ttl)
+        with transaction.atomic():
+            PersistenceLease.objects.get_or_create(
+                name=LEASE_NAME, defaults={'owner': self.owner, 'expires_at': expires_at}
+            )
+            taken = PersistenceLease.objects.filter(
+                Q(owner=self.owner) | Q(expires_at__lt=now), name=LEASE_NAME
+            ).update(owner=self.owner, expires_at=expires_at)
+        if not taken:
+            return PersistenceLease.objects.filter(name=LEASE_NAME).values_list('owner', flat=True).first()
+        self._lease_held = True
+        return None
+
+    def _renew_lease(self):
+        renewed = PersistenceLease.objects.filter(name=LEASE_NAME, owner=self.owner).update(
+            expires_at=timezone.now() + timedelta(seconds=self.lease_ttl)
+        )
+        if not renewed:
+            self._lease_held = False
+            raise PersistenceLocked('Аренду состояний бота перехватил другой процесс')
+
+    def _release_lease(self):
+        if self._lease_held:
+            PersistenceLease.objects.filter(name=LEASE_NAME, owner=self.owner).update(expires_at=timezone.now())
+            self._lease_held = False
+
+    def _write_user_data(self, dirty):
+        if not dirty:
+            return
+        existing, new = [], []
+        for user_id, serialized in dirty.items():
+            row = UserData(user_id=user_id, data=serialized)
+            (existing if user_id in self._stored_user_data else new).append(row)
+        UserData.objects.bulk_update(existing, ['data'], batch_size=self.batch_size)
+        UserData.objects.bulk_create(
+            new, batch_size=self.batch_size,
+            update_conflicts=True, unique_fields=['user_id'], update_fields=['data']
+        )
+        for user_id, serialized in dirty.items():
+            self._stored_user_data[user_id] = hash(serialized)
+
+    def _write_states(self, dirty):
+        if not dirty:
+            return
+        existing, new = [], []
+        for (name, key), state in dirty.items():
+            stored = self._stored_states.get((name, key))
+            if stored is None:
+                new.append(ConversationState(name=name, key=dump_key(key), state=state))
+            else:
+                existing.append(ConversationState(pk=stored[0], state=state))
+                self._stored_states[(name, key)] = (stored[0], state)
+        ConversationState.objects.bulk_update(existing, ['state'], batch_size=self.batch_size)
+        for row in ConversationState.objects.bulk_create(new, batch_size=self.batch_size):
+            self._stored_states[(row.name, tuple(json.loads(row.key)))] = (row.pk, row.state)
+
+    def _start_timer(self):
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._run_timer, name='persistence-flush', daemon=True)
+            self._timer.start()
+
+    def _run_timer(self):
+        while not self._stopped.wait(self.flush_interval):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось сохранить состояние бота')
+            finally:
+                close_old_connections()
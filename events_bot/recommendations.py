@@ -0,0 +1,276 @@
+"""Рекомендации анкет для знакомств по сходству описаний (TF-IDF).
+
+Описания участников превращаются в TF-IDF матрицу NumPy с
+L2-нормированными строками, поэтому косинусное сходство — это просто
+скалярное произведение. Для каждой анкеты заранее считаются top-k
+похожих, блоками строк, чтобы не держать в памяти матрицу N×N.
+
+Полная перестройка, добавление и изменение анкет выполняются в фоновом
+потоке; обработчики только читают готовый результат. Анкеты, пришедшие
+во время перестройки, запоминаются и применяются к новому индексу
+сразу после подмены: перестройка могла прочитать базу раньше них. Под матрицу и top-k
+память выделяется с запасом и растёт удвоением, поэтому новая анкета
+стоит O(N·F) на подсчёт сходства, без копирования всей матрицы.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+
+from events_bot.background import run_in_background
+from events_bot.models import Participant
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+BLOCK_SIZE = 512
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) > 1]
+
+
+def grow(array, capacity, fill):
+    """Копия массива с capacity строками; новые строки заполнены fill."""
+    grown = np.full((capacity, *array.shape[1:]), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class ProfileIndex:
+    """Словарь, IDF и матрица документов.
+
+    Словарь и IDF не меняются до перестройки; строки матрицы хранятся в
+    буфере с запасом, занято первых size строк.
+    """
+
+    def __init__(self, ids, documents, max_features):
+        doc_freq = Counter()
+        for tokens in documents:
+            doc_freq.update(set(tokens))
+        terms = [term for term, _ in doc_freq.most_common(max_features)]
+        self.vocabulary = {term: col for col, term in enumerate(terms)}
+        n_docs = len(documents)
+        self.idf = np.array(
+            [np.log((1 + n_docs) / (1 + doc_freq[term])) + 1 for term in terms],
+            dtype=np.float32
+        )
+        self.size = len(ids)
+        self._ids = np.array(ids, dtype=np.int64)
+        self._matrix = np.zeros((len(ids), len(terms)), dtype=np.float32)
+        for row, tokens in enumerate(documents):
+            self._matrix[row] = self.vectorize(tokens)
+
+    @property
+    def ids(self):
+        return self._ids[:self.size]
+
+    @property
+    def matrix(self):
+        return self._matrix[:self.size]
+
+    @property
+    def capacity(self):
+        return len(self._ids)
+
+    def append(self, participant_id, vector):
+        """Добавляет строку и возвращает её номер."""
+        if self.size == self.capacity:
+            capacity = max(2 * self.capacity, 16)
+            self._ids = grow(self._ids, capacity, 0)
+            self._matrix = grow(self._matrix, capacity, 0)
+        row = self.size
+        self._ids[row] = participant_id
+        self._matrix[row] = vector
+        self.size += 1
+        return row
+
+    def vectorize(self, tokens):
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for token in tokens:
+            col = self.vocabulary.get(token)
+            if col is not None:
+                vector[col] += 1
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class Recommender:
+    """Top-k похожих анкет для каждого участника."""
+
+    def __init__(self, top_k, max_features, refresh_interval):
+        self.top_k = top_k
+        self.max_features = max_features
+        self.refresh_interval = refresh_interval
+        self._index = None
+        self._top_idx = None
+        self._top_sim = None
+        self._row_of = {}
+        self._built_at = 0.0
+        self._building = False
+        # Анкеты, добавленные во время перестройки: participant_id → токены
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def recommend(self, participant_id):
+        """Id рекомендованных анкет по убыванию сходства.
+
+        Пока индекс не построен, возвращает пустой список и запускает
+        построение в фоне.
+        """
+        self._schedule_refresh_if_stale()
+        with self._lock:
+            row = self._row_of.get(participant_id)
+            if row is None:
+                return []
+            ids = self._index.ids
+            return [
+                int(ids[col])
+                for col, sim in zip(self._top_idx[row], self._top_sim[row])
+                if col >= 0 and sim > 0
+            ]
+
+    def refresh(self):
+        """Полностью перестраивает индекс по всем анкетам."""
+        try:
+            rows = Participant.objects.filter(
+                bio__isnull=False
+            ).exclude(bio='').order_by('pk').values_list('pk', 'bio')
+            ids, documents = [], []
+            for pk, bio in rows.iterator(chunk_size=2000):
+                ids.append(pk)
+                documents.append(tokenize(bio))
+            self.build(ids, documents)
+            logger.info('Индекс рекомендаций перестроен: %s анкет', len(ids))
+        finally:
+            with self._lock:
+                self._building = False
+                self._pending.clear()
+
+    def build(self, ids, documents):
+        """Строит индекс по готовым токенам анкет и подменяет текущий."""
+        index = ProfileIndex(ids, documents, self.max_features)
+        top_idx, top_sim = self._top_k_rows(index.matrix, np.arange(index.size))
+        with self._lock:
+            self._index = index
+            self._top_idx = top_idx
+            self._top_sim = top_sim
+            self._row_of = {pk: row for row, pk in enumerate(ids)}
+            self._built_at = time.monotonic()
+            # Новый индекс мог не увидеть анкеты, пришедшие во время перестройки
+            pending, self._pending = self._pending, {}
+            for participant_id, tokens in pending.items():
+                self._apply(participant_id, tokens)
+
+    def add_profile(self, participant_id, bio):
+        """Добавляет новую или обновляет изменённую анкету без полной перестройки.
+
+        Словарь и IDF остаются прежними до следующей перестройки.
+        """
+        tokens = tokenize(bio)
+        with self._lock:
+            if self._building:
+                self._pending[participant_id] = tokens
+            if self._index is not None:
+                self._apply(participant_id, tokens)
+                return
+        self._schedule_refresh(force=True)
+
+    def _apply(self, participant_id, tokens):
+        # Вызывается под self._lock
+        index = self._index
+        vector = index.vectorize(tokens)
+        row = self._row_of.get(participant_id)
+        if row is None:
+            self._append_row(index, participant_id, vector)
+        else:
+            self._update_row(index, row, vector)
+
+    def _append_row(self, index, participant_id, vector):
+        sims = index.matrix @ vector
+        new_row = index.append(participant_id, vector)
+        if index.capacity > len(self._top_idx):
+            self._top_idx = grow(self._top_idx, index.capacity, -1)
+            self._top_sim = grow(self._top_sim, index.capacity, -np.inf)
+
+        # Новая анкета может вытеснить последний элемент чужих top-k
+        for row in np.nonzero(sims > self._top_sim[:new_row, -1])[0]:
+            self._insert(row, new_row, sims[row])
+
+        k = min(self.top_k, len(sims))
+        if k:
+            best = np.argpartition(-sims, k - 1)[:k]
+            best = best[np.argsort(-sims[best])]
+            self._top_idx[new_row, :k] = best
+            self._top_sim[new_row, :k] = sims[best]
+        self._row_of[participant_id] = new_row
+
+    def _update_row(self, index, row, vector):
+        index.matrix[row] = vector
+        sims = index.matrix @ vector
+        sims[row] = -np.inf
+        top_idx = self._top_idx[:index.size]
+        top_sim = self._top_sim[:index.size]
+
+        # Там, где анкета уже была в top-k, её сходство могло упасть и
+        # пропустить вперёд другую анкету: такие строки считаем заново
+        stale = (top_idx == row).any(axis=1)
+        stale[row] = True
+        for other in np.nonzero(~stale & (sims > top_sim[:, -1]))[0]:
+            self._insert(other, row, sims[other])
+
+        rows = np.nonzero(stale)[0]
+        top_idx[rows], top_sim[rows] = self._top_k_rows(index.matrix, rows)
+
+    def _insert(self, row, col, sim):
+        position = np.searchsorted(-self._top_sim[row], -sim)
+        self._top_idx[row, position + 1:] = self._top_idx[row, position:-1].copy()
+        self._top_sim[row, position + 1:] = self._top_sim[row, position:-1].copy()
+        self._top_idx[row, position] = col
+        self._top_sim[row, position] = sim
+
+    def _top_k_rows(self, matrix, rows):
+        """Top-k похожих для строк rows, блоками по BLOCK_SIZE строк."""
+        n = matrix.shape[0]
+        top_idx = np.full((len(rows), self.top_k), -1, dtype=np.int64)
+        top_sim = np.full((len(rows), self.top_k), -np.inf, dtype=np.float32)
+        k = min(self.top_k, n - 1)
+        if k <= 0:
+            return top_idx, top_sim
+
+        for start in range(0, len(rows), BLOCK_SIZE):
+            stop = min(start + BLOCK_SIZE, len(rows))
+            block = rows[start:stop]
+            sims = matrix[block] @ matrix.T
+            sims[np.arange(stop - start), block] = -np.inf
+            best = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            best_sims = np.take_along_axis(sims, best, axis=1)
+            order = np.argsort(-best_sims, axis=1)
+            top_idx[start:stop, :k] = np.take_along_axis(best, order, axis=1)
+            top_sim[start:stop, :k] = np.take_along_axis(best_sims, order, axis=1)
+        return top_idx, top_sim
+
+    def _schedule_refresh_if_stale(self):
+        if time.monotonic() - self._built_at > self.refresh_interval:
+            self._schedule_refresh()
+
+    def _schedule_refresh(self, force=False):
+        with self._lock:
+            if self._building:
+                return
+            if not force and time.monotonic() - self._built_at <= self.refresh_interval:
+                return
+            self._building = True
+        run_in_background(self.refresh)
+
+
+recommender = Recommender(
+    top_k=settings.RECOMMENDATIONS_TOP_K,
+    max_features=settings.RECOMMENDATIONS_MAX_FEATURES,
+    refresh_interval=settings.RECOMMENDATIONS_REFRESH_INTERVAL,
+)
@@ -0,0 +1,51 @@
+"""Маршрутизация текстовых кнопок меню одним обработчиком.
+
+Вместо цепочки MessageHandler с регулярными выражениями, которую
+диспетчер проверяет по очереди для каждого сообщения, подпись кнопки
+ищется в словаре. Регулярные выражения проверяются только для текста,
+не совпавшего ни с одной подписью.
+"""
+import re
+
+from telegram import Update
+from telegram.ext import Handler
+
+
+class MenuRouter(Handler):
+    """Обработчик кнопок меню: точная подпись → callback за O(1)."""
+
+    __slots__ = ('routes', 'patterns')
+
+    def __init__(self):
+        super().__init__(callback=None)
+        self.routes = {}
+        self.patterns = []
+
+    def add_route(self, label, callback):
+        self.routes[label] = callback
+
+    def add_pattern(self, pattern, callback):
+        """Callback для произвольного текста; проверяется после точных подписей."""
+        self.patterns.append((re.compile(pattern), callback))
+
+    def resolve(self, text):
+        callback = self.routes.get(text)
+        if callback is not None:
+            return callback
+        for pattern, callback in self.patterns:
+            if pattern.search(text):
+                return callback
+        return None
+
+    def check_update(self, update):
+        if not isinstance(update, Update) or not update.effective_message:
+            return None
+        text = update.effective_message.text
+        if text is None:
+            return None
+        return self.resolve(text)
+
+    def handle_update(self, update, dispatcher, check_result, context=None):
+        # check_update уже нашёл нужный callback
+        self.collect_additional_context(context, update, dispatcher, check_result)
+        return check_result(update, context)
@@ -0,0 +1,322 @@
+"""Импорт расписания мероприятия из CSV или ICS.
+
+До записи слоты проверяются: окончание позже начала, у спикера и в
+зале нет двух докладов одновременно, в том числе с уже сохранёнными
+слотами мероприятия. Пересечения ищутся сортировкой и одним проходом
+по слотам каждого спикера и зала. Недостающие спикеры создаются, всё
+пишется через bulk_create в одной транзакции; при любой ошибке база не
+меняется.
+"""
+import csv
+import io
+import re
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from events_bot.cache import active_event_cache
+from events_bot.ical import feed_validators
+from events_bot.models import Speaker, TimeSlot
+
+# Колонки CSV; speaker_username, room и description необязательны
+CSV_COLUMNS = ('start', 'end', 'title', 'speaker', 'speaker_username', 'room', 'description')
+REQUIRED_CSV_COLUMNS = ('start', 'end', 'title', 'speaker')
+
+ICS_LINE_RE = re.compile(r'^([A-Za-z0-9-]+)((?:;[A-Za-z0-9-]+=(?:"[^"]*"|[^";:]*))*):(.*)$')
+ICS_PARAM_RE = re.compile(r';([A-Za-z0-9-]+)=("[^"]*"|[^";:]*)')
+ICS_ESCAPE_RE = re.compile(r'\\([\\;,nN])')
+ICS_DURATION_RE = re.compile(r'^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+class ScheduleImportError(Exception):
+    """Расписание не импортировано; errors — список проблем по строкам файла."""
+
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+@dataclass(frozen=True)
+class SlotRow:
+    """Слот из файла расписания; source — где он в файле, для сообщений об ошибках."""
+    source: str
+    start: datetime
+    end: datetime
+    title: str
+    speaker: str
+    speaker_username: str = ''
+    room: str = ''
+    description: str = ''
+
+
+@dataclass
+class ImportResult:
+    slots_created: int = 0
+    speakers_created: int = 0
+    slots_deleted: int = 0
+
+
+def parse_datetime_value(value, event_date, tz):
+    """'10:00' — время в день мероприятия, иначе дата и время в ISO 8601."""
+    value = value.strip()
+    try:
+        parsed = datetime.combine(event_date, time.fromisoformat(value))
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, tz)
+    return parsed
+
+
+def parse_csv(text, event_date):
+    reader = csv.DictReader(io.StringIO(text.lstrip('\ufeff')))
+    columns = {(name or '').strip().lower() for name in reader.fieldnames or ()}
+    missing = [column for column in REQUIRED_CSV_COLUMNS if column not in columns]
+    if missing:
+        raise ScheduleImportError([f"Нет колонок: {', '.join(missing)}"])
+
+    tz = timezone.get_current_timezone()
+    rows, errors = [], []
+    for raw in reader:
+        source = f'строка {reader.line_num}'
+        row = {
+            key.strip().lower(): (value or '').strip()
+            for key, value in raw.items() if isinstance(key, str)
+        }
+        try:
+            start = parse_datetime_value(row['start'], event_date, tz)
+            end = parse_datetime_value(row['end'], event_date, tz)
+        except ValueError:
+            errors.append(f"{source}: не удалось разобрать время «{row['start']}» – «{row['end']}»")
+            continue
+        rows.append(SlotRow(
+            source=source,
+            start=start,
+            end=end,
+            title=row['title'],
+            speaker=row['speaker'],
+            speaker_username=row.get('speaker_username', '').lstrip('@'),
+            room=row.get('room', ''),
+            description=row.get('description', ''),
+        ))
+    if errors:
+        raise ScheduleImportError(errors)
+    return rows
+
+
+def unescape_ics(value):
+    return ICS_ESCAPE_RE.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def parse_ics_datetime(value, params):
+    if params.get('VALUE') == 'DATE' or 'T' not in value:
+        raise ValueError('доклад на весь день без времени')
+    if value.endswith('Z'):
+        tz = dt_timezone.utc
+    else:
+        try:
+            tz = ZoneInfo(params['TZID']) if 'TZID' in params else timezone.get_current_timezone()
+        except (ZoneInfoNotFoundError, ValueError):
+            tz = timezone.get_current_timezone()
+    parsed = datetime.strptime(value.rstrip('Z'), '%Y%m%dT%H%M%S')
+    return parsed.replace(tzinfo=tz)
+
+
+def parse_ics_duration(value):
+    match = ICS_DURATION_RE.match(value)
+    if not match:
+        raise ValueError(f'не удалось разобрать DURATION «{value}»')
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def slot_from_ics(properties, source):
+    def value(name):
+        return properties.get(name, ({}, ''))[1]
+
+    if 'DTSTART' not in properties:
+        raise ValueError('нет DTSTART')
+    params, start = properties['DTSTART']
+    start = parse_ics_datetime(start, params)
+    if 'DTEND' in properties:
+        params, end = properties['DTEND']
+        end = parse_ics_datetime(end, params)
+    elif 'DURATION' in properties:
+        end = start + parse_ics_duration(value('DURATION'))
+    else:
+        raise ValueError('нет DTEND или DURATION')
+
+    # Спикер: X-SPEAKER, иначе CN первого ATTENDEE или ORGANIZER
+    speaker = unescape_ics(value('X-SPEAKER'))
+    for name in ('ATTENDEE', 'ORGANIZER'):
+        if not speaker and name in properties:
+            speaker = properties[name][0].get('CN', '')
+    return SlotRow(
+        source=source,
+        start=start,
+        end=end,
+        title=unescape_ics(value('SUMMARY')),
+        speaker=speaker,
+        speaker_username=unescape_ics(value('X-SPEAKER-TELEGRAM')).lstrip('@'),
+        room=unescape_ics(value('LOCATION')),
+        description=unescape_ics(value('DESCRIPTION')),
+    )
+
+
+def parse_ics(text):
+    # Продолжение свойства начинается с пробела или табуляции (RFC 5545, 3.1)
+    lines = re.sub(r'\r?\n[ \t]', '', text.lstrip('\ufeff')).splitlines()
+    rows, errors = [], []
+    properties, index = None, 0
+    for line in lines:
+        match = ICS_LINE_RE.match(line)
+        if not match:
+            continue
+        name, raw_params, value = match.groups()
+        name = name.upper()
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            properties, index = {}, index + 1
+        elif name == 'END' and value.upper() == 'VEVENT' and properties is not None:
+            source = f'событие {index}'
+            try:
+                rows.append(slot_from_ics(properties, source))
+            except ValueError as e:
+                errors.append(f'{source}: {e}')
+            properties = None
+        elif properties is not None and name not in properties:
+            params = {key.upper(): param.strip('"') for key, param in ICS_PARAM_RE.findall(raw_params)}
+            properties[name] = (params, value)
+    if errors:
+        raise ScheduleImportError(errors)
+    return rows
+
+
+def parse_schedule(text, event_date):
+    """Разбирает расписание, определяя формат по содержимому."""
+    if text.lstrip('\ufeff \r\n').upper().startswith('BEGIN:VCALENDAR'):
+        return parse_ics(text)
+    return parse_csv(text, event_date)
+
+
+def speaker_key(username, name):
+    return ('username', username.lower()) if username else ('name', name.strip())
+
+
+def resolve_speakers(rows):
+    """Сопоставляет строки со спикерами: по username, иначе по имени.
+
+    Возвращает (спикер для каждой строки, новые спикеры без pk).
+    """
+    usernames = {row.speaker_username.lower() for row in rows if row.speaker_username}
+    names = {row.speaker.strip() for row in rows if not row.speaker_username}
+    known = {}
+    speakers = Speaker.objects.annotate(username_lower=Lower('telegram_username')).filter(
+        Q(username_lower__in=usernames) | Q(name__in=names)
+    ).order_by('pk')
+    for speaker in speakers:
+        if speaker.username_lower:
+            known.setdefault(('username', speaker.username_lower), speaker)
+        known.setdefault(('name', speaker.name), speaker)
+
+    resolved, new = [], []
+    for row in rows:
+        key = speaker_key(row.speaker_username, row.speaker)
+        speaker = known.get(key)
+        if speaker is None:
+            speaker = known[key] = Speaker(name=row.speaker, telegram_username=row.speaker_username or None)
+            new.append(speaker)
+        resolved.append(speaker)
+    return resolved, new
+
+
+Entry = namedtuple('Entry', 'source start end speaker speaker_name room')
+
+
+def find_overlaps(entries, key):
+    """Пары пересекающихся по времени записей с одинаковым key(entry).
+
+    Записи сортируются по ключу и началу; при проходе хранится запись
+    с самым поздним окончанием, и каждая следующая, начавшаяся раньше
+    этого окончания, с ней пересекается.
+    """
+    overlaps = []
+    current_key, latest = None, None
+    for entry in sorted((entry for entry in entries if key(entry)), key=lambda entry: (key(entry), entry.start)):
+        if key(entry) != current_key:
+            current_key, latest = key(entry), entry
+            continue
+        if entry.start < latest.end:
+            overlaps.append((latest, entry))
+        if entry.end > latest.end:
+            latest = entry
+    return overlaps
+
+
+def validate(event, rows, speakers, replace):
+    errors = []
+    for row in rows:
+        if not row.title or not row.speaker:
+            errors.append(f'{row.source}: не указаны название доклада или спикер')
+        if row.end <= row.start:
+            errors.append(f'{row.source}: окончание не позже начала')
+
+    # Новые спикеры ещё без pk, их различаем по самому объекту
+    entries = [
+        Entry(
+            row.source, row.start, row.end,
+            ('pk', speaker.pk) if speaker.pk else ('new', id(speaker)), row.speaker, row.room,
+        )
+        for row, speaker in zip(rows, speakers)
+    ]
+    if not replace:
+        for slot in event.time_slots.select_related('speaker'):
+            entries.append(Entry(
+                f'«{slot.title}» (уже в расписании)', slot.start_time, slot.end_time,
+                ('pk', slot.speaker_id), slot.speaker.name, slot.room,
+            ))
+
+    for first, second in find_overlaps(entries, lambda entry: entry.speaker):
+        errors.append(f'{first.source} и {second.source}: у спикера «{second.speaker_name}» два доклада одновременно')
+    for first, second in find_overlaps(entries, lambda entry: entry.room.casefold()):
+        errors.append(f'{first.source} и {second.source}: зал «{second.room}» занят')
+    return errors
+
+
+def import_schedule(event, rows, replace=False):
+    """Проверяет и записывает слоты мероприятия; при ошибках бросает ScheduleImportError.
+
+    replace=True заменяет текущее расписание мероприятия целиком.
+    """
+    speakers, new_speakers = resolve_speakers(rows)
+    errors = validate(event, rows, speakers, replace)
+    if errors:
+        raise ScheduleImportError(errors)
+
+    result = ImportResult(slots_created=len(rows), speakers_created=len(new_speakers))
+    with transaction.atomic():
+        if replace:
+            result.slots_deleted, _ = event.time_slots.all().delete()
+        Speaker.objects.bulk_create(new_speakers)
+        event.speakers.add(*{speaker.pk: speaker for speaker in speakers}.values())
+        TimeSlot.objects.bulk_create([
+            TimeSlot(
+                event=event,
+                speaker=speaker,
+                start_time=row.start,
+                end_time=row.end,
+                title=row.title,
+                description=row.description,
+                room=row.room,
+            )
+            for row, speaker in zip(rows, speakers)
+        ])
+        # bulk_create не отправляет post_save, кэши программы и календарей сбрасываем сами
+        transaction.on_commit(active_event_cache.invalidate)
+        transaction.on_commit(feed_validators.clear)
+    return result
@@ -0,0 +1,53 @@
+"""Полнотекстовый поиск по анкетам участников (SQLite FTS5).
+
+Индекс events_bot_participant_fts создаётся миграцией 0015 и
+обновляется триггерами, поэтому отдельной синхронизации из кода не
+требуется.
+"""
+import re
+
+from django.db import connection
+
+FTS_TABLE = 'events_bot_participant_fts'
+SEARCH_RESULTS_LIMIT = 10
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Совпадение в имени весит вдвое больше, чем в описании
+SEARCH_SQL = f"""
+    SELECT p.id, p.telegram_id, p.telegram_username, p.name, p.bio
+    FROM {FTS_TABLE}
+    JOIN events_bot_participant p ON p.id = {FTS_TABLE}.rowid
+    WHERE {FTS_TABLE} MATCH %s AND p.bio IS NOT NULL AND p.bio != '' AND p.id != %s
+    ORDER BY bm25({FTS_TABLE}, 2.0, 1.0)
+    LIMIT %s
+"""
+
+MATCH_IDS_SQL = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+
+# Релевантность строки участника для сортировки в админке: меньше — лучше
+RANK_SQL = (
+    f'SELECT bm25({FTS_TABLE}, 2.0, 1.0) FROM {FTS_TABLE} '
+    f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = events_bot_participant.id'
+)
+
+
+def build_match_query(text):
+    """Запрос FTS5 из произвольного текста: «Django, ML» → "django"* OR "ml"*.
+
+    Слова берутся в кавычки, чтобы спецсимволы синтаксиса FTS5 не
+    ломали запрос. Возвращает пустую строку, если слов нет.
+    """
+    tokens = TOKEN_RE.findall(text.lower())
+    return ' OR '.join(f'"{token}"*' for token in dict.fromkeys(tokens))
+
+
+def search_profiles(text, exclude_id=0, limit=SEARCH_RESULTS_LIMIT):
+    """Заполненные анкеты, подходящие под запрос, от лучшего совпадения к худшему."""
+    match = build_match_query(text)
+    if not match:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL, [match, exclude_id, limit])
+        columns = ('pk', 'telegram_id', 'telegram_username', 'name', 'bio')
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -1,16 +1,89 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from django.conf import settings
-from telegram.ext import Updater
-from events_bot.models import Event, Participant
-from events_bot.telegram_bot import send_new_event_notification
+from django.utils import timezone
+
+from events_bot.background import run_delivery_in_background
+from events_bot.cache import active_event_cache, participant_cache
+from events_bot.ical import feed_validators
+from events_bot.metrics import track_queries
+from events_bot.models import Event, NetworkingStats, Participant, Speaker, TimeSlot
+from events_bot.outbox import notify_about_event
+
 
 @receiver(post_save, sender=Event)
 def notify_new_event(sender, instance, created, **kwargs):
-    """Отправление уведомлений о новых событиях"""
+    """Отправление уведомлений о новых событиях.
+
+    Рассылка запускается после коммита транзакции, чтобы в программу
+    попали слоты из инлайнов админки, и выполняется в фоновом потоке.
+    """
     if created:
-        try:
-            updater = Updater(settings.TG_BOT_TOKEN, use_context=True)
-            sent_count = send_new_event_notification(updater.bot, instance)
-        except Exception as e:
-            print(f"Не удалось выслать уведомление: {str(e)}")
\ No newline at end of file
+        event_id = instance.pk
+        transaction.on_commit(lambda: run_delivery_in_background(notify_about_event, event_id))
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def invalidate_participant(sender, instance, **kwargs):
+    # Сбрасываем после коммита: иначе другой поток успеет закэшировать старую строку
+    telegram_id = instance.telegram_id
+    transaction.on_commit(lambda: participant_cache.invalidate(telegram_id))
+
+
+@receiver(post_delete, sender=Participant)
+def decrement_profiles_count(sender, instance, **kwargs):
+    if instance.bio:
+        NetworkingStats.change_profiles_count(-1)
+
+
+@receiver(m2m_changed, sender=Participant.registered_events.through)
+def invalidate_participant_events(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Изменения со стороны мероприятия затрагивают сразу многих участников
+        transaction.on_commit(participant_cache.clear)
+    else:
+        telegram_id = instance.telegram_id
+        transaction.on_commit(lambda: participant_cache.invalidate(telegram_id))
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=TimeSlot)
+@receiver(post_save, sender=Speaker)
+@receiver(post_delete, sender=Speaker)
+@receiver(m2m_changed, sender=Speaker.events.through)
+def invalidate_active_event(sender, **kwargs):
+    transaction.on_commit(active_event_cache.invalidate)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=TimeSlot)
+@receiver(post_delete, sender=TimeSlot)
+@receiver(post_save, sender=Speaker)
+@receiver(m2m_changed, sender=Participant.registered_events.through)
+def invalidate_calendar_feeds(sender, **kwargs):
+    # До коммита запрос ленты пересчитал бы ETag по старым данным и закэшировал его
+    transaction.on_commit(feed_validators.clear)
+
+
+@receiver(post_delete, sender=TimeSlot)
+def touch_event_on_slot_delete(sender, instance, **kwargs):
+    # Удалённый слот не оставляет updated_at, поэтому новее становится само мероприятие
+    Event.objects.filter(pk=instance.event_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Speaker)
+def touch_speaker_slots(sender, instance, **kwargs):
+    # Имя спикера есть в ленте календаря, поэтому его слоты считаются изменёнными
+    TimeSlot.objects.filter(speaker=instance).update(updated_at=timezone.now())
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    track_queries(connection)
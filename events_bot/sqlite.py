@@ -0,0 +1,42 @@
+"""Настройки SQLite для одновременной работы бота и админки.
+
+WAL позволяет читать базу, пока другой процесс пишет, а busy_timeout
+заставляет писателя подождать освобождения блокировки вместо ошибки
+«database is locked». Прагмы применяются к каждому новому соединению
+бэкендом events_bot.sqlite_backend и проверяются командой
+`python manage.py check --database default`.
+"""
+from django.conf import settings
+
+
+def get_pragmas():
+    """Прагмы из настроек в порядке применения."""
+    return {
+        'journal_mode': settings.SQLITE_JOURNAL_MODE,
+        'busy_timeout': settings.SQLITE_BUSY_TIMEOUT,
+        'synchronous': settings.SQLITE_SYNCHRONOUS,
+        'mmap_size': settings.SQLITE_MMAP_SIZE,
+        'cache_size': settings.SQLITE_CACHE_SIZE,
+    }
+
+
+def apply_pragmas(connection):
+    """Применяет прагмы к соединению sqlite3."""
+    for name, value in get_pragmas().items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+# Значения, которые SQLite возвращает по именам, а не числам
+SYNCHRONOUS_LEVELS = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+
+
+def read_pragmas(connection):
+    """Фактические значения прагм соединения."""
+    active = {}
+    with connection.cursor() as cursor:
+        for name in get_pragmas():
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            active[name] = row[0] if row else None
+    active['synchronous'] = SYNCHRONOUS_LEVELS.get(active['synchronous'], active['synchronous'])
+    return active
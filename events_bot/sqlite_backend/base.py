@@ -0,0 +1,12 @@
+from django.db.backends.sqlite3 import base
+
+from events_bot.sqlite import apply_pragmas
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite с прагмами из настроек."""
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        apply_pragmas(connection)
+        return connection
@@ -16,11 +16,32 @@ from telegram import (
 )
 from django.conf import settings
 from yookassa import Payment, Configuration
+import atexit
+import logging
+import queue
 import uuid
+from html import escape
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 
-from events_bot.models import Event, Participant, Donation, Question, Speaker
+from events_bot.background import run_delivery_in_background, run_in_background
+from events_bot.bot_client import get_bot
+from events_bot.cache import get_active_event, get_or_create_participant, get_participant
+from events_bot.broadcast import Broadcast, format_progress, format_result
+from events_bot.handler_pool import OrderedDispatcher
+from events_bot.ical import event_feed_url, participant_feed_url
+from events_bot.instrumentation import instrument_dispatcher
+from events_bot.metrics import start_metrics_server
+from events_bot.models import Event, Participant, Donation, Question, Speaker, ProfileView
+from events_bot.outbox import deliver_pending_notifications
+from events_bot.persistence import DjangoPersistence
+from events_bot.recommendations import recommender
+from events_bot.router import MenuRouter
+from events_bot.search import search_profiles
 from events_bot.views import send_question
+from events_bot.webhook import get_webhook_url, set_webhook
+
+logger = logging.getLogger(__name__)
 
 (
     CHOOSE_CUSTOM_AMOUNT,
@@ -39,8 +60,12 @@ from events_bot.views import send_question
     CONFIRMING_UNREGISTER,
     AWAITING_NAME,
     AWAITING_BIO,
-    VIEWING_PROFILE
-) = range(17)
+    VIEWING_PROFILE,
+    AWAITING_SEARCH_QUERY
+) = range(18)
+
+# Сколько анкет подгружать за один запрос в ленте знакомств
+PROFILE_BATCH_SIZE = 20
 
 # Инициализация ЮKassa
 Configuration.account_id = settings.YOOKASSA_SHOP_ID
@@ -68,13 +93,7 @@ def get_main_keyboard(participant):
 def event_menu(update, context):
     """Обработчик меню 'Мероприятие'"""
     user = update.message.from_user
-    participant, _ = Participant.objects.get_or_create(
-        telegram_id=user.id,
-        defaults={
-            'telegram_username': user.username,
-            'name': user.first_name or 'Аноним'
-        }
-    )
+    participant = get_or_create_participant(user)
 
     keyboard = [
         ["📜 Программа", "📋 Мои мероприятия"],
@@ -110,15 +129,9 @@ def registration_menu(update, context):
 
 def start(update, context):
     user = update.message.from_user
-    participant, _ = Participant.objects.get_or_create(
-        telegram_id=user.id,
-        defaults={
-            'telegram_username': user.username,
-            'name': user.first_name or 'Аноним'
-        }
-    )
+    participant = get_or_create_participant(user)
 
-    event = Event.objects.filter(is_active=True).first()
+    event = get_active_event()
     event_name = event.title if event else "Python Meetup"
 
     main_menu_keyboard = get_main_keyboard(participant)
@@ -138,13 +151,17 @@ def start(update, context):
 
 
 def program(update, context):
-    event = Event.objects.filter(is_active=True).first()
+    event = get_active_event()
     if event:
-        program_text = event.get_program()
+        program_text = event.program_text
+        calendar_link = ""
+        if settings.ICS_BASE_URL:
+            calendar_link = f"\n\n📆 <a href=\"{event_feed_url(event.id)}\">Добавить программу в календарь</a>"
         update.message.reply_text(
             f"📜 <b>Программа мероприятия:</b>\n\n"
             f"{program_text}\n\n"
-            f"<i>Ждем вас {event.date.strftime('%d.%m.%Y')}!</i>",
+            f"<i>Ждем вас {event.date.strftime('%d.%m.%Y')}!</i>"
+            f"{calendar_link}",
             parse_mode='HTML'
         )
     else:
@@ -156,7 +173,7 @@ def program(update, context):
 
 
 def donate(update, context):
-    if not Event.objects.filter(is_active=True).exists():
+    if not get_active_event():
         update.message.reply_text(
             "🙅‍♂️ <b>Сейчас нет активных мероприятий</b>\n"
             "Донаты временно недоступны",
@@ -183,7 +200,7 @@ def handle_fixed_donate_callback(update, context):
     query = update.callback_query
     query.answer()
 
-    if not Event.objects.filter(is_active=True).exists():
+    if not get_active_event():
         query.edit_message_text(
             "🙅‍♂️ Сейчас нет активных мероприятий для доната")
         return ConversationHandler.END
@@ -200,7 +217,7 @@ def handle_custom_donate_callback(update, context):
     query = update.callback_query
     query.answer()
 
-    if not Event.objects.filter(is_active=True).exists():
+    if not get_active_event():
         query.edit_message_text(
             "🙅‍♂️ Сейчас нет активных мероприятий для доната")
         return ConversationHandler.END
@@ -253,7 +270,7 @@ def create_payment(update, context, amount):
         user = update.message.from_user
         chat_id = update.message.chat_id
 
-    event = Event.objects.filter(is_active=True).first()
+    event = get_active_event()
     if not event:
         error_msg = "🙅‍♂️ Сейчас нет активных мероприятий для доната"
         if update.callback_query:
@@ -262,13 +279,7 @@ def create_payment(update, context, amount):
             update.message.reply_text(error_msg)
         return
 
-    participant, _ = Participant.objects.get_or_create(
-        telegram_id=user.id,
-        defaults={
-            'telegram_username': user.username,
-            'name': user.first_name or 'Аноним'
-        }
-    )
+    participant = get_or_create_participant(user)
 
     try:
         payment = Payment.create({
@@ -285,8 +296,8 @@ def create_payment(update, context, amount):
         }, str(uuid.uuid4()))
 
         Donation.objects.create(
-            event=event,
-            participant=participant,
+            event_id=event.id,
+            participant_id=participant.id,
             amount=amount,
             payment_id=payment.id,
             is_confirmed=True
@@ -326,7 +337,7 @@ def create_payment(update, context, amount):
 
 
 def current_speaker(update, context):
-    event = Event.objects.filter(is_active=True).first()
+    event = get_active_event()
     if not event:
         update.message.reply_text(
             "📭 Сейчас нет активных мероприятий",
@@ -335,7 +346,7 @@ def current_speaker(update, context):
         return
 
     now = timezone.localtime(timezone.now())
-    current_slot = event.get_current_speaker()
+    current_slot = event.get_current_slot(now)
 
     if current_slot:
         speaker = current_slot.speaker
@@ -355,9 +366,18 @@ def current_speaker(update, context):
             parse_mode='HTML'
         )
     else:
+        next_slot = event.get_next_slot(now)
+        if next_slot:
+            next_start = timezone.localtime(next_slot.start_time)
+            next_note = (
+                f"Следующее выступление в {next_start.strftime('%H:%M')}:\n"
+                f"👤 <b>{next_slot.speaker.name}</b> — <i>{next_slot.title}</i>"
+            )
+        else:
+            next_note = "Следующее выступление смотрите в программе"
         update.message.reply_text(
             "⏳ <b>Сейчас перерыв или выступление не запланировано</b>\n\n"
-            "Следующее выступление смотрите в программе",
+            f"{next_note}",
             parse_mode='HTML'
         )
 
@@ -365,9 +385,9 @@ def current_speaker(update, context):
 def get_ask_speaker_keyboard(speakers):
     """Клавиатура для выбора спикера с отметкой текущего"""
     keyboard = []
-    event = Event.objects.filter(is_active=True).first()
-    current_speaker = event.get_current_speaker(
-    ).speaker if event and event.get_current_speaker() else None
+    event = get_active_event()
+    current_slot = event.get_current_slot() if event else None
+    current_speaker = current_slot.speaker if current_slot else None
 
     for speaker in speakers:
         if speaker.telegram_username:
@@ -384,12 +404,12 @@ def get_ask_speaker_keyboard(speakers):
 
 def ask_speaker_start(update, context):
     """Начало процесса задания вопроса"""
-    event = Event.objects.filter(is_active=True).first()
+    event = get_active_event()
     if not event:
         update.message.reply_text("Сейчас нет активных мероприятий")
         return ConversationHandler.END
 
-    speakers = event.speakers.all()
+    speakers = event.speakers
     if not speakers:
         update.message.reply_text("На этом мероприятии нет спикеров")
         return ConversationHandler.END
@@ -409,7 +429,7 @@ def ask_speaker_select(update, context):
     if query.data == 'back':
         user = query.from_user
         try:
-            participant = Participant.objects.get(telegram_id=user.id)
+            participant = get_participant(user.id)
             query.edit_message_text(
                 "Выберите действие:", reply_markup=get_main_keyboard(participant))
         except Participant.DoesNotExist:
@@ -418,14 +438,13 @@ def ask_speaker_select(update, context):
 
     speaker_username = query.data.split('_', 1)[1]
 
-    try:
-        speaker = Speaker.objects.get(telegram_username=speaker_username)
-        context.user_data['speaker_username'] = speaker_username
-        # Сохраняем ID для надежности
-        context.user_data['speaker_id'] = speaker.id
-    except Speaker.DoesNotExist:
+    event = get_active_event()
+    speaker = event.speakers_by_username.get(speaker_username) if event else None
+    if speaker is None:
         query.edit_message_text("❌ Спикер не найден")
         return ConversationHandler.END
+    # Сохраняем ID для надежности
+    context.user_data['speaker_id'] = speaker.id
 
     context.user_data['speaker_username'] = speaker_username
 
@@ -562,7 +581,7 @@ def register_speaker_start(update, context):
     """Начало процесса регистрации спикера"""
     user = update.effective_user
     try:
-        participant = Participant.objects.get(telegram_id=user.id)
+        participant = get_participant(user.id)
     except Participant.DoesNotExist:
         update.message.reply_text(
             "❌ Пожалуйста, начните с команды /start",
@@ -665,7 +684,7 @@ def subscribe_start(update, context):
     user = update.effective_user
 
     try:
-        participant = Participant.objects.get(telegram_id=user.id)
+        participant = get_participant(user.id)
 
         if participant.is_subscribed:
             update.message.reply_text(
@@ -735,7 +754,7 @@ def subscribe_confirm(update, context):
             )
     else:
         try:
-            participant = Participant.objects.get(telegram_id=user.id)
+            participant = get_participant(user.id)
             context.bot.send_message(
                 chat_id=chat_id,
                 text="❌ Действие отменено",
@@ -762,9 +781,9 @@ def mailing_start(update, context):
     query = update.callback_query
     user = update.effective_user
     try:
-        participant = Participant.objects.get(telegram_id=user.id)
+        participant = get_participant(user.id)
 
-        if not (participant.is_speaker or participant.is_manager):
+        if not (participant.is_speaker or participant.is_event_manager):
             update.message.reply_text(
                 "❌ <b>У вас нет прав для создания рассылки.</b>\n"
                 "Эта функция доступна только спикерам и менеджерам.",
@@ -817,7 +836,7 @@ def mailing_confirm(update, context):
 
     if query.data == 'mailing_confirm':
         try:
-            participant = Participant.objects.get(telegram_id=user.id)
+            participant = get_participant(user.id)
             mailing_text = context.user_data['mailing_text']
             subscribed_participants = Participant.objects.filter(
                 is_subscribed=True)
@@ -835,29 +854,40 @@ def mailing_confirm(update, context):
                 )
                 return ConversationHandler.END
 
-            sent_count = 0
-            for participant in subscribed_participants:
-                try:
-                    context.bot.send_message(
-                        chat_id=participant.telegram_id,
-                        text=f"📢 <b>Новое сообщение от организаторов:</b>\n\n{mailing_text}",
-                        parse_mode='HTML'
-                    )
-                    sent_count += 1
-                except Exception as e:
-                    print(
-                        f"Failed to send message to {participant.telegram_id}: {str(e)}")
-
+            status_message_id = query.message.message_id
             query.edit_message_text(
-                "✅ Рассылка отправлена",
+                "⏳ <b>Рассылка запущена...</b>",
                 parse_mode='HTML'
             )
-            context.bot.send_message(
-                chat_id=chat_id,
-                text=f"✅ <b>Рассылка успешно отправлена {sent_count} подписчикам!</b>",
-                parse_mode='HTML',
-                reply_markup=get_main_keyboard(participant)
-            )
+
+            def report_progress(result):
+                context.bot.edit_message_text(
+                    format_progress(result),
+                    chat_id=chat_id,
+                    message_id=status_message_id,
+                    parse_mode='HTML'
+                )
+
+            def report_done(result):
+                context.bot.edit_message_text(
+                    format_result(result),
+                    chat_id=chat_id,
+                    message_id=status_message_id,
+                    parse_mode='HTML'
+                )
+                context.bot.send_message(
+                    chat_id=chat_id,
+                    text=f"✅ <b>Рассылка успешно отправлена {result.sent} подписчикам!</b>",
+                    parse_mode='HTML',
+                    reply_markup=get_main_keyboard(participant)
+                )
+
+            Broadcast(
+                context.bot,
+                f"📢 <b>Новое сообщение от организаторов:</b>\n\n{mailing_text}",
+                subscribed_participants,
+                on_progress=report_progress,
+            ).start(on_done=report_done)
         except Participant.DoesNotExist:
             query.edit_message_text(
                 "❌ Ошибка рассылки",
@@ -871,7 +901,7 @@ def mailing_confirm(update, context):
             )
         except Exception as e:
             try:
-                participant = Participant.objects.get(telegram_id=user.id)
+                participant = get_participant(user.id)
                 query.edit_message_text(
                     "❌ Ошибка рассылки",
                     parse_mode='HTML'
@@ -895,7 +925,7 @@ def mailing_confirm(update, context):
                 )
     else:
         try:
-            participant = Participant.objects.get(telegram_id=user.id)
+            participant = get_participant(user.id)
             context.bot.send_message(
                 chat_id=chat_id,
                 text="❌ Действие отменено",
@@ -922,7 +952,7 @@ def unsubscribe_start(update, context):
     user = update.effective_user
 
     try:
-        participant = Participant.objects.get(telegram_id=user.id)
+        participant = get_participant(user.id)
 
         if not participant.is_subscribed:
             update.message.reply_text(
@@ -991,7 +1021,7 @@ def unsubscribe_confirm(update, context):
             )
     else:
         try:
-            participant = Participant.objects.get(telegram_id=user.id)
+            participant = get_participant(user.id)
             context.bot.send_message(
                 chat_id=chat_id,
                 text="❌ Действие отменено",
@@ -1017,7 +1047,7 @@ def register_participant_start(update, context):
     """Начало процесса регистрации участника"""
     user = update.effective_user
     try:
-        participant = Participant.objects.get(telegram_id=user.id)
+        participant = get_participant(user.id)
     except Participant.DoesNotExist:
         update.message.reply_text(
             "❌ Пожалуйста, начните с команды /start",
@@ -1049,8 +1079,7 @@ def register_participant_select_event(update, context):
 
     if query.data == 'cancel':
         try:
-            participant = Participant.objects.get(
-                telegram_id=query.from_user.id)
+            participant = get_participant(query.from_user.id)
             query.edit_message_text(
                 "❌ Регистрация отменена",
                 parse_mode='HTML'
@@ -1072,9 +1101,9 @@ def register_participant_select_event(update, context):
     try:
         event = Event.objects.get(id=event_id)
         context.user_data['participant_event'] = event
-        participant = Participant.objects.get(telegram_id=query.from_user.id)
+        participant = get_participant(query.from_user.id)
 
-        if event in participant.registered_events.all():
+        if event.id in participant.registered_event_ids:
             query.edit_message_text(
                 f"✅ Вы уже зарегистрированы на:\n"
                 f"<b>{event.title}</b>\n"
@@ -1142,7 +1171,7 @@ def register_participant_confirm(update, context):
             query.edit_message_text(f"❌ Ошибка регистрации: {str(e)}")
     else:
         try:
-            participant = Participant.objects.get(telegram_id=user.id)
+            participant = get_participant(user.id)
             query.edit_message_text("❌ Регистрация отменена")
             context.bot.send_message(
                 chat_id=chat_id,
@@ -1158,7 +1187,7 @@ def register_participant_confirm(update, context):
 
 def get_my_events_keyboard(participant):
     """Клавиатура с мероприятиями, на которые зарегистрирован участник"""
-    events = participant.registered_events.all().order_by('date')
+    events = Event.objects.filter(participants__id=participant.id).order_by('date')
     keyboard = [
         [InlineKeyboardButton(
             event.get_full_name(),
@@ -1174,7 +1203,7 @@ def my_events_start(update, context):
     """Начало процесса просмотра зарегистрированных мероприятий"""
     user = update.effective_user
     try:
-        participant = Participant.objects.get(telegram_id=user.id)
+        participant = get_participant(user.id)
     except Participant.DoesNotExist:
         update.message.reply_text(
             "❌ Пожалуйста, начните с команды /start",
@@ -1183,8 +1212,7 @@ def my_events_start(update, context):
         )
         return ConversationHandler.END
 
-    events = participant.registered_events.all()
-    if not events.exists():
+    if not participant.registered_event_ids:
         update.message.reply_text(
             "📭 Вы не зарегистрированы ни на одно мероприятие",
             parse_mode='HTML',
@@ -1192,8 +1220,14 @@ def my_events_start(update, context):
         )
         return ConversationHandler.END
 
+    calendar_link = ""
+    if settings.ICS_BASE_URL:
+        calendar_link = (
+            f"📆 <a href=\"{participant_feed_url(participant.id)}\">Личное расписание для календаря</a>\n\n"
+        )
     update.message.reply_text(
         "📋 <b>Ваши зарегистрированные мероприятия:</b>\n\n"
+        f"{calendar_link}"
         "Выберите мероприятие, чтобы отписаться:",
         parse_mode='HTML',
         reply_markup=get_my_events_keyboard(participant)
@@ -1208,7 +1242,7 @@ def my_events_select_event(update, context):
 
     if query.data == 'cancel':
         try:
-            participant = Participant.objects.get(telegram_id=query.from_user.id)
+            participant = get_participant(query.from_user.id)
             query.edit_message_text(
                 "❌ Действие отменено",
                 parse_mode='HTML'
@@ -1230,7 +1264,7 @@ def my_events_select_event(update, context):
     try:
         event = Event.objects.get(id=event_id)
         context.user_data['unregister_event'] = event
-        participant = Participant.objects.get(telegram_id=query.from_user.id)
+        participant = get_participant(query.from_user.id)
 
         query.edit_message_text(
             f"Подтвердите отписку от мероприятия:\n"
@@ -1259,7 +1293,7 @@ def my_events_confirm_unregister(update, context):
         try:
             event = context.user_data['unregister_event']
             participant = Participant.objects.get(telegram_id=user.id)
-            if event in participant.registered_events.all():
+            if participant.registered_events.filter(pk=event.pk).exists():
                 participant.registered_events.remove(event)
                 query.edit_message_text(
                     f"✅ Вы успешно отписались от мероприятия:\n"
@@ -1283,7 +1317,7 @@ def my_events_confirm_unregister(update, context):
             query.edit_message_text(f"❌ Ошибка отписки: {str(e)}")
     else:
         try:
-            participant = Participant.objects.get(telegram_id=user.id)
+            participant = get_participant(user.id)
             query.edit_message_text("❌ Отписка отменена")
             context.bot.send_message(
                 chat_id=chat_id,
@@ -1297,58 +1331,17 @@ def my_events_confirm_unregister(update, context):
     return ConversationHandler.END
 
 
-def send_new_event_notification(bot, event):
-    """Отправление подписчикам уведомлений о новых событиях"""
-
-    subscribed_participants = Participant.objects.filter(is_subscribed=True)
-
-    if not subscribed_participants.exists():
-        print("No subscribed participants to notify about new event.")
-        return 0
-
-    sent_count = 0
-    try:
-        notification_text = (
-            f"🎉 <b>Новое мероприятие анонсировано!</b>\n\n"
-            f"📅 <b>{event.title}</b>\n"
-            f"🕒 Дата: {event.date.strftime('%d.%m.%Y')}\n"
-            f"📜 Программа:\n{event.get_program()}\n\n"
-            f"<i>Зарегистрируйтесь или задайте вопросы спикерам через бота!</i>"
-        )
-    except Exception as e:
-        print(f"Error generating notification text: {str(e)}")
-        return 0
-
-    for participant in subscribed_participants:
-        try:
-            bot.send_message(
-                chat_id=participant.telegram_id,
-                text=notification_text,
-                parse_mode='HTML'
-            )
-            sent_count += 1
-        except Exception as e:
-            print(f"Не удалось отправить уведомление участнику с ID {participant.telegram_id}: {str(e)}")
-
-    return sent_count
-
-
 def networking(update, context):
     """Кнопка «Пообщаться» в главном меню"""
     user = update.message.from_user
-    participant, _ = Participant.objects.get_or_create(
-        telegram_id=user.id,
-        defaults={
-            'telegram_username': user.username,
-            'name': user.first_name or 'Аноним'
-        }
-    )
+    participant = get_or_create_participant(user)
 
     text = (
         "🌟 <b>Знакомства на мероприятии</b> 🌟\n\n"
         "Здесь можно:\n"
         "• Рассказать о себе\n"
-        "• Найти интересных людей\n\n"
+        "• Найти интересных людей\n"
+        "• Искать участников по интересам\n\n"
         "Как это работает?\n"
         "1. Заполните свою анкету.\n"
         "2. Смотрите анкеты других.\n"
@@ -1359,6 +1352,7 @@ def networking(update, context):
     if not participant.bio:  # Проверяем, заполнена ли анкета
         buttons.append([InlineKeyboardButton("📝 Рассказать о себе", callback_data="fill_profile")])
     buttons.append([InlineKeyboardButton("👀 Познакомиться", callback_data="view_profiles")])
+    buttons.append([InlineKeyboardButton("🔎 Поиск по анкетам", callback_data="search_profiles")])
 
     update.message.reply_text(
         text,
@@ -1371,7 +1365,7 @@ def start_fill_profile(update, context):
     query = update.callback_query
     query.answer()
 
-    participant = Participant.objects.get(telegram_id=query.from_user.id)
+    participant = get_participant(query.from_user.id)
     if participant.bio:  # Если анкета уже заполнена
         query.edit_message_text(
             "✅ Вы уже заполнили анкету!\n"
@@ -1404,25 +1398,20 @@ def save_bio(update, context):
     bio = update.message.text
     user = update.message.from_user
 
-    is_first = not Participant.objects.exclude(telegram_id=user.id).exists()
-
     participant, created = Participant.objects.update_or_create(
         telegram_id=user.id,
         defaults={
             'name': context.user_data['name'],
             'bio': bio,
             'telegram_username': user.username,
-            'is_first_in_networking': is_first,
-            'notified_about_newcomers': False
         }
     )
+    run_in_background(recommender.add_profile, participant.id, bio)
 
     reply_text = "✅ Анкета сохранена!\nТеперь другие участники смогут с вами познакомиться."
 
-    if is_first:
+    if participant.is_first_in_networking and not participant.notified_about_newcomers:
         reply_text += "\n\n✨ Вы первый участник знакомств! Мы уведомим вас, когда появятся другие."
-    else:
-        check_for_newcomers()
 
     update.message.reply_text(
         reply_text,
@@ -1433,87 +1422,115 @@ def save_bio(update, context):
     return ConversationHandler.END
 
 
-def check_for_newcomers():
-    """Проверяет, нужно ли уведомить первого пользователя"""
-    try:
-        first_user = Participant.objects.filter(is_first_in_networking=True).first()
-        if not first_user or first_user.notified_about_newcomers:
-            return
-
-        new_users_count = Participant.objects.exclude(
-            telegram_id=first_user.telegram_id
-        ).count()
-
-        if new_users_count >= 5:
-            from telegram import Bot
-            bot = Bot(token=settings.TG_BOT_TOKEN)
-
-            bot.send_message(
-                chat_id=first_user.telegram_id,
-                text="🎉 Теперь есть 5 новых участников! Пришло время познакомиться.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("👀 Посмотреть анкеты", callback_data="view_profiles")]
-                ])
-            )
+def fetch_profiles(viewer, cursor, unseen_only=True):
+    """Порция анкет с первичным ключом больше курсора.
+
+    С unseen_only отбрасываются анкеты, уже показанные этому участнику
+    (анти-join по ProfileView).
+    """
+    profiles = Participant.objects.filter(
+        bio__isnull=False, pk__gt=cursor
+    ).exclude(bio='').exclude(pk=viewer.id)
+    if unseen_only:
+        profiles = profiles.filter(~Exists(
+            ProfileView.objects.filter(viewer_id=viewer.id, viewed_id=OuterRef('pk'))
+        ))
+    return list(
+        profiles.order_by('pk').values('pk', 'telegram_id', 'name', 'bio')[:PROFILE_BATCH_SIZE]
+    )
 
-            first_user.notified_about_newcomers = True
-            first_user.save()
 
-    except Exception as e:
-        import logging
-        logging.error(f"Ошибка в check_for_newcomers: {e}")
+def fetch_recommended(viewer):
+    """Непросмотренные анкеты из рекомендаций в порядке убывания сходства."""
+    ranked = recommender.recommend(viewer.id)
+    if not ranked:
+        return []
+    profiles = Participant.objects.filter(pk__in=ranked).filter(~Exists(
+        ProfileView.objects.filter(viewer_id=viewer.id, viewed_id=OuterRef('pk'))
+    )).values('pk', 'telegram_id', 'name', 'bio')
+    rank = {pk: position for position, pk in enumerate(ranked)}
+    profiles = sorted(profiles, key=lambda profile: rank[profile['pk']])
+    for profile in profiles:
+        profile['recommended'] = True
+    return profiles[:PROFILE_BATCH_SIZE]
+
+
+def next_profile(context, viewer):
+    """Следующая анкета из буфера пользователя.
+
+    Сначала показываются рекомендованные анкеты, затем остальные
+    непросмотренные по курсору. Когда и они закончились, лента идёт по
+    кругу по всем анкетам. Возвращает пару (анкета, начали_сначала);
+    если анкет нет, анкета — None.
+    """
+    buffer = context.user_data.get('profiles_buffer')
+    wrapped = False
+    if not buffer:
+        cursor = context.user_data.get('profiles_cursor', 0)
+        buffer = (
+            fetch_recommended(viewer)
+            or fetch_profiles(viewer, cursor)
+            or fetch_profiles(viewer, 0)
+        )
+        if buffer:
+            context.user_data['profiles_seen_all'] = False
+        else:
+            # Непросмотренных не осталось: начинаем круг с начала
+            if context.user_data.get('profiles_seen_all'):
+                buffer = fetch_profiles(viewer, cursor, unseen_only=False)
+            context.user_data['profiles_seen_all'] = True
+            if not buffer:
+                buffer = fetch_profiles(viewer, 0, unseen_only=False)
+                wrapped = True
+        if not buffer:
+            return None, False
+
+    profile = buffer.pop(0)
+    context.user_data['profiles_buffer'] = buffer
+    if not profile.get('recommended'):
+        context.user_data['profiles_cursor'] = profile['pk']
+    ProfileView.objects.bulk_create(
+        [ProfileView(viewer_id=viewer.id, viewed_id=profile['pk'])],
+        ignore_conflicts=True
+    )
+    return profile, wrapped
 
 
 def view_profiles(update, context):
     query = update.callback_query
     query.answer()
 
-    participant = Participant.objects.get(telegram_id=query.from_user.id)
-    other_profiles = Participant.objects.exclude(telegram_id=query.from_user.id).filter(bio__isnull=False)
+    participant = get_participant(query.from_user.id)
+    profile, wrapped = next_profile(context, participant)
 
-    if not other_profiles.exists():
+    if profile is None:
         query.edit_message_text("😢 Пока нет анкет для просмотра.")
         return ConversationHandler.END
 
-    # Получаем список всех подходящих профилей
-    available_profiles = list(other_profiles)
-
-    # Если в контексте нет списка просмотренных профилей, создаем его
-    if 'viewed_profiles' not in context.user_data:
-        context.user_data['viewed_profiles'] = []
+    context.user_data['current_profile_id'] = profile['telegram_id']
 
-    # Ищем профиль, который еще не был показан
-    for profile in available_profiles:
-        if profile.telegram_id not in context.user_data['viewed_profiles']:
-            context.user_data['current_profile_id'] = profile.telegram_id
-            context.user_data['viewed_profiles'].append(profile.telegram_id)
-
-            text = (
-                f"👤 <b>{profile.name}</b>\n"
-                f"💼 {profile.bio}\n\n"
-                f"Хотите связаться?"
-            )
-
-            try:
-                query.edit_message_text(
-                    text,
-                    reply_markup=InlineKeyboardMarkup([
-                        [
-                            InlineKeyboardButton("📩 Запросить контакт", callback_data="request_contact"),
-                            InlineKeyboardButton("➡️ Дальше", callback_data="next_profile")
-                        ]
-                    ]),
-                    parse_mode='HTML'
-                )
-                return VIEWING_PROFILE
-            except Exception as e:
-                print(f"Ошибка при редактировании сообщения: {e}")
-                return VIEWING_PROFILE
+    text = (
+        f"👤 <b>{profile['name']}</b>\n"
+        f"💼 {profile['bio']}\n\n"
+        f"Хотите связаться?"
+    )
+    if wrapped:
+        text = "🔄 Вы просмотрели все анкеты. Начнем сначала!\n\n" + text
 
-    # Если все профили просмотрены
-    context.user_data['viewed_profiles'] = []  # Сбрасываем список просмотренных
-    query.edit_message_text("😢 Вы просмотрели все анкеты. Начнем сначала!")
-    return view_profiles(update, context)  # Рекурсивно запускаем снова
+    try:
+        query.edit_message_text(
+            text,
+            reply_markup=InlineKeyboardMarkup([
+                [
+                    InlineKeyboardButton("📩 Запросить контакт", callback_data="request_contact"),
+                    InlineKeyboardButton("➡️ Дальше", callback_data="next_profile")
+                ]
+            ]),
+            parse_mode='HTML'
+        )
+    except Exception as e:
+        logger.warning('Ошибка при редактировании сообщения: %s', e)
+    return VIEWING_PROFILE
 
 
 def handle_profile_actions(update, context):
@@ -1521,7 +1538,7 @@ def handle_profile_actions(update, context):
     query.answer()
 
     if query.data == "request_contact":
-        profile = Participant.objects.get(telegram_id=context.user_data['current_profile_id'])
+        profile = get_participant(context.user_data['current_profile_id'])
         query.edit_message_text(
             f"✉️ Контакт участника:\n"
             f"@{profile.telegram_username}" if profile.telegram_username else
@@ -1532,15 +1549,48 @@ def handle_profile_actions(update, context):
         return view_profiles(update, context)
 
 
-def back_to_menu(update, context):
+def search_profiles_start(update, context):
+    query = update.callback_query
+    query.answer()
+    query.edit_message_text(
+        "🔎 <b>Поиск по анкетам</b>\n\n"
+        "Напишите, кого ищете, например: <i>Django, ML, DevOps</i>",
+        parse_mode='HTML'
+    )
+    return AWAITING_SEARCH_QUERY
+
+
+def search_profiles_query(update, context):
     user = update.message.from_user
-    participant, _ = Participant.objects.get_or_create(
-        telegram_id=user.id,
-        defaults={
-            'telegram_username': user.username,
-            'name': user.first_name or 'Аноним'
-        }
+    participant = get_or_create_participant(user)
+    results = search_profiles(update.message.text, exclude_id=participant.id)
+
+    if results:
+        lines = ["🔎 <b>Нашлись участники:</b>\n"]
+        for profile in results:
+            contact = f" — @{profile['telegram_username']}" if profile['telegram_username'] else ""
+            lines.append(
+                f"👤 <b>{escape(profile['name'])}</b>{escape(contact)}\n"
+                f"💼 {escape(profile['bio'])}\n"
+            )
+        text = "\n".join(lines)
+    else:
+        text = "😢 Никого не нашлось. Попробуйте другие слова."
+
+    update.message.reply_text(
+        text,
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔎 Искать ещё", callback_data="search_profiles")],
+            [InlineKeyboardButton("👀 Познакомиться", callback_data="view_profiles")]
+        ]),
+        parse_mode='HTML'
     )
+    return ConversationHandler.END
+
+
+def back_to_menu(update, context):
+    user = update.message.from_user
+    participant = get_or_create_participant(user)
     update.message.reply_text(
         "Выберите действие:",
         reply_markup=get_main_keyboard(participant)
@@ -1555,7 +1605,9 @@ def setup_dispatcher(dp):
 
     # ConversationHandler: Вопрос спикеру
     ask_speaker_conv = ConversationHandler(
-        entry_points=[MessageHandler(Filters.regex('^❓ Задать вопрос спикеру$'), ask_speaker_start)],
+        name='ask_speaker',
+        persistent=True,
+        entry_points=[MessageHandler(Filters.text(['❓ Задать вопрос спикеру']), ask_speaker_start)],
         states={
             SELECTING_SPEAKER: [
                 CallbackQueryHandler(ask_speaker_select, pattern='^ask_'),
@@ -1580,7 +1632,9 @@ def setup_dispatcher(dp):
 
     # ConversationHandler: Регистрация участника
     participant_registration_conv = ConversationHandler(
-        entry_points=[MessageHandler(Filters.regex('^👤 Зарегистрироваться участником$'), register_participant_start)],
+        name='participant_registration',
+        persistent=True,
+        entry_points=[MessageHandler(Filters.text(['👤 Зарегистрироваться участником']), register_participant_start)],
         states={
             SELECTING_EVENT_PARTICIPANT: [
                 CallbackQueryHandler(register_participant_select_event, pattern='^event_'),
@@ -1592,14 +1646,17 @@ def setup_dispatcher(dp):
         },
         fallbacks=[
             CommandHandler('cancel', cancel),
-            MessageHandler(Filters.regex('^🔙 Назад$'), back_to_menu)
+            MessageHandler(Filters.text(['🔙 Назад']), back_to_menu)
         ],
+        allow_reentry=True,
     )
     dp.add_handler(participant_registration_conv)
 
     # ConversationHandler: Регистрация спикера
     registration_conv = ConversationHandler(
-        entry_points=[MessageHandler(Filters.regex('^🎤 Зарегистрироваться спикером$'), register_speaker_start)],
+        name='speaker_registration',
+        persistent=True,
+        entry_points=[MessageHandler(Filters.text(['🎤 Зарегистрироваться спикером']), register_speaker_start)],
         states={
             SELECTING_EVENT: [
                 CallbackQueryHandler(register_speaker_select_event, pattern='^event_'),
@@ -1611,14 +1668,17 @@ def setup_dispatcher(dp):
         },
         fallbacks=[
             CommandHandler('cancel', cancel),
-            MessageHandler(Filters.regex('^🔙 Назад$'), back_to_menu)
+            MessageHandler(Filters.text(['🔙 Назад']), back_to_menu)
         ],
+        allow_reentry=True,
     )
     dp.add_handler(registration_conv)
 
     # ConversationHandler: Мои мероприятия
     my_events_conv = ConversationHandler(
-        entry_points=[MessageHandler(Filters.regex('^📋 Мои мероприятия$'), my_events_start)],
+        name='my_events',
+        persistent=True,
+        entry_points=[MessageHandler(Filters.text(['📋 Мои мероприятия']), my_events_start)],
         states={
             SHOW_MY_EVENTS: [
                 CallbackQueryHandler(my_events_select_event, pattern='^my_event_'),
@@ -1629,11 +1689,14 @@ def setup_dispatcher(dp):
             ],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
+        allow_reentry=True,
     )
     dp.add_handler(my_events_conv)
 
     # ConversationHandler: Донаты (фикс и кастом)
     donate_conv_handler = ConversationHandler(
+        name='donate',
+        persistent=True,
         entry_points=[CallbackQueryHandler(handle_custom_donate_callback, pattern='^donate_custom$')],
         states={
             CHOOSE_CUSTOM_AMOUNT: [MessageHandler(Filters.text & ~Filters.command, handle_custom_amount)]
@@ -1644,7 +1707,9 @@ def setup_dispatcher(dp):
 
     # ConversationHandler: Подписка
     subscribe_conv = ConversationHandler(
-        entry_points=[MessageHandler(Filters.regex('^✅ Подписаться на рассылку$'), subscribe_start)],
+        name='subscribe',
+        persistent=True,
+        entry_points=[MessageHandler(Filters.text(['✅ Подписаться на рассылку']), subscribe_start)],
         states={
             SUBSCRIBING: [
                 CallbackQueryHandler(subscribe_confirm, pattern='^subscribe_(confirm|cancel)$'),
@@ -1654,12 +1719,15 @@ def setup_dispatcher(dp):
             CommandHandler('cancel', cancel),
             CallbackQueryHandler(subscribe_confirm, pattern='^subscribe_cancel$'),
         ],
+        allow_reentry=True,
     )
     dp.add_handler(subscribe_conv)
 
     # ConversationHandler: Отписка
     unsubscribe_conv = ConversationHandler(
-        entry_points=[MessageHandler(Filters.regex('^❌ Отписаться от рассылки$'), unsubscribe_start)],
+        name='unsubscribe',
+        persistent=True,
+        entry_points=[MessageHandler(Filters.text(['❌ Отписаться от рассылки']), unsubscribe_start)],
         states={
             UNSUBSCRIBING: [
                 CallbackQueryHandler(unsubscribe_confirm, pattern='^unsubscribe_(confirm|cancel)$'),
@@ -1669,12 +1737,15 @@ def setup_dispatcher(dp):
             CommandHandler('cancel', cancel),
             CallbackQueryHandler(unsubscribe_confirm, pattern='^unsubscribe_cancel$'),
         ],
+        allow_reentry=True,
     )
     dp.add_handler(unsubscribe_conv)
 
     # ConversationHandler: Рассылка
     mailing_conv = ConversationHandler(
-        entry_points=[MessageHandler(Filters.regex('^📢 Сделать рассылку$'), mailing_start)],
+        name='mailing',
+        persistent=True,
+        entry_points=[MessageHandler(Filters.text(['📢 Сделать рассылку']), mailing_start)],
         states={
             MAILING: [
                 MessageHandler(Filters.text & ~Filters.command, mailing_receive_message),
@@ -1687,69 +1758,92 @@ def setup_dispatcher(dp):
             CommandHandler('cancel', cancel),
             CallbackQueryHandler(mailing_confirm, pattern='^mailing_cancel$'),
         ],
+        allow_reentry=True,
     )
     dp.add_handler(mailing_conv)
 
     # ConversationHandler: Нетворкинг
     networking_conv = ConversationHandler(
+        name='networking',
+        persistent=True,
         entry_points=[
-            MessageHandler(Filters.regex('^🙋 Пообщаться$'), networking),
+            MessageHandler(Filters.text(['🙋 Пообщаться']), networking),
             CallbackQueryHandler(start_fill_profile, pattern='^fill_profile$'),
-            CallbackQueryHandler(view_profiles, pattern='^view_profiles$')
+            CallbackQueryHandler(view_profiles, pattern='^view_profiles$'),
+            CallbackQueryHandler(search_profiles_start, pattern='^search_profiles$')
         ],
         states={
             AWAITING_NAME: [MessageHandler(Filters.text & ~Filters.command, save_name)],
             AWAITING_BIO: [MessageHandler(Filters.text & ~Filters.command, save_bio)],
-            VIEWING_PROFILE: [CallbackQueryHandler(handle_profile_actions)]
+            VIEWING_PROFILE: [CallbackQueryHandler(handle_profile_actions)],
+            AWAITING_SEARCH_QUERY: [
+                MessageHandler(
+                    Filters.text & ~Filters.command & ~Filters.text(['🔙 Назад']),
+                    search_profiles_query
+                )
+            ]
         },
         fallbacks=[
             CommandHandler('cancel', cancel),
-            MessageHandler(Filters.regex('^🔙 Назад$'), back_to_menu)
+            MessageHandler(Filters.text(['🔙 Назад']), back_to_menu)
         ],
         allow_reentry=True
     )
     dp.add_handler(networking_conv)
 
-    # Обработчики главного меню
-    dp.add_handler(MessageHandler(Filters.regex('^📅 Мероприятие$'), event_menu))
-    dp.add_handler(MessageHandler(Filters.regex('^📝 Регистрация$'), registration_menu))
-    dp.add_handler(MessageHandler(Filters.regex('^🙋 Пообщаться$'), networking))  # на случай одиночного входа
-    dp.add_handler(MessageHandler(Filters.regex('^🎁 Поддержать$'), donate))
-    dp.add_handler(MessageHandler(Filters.regex('^❓ Мои вопросы$'), show_unanswered_questions))
-    dp.add_handler(MessageHandler(Filters.regex('^📢 Сделать рассылку$'), mailing_start))
-
+    # Кнопки меню вне диалогов: один обработчик со словарём подписей
+    menu = MenuRouter()
+    # Главное меню
+    menu.add_route('📅 Мероприятие', event_menu)
+    menu.add_route('📝 Регистрация', registration_menu)
+    menu.add_route('🎁 Поддержать', donate)
+    menu.add_route('❓ Мои вопросы', show_unanswered_questions)
     # Подменю "Мероприятие"
-    dp.add_handler(MessageHandler(Filters.regex('^📜 Программа$'), program))
-    dp.add_handler(MessageHandler(Filters.regex('^📋 Мои мероприятия$'), my_events_start))
-    dp.add_handler(MessageHandler(Filters.regex('^❓ Задать вопрос спикеру$'), ask_speaker_start))
-    dp.add_handler(MessageHandler(Filters.regex('^🎤 Кто выступает сейчас\\?$'), current_speaker))
-    dp.add_handler(MessageHandler(Filters.regex('^✅ Подписаться на рассылку$'), subscribe_start))
-    dp.add_handler(MessageHandler(Filters.regex('^❌ Отписаться от рассылки$'), unsubscribe_start))
-    dp.add_handler(MessageHandler(Filters.regex('^🔙 Назад$'), back_to_menu))
-
-    # Подменю "Регистрация"
-    dp.add_handler(MessageHandler(Filters.regex('^👤 Зарегистрироваться участником$'), register_participant_start))
-    dp.add_handler(MessageHandler(Filters.regex('^🎤 Зарегистрироваться спикером$'), register_speaker_start))
-    dp.add_handler(MessageHandler(Filters.regex('^🔙 Назад$'), back_to_menu))
+    menu.add_route('📜 Программа', program)
+    menu.add_route('🎤 Кто выступает сейчас?', current_speaker)
+    menu.add_route('🔙 Назад', back_to_menu)
+    dp.add_handler(menu)
 
     # Обработчики для спикеров
     setup_speaker_handlers(dp)
     # Обработчики для донатов
     dp.add_handler(CallbackQueryHandler(handle_fixed_donate_callback, pattern='^donate_\\d+$'))
 
+    # Замеры времени и SQL-запросов для всех обработчиков выше
+    instrument_dispatcher(dp)
     return dp
 
 
-def start_bot():
-    updater = Updater(settings.TG_BOT_TOKEN, use_context=True)
-    dp = updater.dispatcher
-
-    updater.bot.set_my_commands([
+def start_bot(mode='polling'):
+    bot = get_bot()
+    bot.set_my_commands([
         BotCommand("start", "Главное меню"),
         BotCommand("help", "Помощь по боту"),
         BotCommand("cancel", "Отмена текущего действия"),
     ])
 
-    dp = setup_dispatcher(dp)
+    if mode == 'webhook':
+        # Обновления принимает Django-приложение (meetup.asgi), здесь только регистрируем адрес
+        set_webhook(bot)
+        logger.info('Webhook установлен: %s', get_webhook_url())
+        return
+
+    if settings.METRICS_PORT:
+        start_metrics_server(settings.METRICS_PORT, settings.METRICS_HOST, settings.METRICS_TOKEN)
+
+    persistence = DjangoPersistence()
+    # После падения прошлого процесса его аренда ещё действует; ждём её, а не падаем
+    persistence.acquire()
+    dispatcher = OrderedDispatcher(
+        bot, queue.Queue(), use_context=True, persistence=persistence
+    )
+    # Сбрасываем буфер и отпускаем аренду состояний при остановке процесса
+    atexit.register(persistence.stop)
+    updater = Updater(dispatcher=dispatcher)
+    setup_dispatcher(updater.dispatcher)
+
+    # Досылаем уведомления, оставшиеся в outbox после прошлого запуска
+    run_delivery_in_background(deliver_pending_notifications, bot)
+
     updater.start_polling()
     updater.idle()
@@ -1,3 +1,1014 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import pickle
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from telegram import Update, User
+from telegram.ext import ConversationHandler, DictPersistence, Dispatcher, ExtBot, Filters, MessageHandler
+from telegram.utils.request import Request
+
+from events_bot.background import run_delivery_in_background, run_in_background
+from events_bot.bot_client import PoolStats
+from events_bot.broadcast import Broadcast, RateLimiter
+from events_bot.cache import active_event_cache, get_active_event, get_participant, participant_cache
+from events_bot.checks import PRAGMA_HINTS, check_sqlite_pragmas, check_telegram_pool_size
+from events_bot.handler_pool import KeyedPool, handler_pool_stats
+from events_bot.ical import feed_validators, participant_token
+from events_bot.metrics import start_metrics_server
+from events_bot.models import (
+    Donation, Event, EventNotification, NetworkingStats, Participant, PersistenceLease, Question, Speaker,
+    TimeSlot, UserData,
+)
+from events_bot.outbox import deliver_pending_notifications, enqueue_event_notification
+from events_bot.persistence import DjangoPersistence, PersistenceLocked
+from events_bot.recommendations import Recommender, tokenize
+from events_bot.search import MATCH_IDS_SQL, build_match_query, search_profiles
+from events_bot.schedule_import import ScheduleImportError, import_schedule, parse_schedule
+from events_bot import telegram_bot
+from events_bot.telegram_bot import fetch_profiles, setup_dispatcher
+
+# Объёмы данных для бенчмарков
+PARTICIPANTS = 5000
+SUBSCRIBERS = 1500
+SPEAKERS = 20
+TIME_SLOTS = 40
+
+# Бюджеты на один вызов обработчика в прогретом состоянии:
+# (мс, SQL-запросов, SQL-запросов с холодными кэшами, вызовов Telegram API).
+# Рассылка читает подписчиков порциями по TG_BROADCAST_CHUNK_SIZE, запрос на порцию.
+# Время умножается на BENCHMARK_TIME_FACTOR для медленных машин.
+BUDGETS = {
+    'start': (15, 0, 5, 1),
+    'program': (15, 0, 4, 1),
+    'current_speaker': (15, 0, 4, 1),
+    'view_profiles': (30, 3, 5, 2),
+    'mailing_confirm': (3000, 6, 6, SUBSCRIBERS + 5),
+}
+REPEAT = 20
+TIME_FACTOR = float(os.environ.get('BENCHMARK_TIME_FACTOR', 1))
+
+
+class RecordingRequest(Request):
+    """Request без сети: запоминает вызовы API и отвечает правдоподобными объектами."""
+
+    __slots__ = ('calls',)
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def post(self, url, data, timeout=None):
+        method = url.rsplit('/', 1)[1]
+        self.calls.append((method, data))
+        if method in ('sendMessage', 'editMessageText'):
+            return {
+                'message_id': 100,
+                'date': 0,
+                'chat': {'id': data.get('chat_id', 1), 'type': 'private'},
+                'text': data.get('text'),
+            }
+        return True
+
+
+def make_bot():
+    bot = ExtBot('123:abc', request=RecordingRequest())
+    bot._bot = User(1, 'Meetup', True, username='meetup_bot')
+    return bot
+
+
+class UpdateFactory:
+    def __init__(self, bot):
+        self.bot = bot
+        self.update_id = 0
+
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+
+    def message(self, user_id, text):
+        self.update_id += 1
+        message = {
+            'message_id': self.update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        return Update.de_json({'update_id': self.update_id, 'message': message}, self.bot)
+
+    def callback(self, user_id, data):
+        self.update_id += 1
+        return Update.de_json({
+            'update_id': self.update_id,
+            'callback_query': {
+                'id': str(self.update_id),
+                'chat_instance': 'benchmark',
+                'data': data,
+                'from': self._user(user_id),
+                'message': {
+                    'message_id': 50,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'text': '…',
+                },
+            },
+        }, self.bot)
+
+
+def run_broadcast_inline(broadcast, on_done=None):
+    result = broadcast.run()
+    if on_done:
+        on_done(result)
+
+
+@override_settings(TG_BROADCAST_PROGRESS_INTERVAL=3600)
+@mock.patch('events_bot.broadcast.rate_limiter', RateLimiter(1_000_000))
+class HandlerBenchmarkTests(TestCase):
+    """Бенчмарки обработчиков бота на объёмах, близких к реальному митапу."""
+
+    MANAGER_ID = 1
+    results = []
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        event = Event.objects.create(
+            title='Python Meetup', description='Бенчмарк', date=now.date(), is_active=True
+        )
+        speakers = Speaker.objects.bulk_create([
+            Speaker(name=f'Спикер {i}', telegram_username=f'speaker{i}', telegram_id=10_000 + i)
+            for i in range(SPEAKERS)
+        ])
+        event.speakers.set(speakers)
+        first_start = now - timedelta(hours=1)
+        TimeSlot.objects.bulk_create([
+            TimeSlot(
+                event=event,
+                speaker=speakers[i % SPEAKERS],
+                title=f'Доклад {i}',
+                description='',
+                start_time=first_start + timedelta(minutes=20 * i),
+                end_time=first_start + timedelta(minutes=20 * i + 15),
+            )
+            for i in range(TIME_SLOTS)
+        ])
+        Participant.objects.bulk_create([
+            Participant(
+                telegram_id=100_000 + i,
+                name=f'Участник {i}',
+                bio=f'Python-разработчик, интересы: тема{i % 50}',
+                is_subscribed=i < SUBSCRIBERS,
+            )
+            for i in range(PARTICIPANTS)
+        ])
+        Participant.objects.create(
+            telegram_id=cls.MANAGER_ID, name='Организатор', bio='Организатор митапа',
+            is_event_manager=True,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        lines = ['', 'Обработчик         мс/вызов  SQL  SQL(холодный)  API']
+        for name, elapsed, queries, cold_queries, api_calls in cls.results:
+            lines.append(f'{name:<18} {elapsed:>8.2f} {queries:>4} {cold_queries:>14} {api_calls:>4}')
+        sys.stderr.write('\n'.join(lines) + '\n')
+
+    def setUp(self):
+        participant_cache.clear()
+        active_event_cache.invalidate()
+        self.bot = make_bot()
+        self.updates = UpdateFactory(self.bot)
+        self.dispatcher = Dispatcher(
+            self.bot, queue.Queue(), use_context=True, persistence=DictPersistence()
+        )
+        setup_dispatcher(self.dispatcher)
+        patcher = mock.patch('events_bot.telegram_bot.recommender')
+        patcher.start().recommend.return_value = []
+        self.addCleanup(patcher.stop)
+
+    def process(self, update):
+        calls = self.bot.request.calls
+        sent_before = len(calls)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            self.dispatcher.process_update(update)
+            elapsed = time.perf_counter() - started
+        return elapsed, len(queries), len(calls) - sent_before
+
+    def benchmark(self, name, make_update, prepare=None):
+        """Первый вызов — с холодными кэшами, затем REPEAT прогретых вызовов."""
+        if prepare:
+            prepare()
+        _, cold_queries, _ = self.process(make_update())
+
+        total, max_queries, max_api_calls = 0.0, 0, 0
+        for _ in range(REPEAT):
+            if prepare:
+                prepare()
+            elapsed, queries, api_calls = self.process(make_update())
+            total += elapsed
+            max_queries = max(max_queries, queries)
+            max_api_calls = max(max_api_calls, api_calls)
+        elapsed_ms = total / REPEAT * 1000
+        self.results.append((name, elapsed_ms, max_queries, cold_queries, max_api_calls))
+
+        budget_ms, budget_queries, budget_cold_queries, budget_api_calls = BUDGETS[name]
+        self.assertLessEqual(elapsed_ms, budget_ms * TIME_FACTOR, f'{name}: время')
+        self.assertLessEqual(max_queries, budget_queries, f'{name}: SQL-запросы')
+        self.assertLessEqual(cold_queries, budget_cold_queries, f'{name}: SQL-запросы с холодными кэшами')
+        self.assertLessEqual(max_api_calls, budget_api_calls, f'{name}: вызовы API')
+
+    def test_start(self):
+        self.benchmark('start', lambda: self.updates.message(self.MANAGER_ID, '/start'))
+
+    def test_program(self):
+        self.benchmark('program', lambda: self.updates.message(self.MANAGER_ID, '📜 Программа'))
+
+    def test_current_speaker(self):
+        self.benchmark(
+            'current_speaker',
+            lambda: self.updates.message(self.MANAGER_ID, '🎤 Кто выступает сейчас?')
+        )
+
+    def test_view_profiles(self):
+        self.benchmark(
+            'view_profiles',
+            lambda: self.updates.callback(self.MANAGER_ID, 'view_profiles')
+        )
+
+    @mock.patch.object(Broadcast, 'start', run_broadcast_inline)
+    def test_mailing_confirm(self):
+        def prepare():
+            self.dispatcher.process_update(self.updates.message(self.MANAGER_ID, '📢 Сделать рассылку'))
+            self.dispatcher.process_update(self.updates.message(self.MANAGER_ID, 'Начинаем через 10 минут'))
+
+        self.benchmark(
+            'mailing_confirm',
+            lambda: self.updates.callback(self.MANAGER_ID, 'mailing_confirm'),
+            prepare=prepare,
+        )
+
+
+@override_settings(TG_BROADCAST_WORKERS=2)
+@mock.patch('events_bot.broadcast.rate_limiter', RateLimiter(1_000_000))
+class OutboxTests(TestCase):
+    SUBSCRIBERS = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = Event.objects.create(title='Python Meetup', description='', date=timezone.now().date())
+        Participant.objects.bulk_create([
+            Participant(telegram_id=300_000 + i, name=f'Подписчик {i}', is_subscribed=True)
+            for i in range(cls.SUBSCRIBERS)
+        ])
+
+    def sent_chat_ids(self, bot):
+        return sorted(data['chat_id'] for method, data in bot.request.calls if method == 'sendMessage')
+
+    def test_concurrent_drains_send_once(self):
+        enqueue_event_notification(self.event)
+        bot = make_bot()
+        send_batch = Broadcast.send_batch
+        drains = {}
+
+        def send_batch_with_second_drain(broadcast, chat_ids):
+            # Пока первый воркер отправляет свою порцию, outbox разбирает второй
+            if 'second' not in drains:
+                drains['second'] = None
+                drains['second'] = deliver_pending_notifications(bot, batch_size=2)
+            return send_batch(broadcast, chat_ids)
+
+        with mock.patch.object(Broadcast, 'send_batch', send_batch_with_second_drain):
+            drains['first'] = deliver_pending_notifications(bot, batch_size=2)
+
+        self.assertGreater(drains['second'], 0)
+        self.assertEqual(drains['first'] + drains['second'], self.SUBSCRIBERS)
+        self.assertEqual(self.sent_chat_ids(bot), [300_000 + i for i in range(self.SUBSCRIBERS)])
+        self.assertFalse(self.event.notifications.exclude(status=EventNotification.SENT).exists())
+
+    def test_expired_claim_is_retried(self):
+        enqueue_event_notification(self.event)
+        now = timezone.now()
+        notifications = self.event.notifications.order_by('pk')
+        stuck, fresh = notifications[0], notifications[1]
+        EventNotification.objects.filter(pk=stuck.pk).update(
+            status=EventNotification.SENDING, claimed_at=now - timedelta(hours=1)
+        )
+        EventNotification.objects.filter(pk=fresh.pk).update(
+            status=EventNotification.SENDING, claimed_at=now
+        )
+
+        bot = make_bot()
+        self.assertEqual(deliver_pending_notifications(bot), self.SUBSCRIBERS - 1)
+        self.assertNotIn(fresh.participant.telegram_id, self.sent_chat_ids(bot))
+        self.assertIn(stuck.participant.telegram_id, self.sent_chat_ids(bot))
+
+
+class ParticipantCacheTests(TestCase):
+    def test_invalidated_after_commit(self):
+        participant = Participant.objects.create(telegram_id=400_000, name='Участник')
+        participant_cache.clear()
+        get_participant(participant.telegram_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            participant.name = 'Новое имя'
+            participant.save()
+            # До коммита другие потоки ещё видят старую строку, кэш не трогаем
+            self.assertIsNotNone(participant_cache.get(participant.telegram_id))
+        self.assertIsNone(participant_cache.get(participant.telegram_id))
+        self.assertEqual(get_participant(participant.telegram_id).name, 'Новое имя')
+
+
+class ActiveEventCacheTests(TestCase):
+    def test_invalidated_after_commit(self):
+        event = Event.objects.create(title='Митап', description='', date=timezone.now().date(), is_active=True)
+        active_event_cache.invalidate()
+        self.assertEqual(get_active_event().title, 'Митап')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event.title = 'Python Meetup'
+            event.save()
+            self.assertEqual(get_active_event().title, 'Митап')
+        self.assertEqual(get_active_event().title, 'Python Meetup')
+
+
+class ProfileFeedTests(TestCase):
+    def test_empty_bio_skipped(self):
+        viewer, with_bio, _ = Participant.objects.bulk_create([
+            Participant(telegram_id=500_000, name='Смотрящий', bio='Бэкенд'),
+            Participant(telegram_id=500_001, name='С анкетой', bio='Django, PostgreSQL'),
+            Participant(telegram_id=500_002, name='Без анкеты', bio=''),
+        ])
+        self.assertEqual([row['pk'] for row in fetch_profiles(viewer, 0)], [with_bio.pk])
+
+    @mock.patch('events_bot.networking.on_profile_added')
+    def test_profile_counter_hook_after_commit(self, on_profile_added):
+        with self.captureOnCommitCallbacks(execute=True):
+            Participant.objects.create(telegram_id=500_003, name='Новичок', bio='Data science')
+            on_profile_added.assert_not_called()
+        on_profile_added.assert_called_once_with(1)
+
+    def profiles_count(self):
+        return NetworkingStats.objects.values_list('profiles_count', flat=True).get()
+
+    def test_deferred_bio_keeps_counter(self):
+        participant = Participant.objects.create(telegram_id=500_004, name='Анна', bio='Django')
+        self.assertEqual(self.profiles_count(), 1)
+
+        deferred = Participant.objects.only('name').get(pk=participant.pk)
+        deferred.name = 'Мария'
+        with CaptureQueriesContext(connection) as queries:
+            deferred.save()
+        self.assertEqual(self.profiles_count(), 1)
+        # Без изменения счётчика сохранение не открывает транзакцию
+        self.assertFalse([query for query in queries if 'SAVEPOINT' in query['sql']])
+
+        deferred = Participant.objects.only('name').get(pk=participant.pk)
+        deferred.bio = ''
+        deferred.save()
+        self.assertEqual(self.profiles_count(), 0)
+
+    def test_bio_outside_update_fields_ignored(self):
+        participant = Participant.objects.create(telegram_id=500_005, name='Анна', bio='Django')
+        participant.bio = ''
+        participant.name = 'Мария'
+        participant.save(update_fields=['name'])
+        self.assertEqual(self.profiles_count(), 1)
+
+
+class SearchTests(TestCase):
+    def indexed(self, text):
+        with connection.cursor() as cursor:
+            cursor.execute(MATCH_IDS_SQL, [build_match_query(text)])
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_triggers_keep_index_in_sync(self):
+        participant = Participant.objects.create(telegram_id=600_000, name='Анна', bio='Django и PostgreSQL')
+        self.assertEqual(self.indexed('django'), {participant.pk})
+
+        participant.bio = 'Rust'
+        participant.save()
+        self.assertEqual(self.indexed('django'), set())
+        self.assertEqual(self.indexed('rust'), {participant.pk})
+
+        # update() минует сигналы, индекс обновляют триггеры базы
+        Participant.objects.filter(pk=participant.pk).update(name='Мария')
+        self.assertEqual(self.indexed('анна'), set())
+        self.assertEqual(self.indexed('мария'), {participant.pk})
+
+        participant.delete()
+        self.assertEqual(self.indexed('rust'), set())
+
+    def test_match_query_escapes_syntax(self):
+        self.assertEqual(build_match_query('Django, ML'), '"django"* OR "ml"*')
+        self.assertEqual(build_match_query('"NEAR(a b)" AND -c:*'), '"near"* OR "a"* OR "b"* OR "and"* OR "c"*')
+        self.assertEqual(build_match_query('"\'*^()'), '')
+
+    def test_hostile_input_does_not_break_search(self):
+        Participant.objects.create(telegram_id=600_001, name='Анна', bio='Django')
+        for text in ('django"', 'NOT django', 'bio:django', 'django*)', '^django'):
+            with self.subTest(text=text):
+                self.assertEqual([row['name'] for row in search_profiles(text)], ['Анна'])
+
+    def test_admin_search_ranked_by_bm25(self):
+        # Совпадение в имени весит больше; по умолчанию список идёт от новых к старым
+        best = Participant.objects.create(telegram_id=600_002, name='Django Разработчик', bio='Django, Django')
+        weak = Participant.objects.create(
+            telegram_id=600_003, name='Анна', bio='Бэкенд, немного Django, много PostgreSQL и Redis'
+        )
+        Participant.objects.create(telegram_id=600_004, name='Борис', bio='Flutter')
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+        response = self.client.get('/admin/events_bot/participant/', {'q': 'django'})
+        self.assertEqual([row.pk for row in response.context['cl'].result_list], [best.pk, weak.pk])
+
+        # Явная сортировка по колонке (имя по убыванию) важнее релевантности
+        response = self.client.get('/admin/events_bot/participant/', {'q': 'django', 'o': '-1'})
+        self.assertEqual([row.pk for row in response.context['cl'].result_list], [weak.pk, best.pk])
+
+
+class RecommenderTests(SimpleTestCase):
+    WORDS = [f'тема{i}' for i in range(40)]
+
+    def make_recommender(self, top_k=5):
+        return Recommender(top_k=top_k, max_features=1000, refresh_interval=3600)
+
+    def random_bios(self, rng, count):
+        return [' '.join(rng.choice(self.WORDS, size=rng.integers(3, 8))) for _ in range(count)]
+
+    def test_top_k(self):
+        recommender = self.make_recommender(top_k=2)
+        bios = ['python django postgres', 'python django', 'rust embedded', 'python flask']
+        recommender.build([1, 2, 3, 4], [tokenize(bio) for bio in bios])
+        self.assertEqual(recommender.recommend(1), [2, 4])
+        self.assertEqual(recommender.recommend(3), [])
+
+    def test_incremental_updates_match_rebuild(self):
+        rng = np.random.default_rng(7)
+        recommender = self.make_recommender()
+        bios = self.random_bios(rng, 30)
+        recommender.build(list(range(1, 31)), [tokenize(bio) for bio in bios])
+        # Новые анкеты и правки старых вперемешку, в том числе сверх начальной ёмкости
+        for participant_id, bio in zip(range(31, 71), self.random_bios(rng, 40)):
+            recommender.add_profile(participant_id, bio)
+            edited = int(rng.integers(1, participant_id))
+            recommender.add_profile(edited, self.random_bios(rng, 1)[0])
+
+        index = recommender._index
+        self.assertEqual(index.size, 70)
+        expected_idx, expected_sim = recommender._top_k_rows(index.matrix, np.arange(index.size))
+        top_idx = recommender._top_idx[:index.size]
+        top_sim = recommender._top_sim[:index.size]
+        np.testing.assert_allclose(top_sim, expected_sim, rtol=1e-5)
+        # При равном сходстве порядок может отличаться, поэтому сверяем само сходство
+        for row in range(index.size):
+            np.testing.assert_allclose(index.matrix[top_idx[row]] @ index.matrix[row], top_sim[row], rtol=1e-5)
+
+    def test_profile_added_during_rebuild_kept(self):
+        recommender = self.make_recommender(top_k=2)
+        bios = ['python django postgres', 'python django', 'rust embedded']
+        documents = [tokenize(bio) for bio in bios]
+        recommender.build([1, 2, 3], documents)
+
+        # Перестройка уже прочитала анкеты из базы, когда другой поток добавил новую
+        recommender._building = True
+        top_k_rows = recommender._top_k_rows
+
+        def add_during_build(matrix, rows):
+            recommender.add_profile(4, 'python django flask')
+            return top_k_rows(matrix, rows)
+
+        with mock.patch.object(recommender, '_top_k_rows', side_effect=add_during_build):
+            recommender.build([1, 2, 3], documents)
+        recommender._building = False
+
+        self.assertEqual(recommender.recommend(4), [2, 1])
+        self.assertIn(4, recommender.recommend(2))
+
+
+class PersistenceTests(TestCase):
+    def make_persistence(self):
+        persistence = DjangoPersistence(flush_interval=3600)
+        self.addCleanup(persistence._stopped.set)
+        return persistence
+
+    def test_round_trip(self):
+        first = self.make_persistence()
+        first.acquire()
+        first.get_user_data()[42]['name'] = 'Анна'
+        first.update_user_data(42, {'name': 'Анна'})
+        first.get_conversations('registration')[(42, 42)] = 3
+        first.update_conversation('registration', (42, 42), 3)
+        first.stop()
+
+        second = self.make_persistence()
+        self.assertEqual(second.get_user_data()[42], {'name': 'Анна'})
+        self.assertEqual(second.get_conversations('registration'), {(42, 42): 3})
+
+    def test_second_instance_refused(self):
+        first = self.make_persistence()
+        first.acquire()
+        with self.assertRaises(PersistenceLocked):
+            self.make_persistence().acquire(timeout=0)
+
+    def test_loading_does_not_take_lease(self):
+        self.make_persistence().get_user_data()
+        self.assertFalse(PersistenceLease.objects.exists())
+
+    def test_acquire_waits_for_expired_lease(self):
+        # Прошлый процесс упал, не отпустив аренду
+        PersistenceLease.objects.create(
+            name='bot', owner='crashed', expires_at=timezone.now() + timedelta(seconds=0.3)
+        )
+        second = self.make_persistence()
+        with self.assertLogs('events_bot.persistence', 'INFO'):
+            second.acquire(timeout=10)
+        self.assertEqual(PersistenceLease.objects.get().owner, second.owner)
+
+    def test_stale_instance_does_not_overwrite(self):
+        first = self.make_persistence()
+        first.acquire()
+        first.update_user_data(42, {'step': 'первый'})
+
+        # Первый процесс завис дольше аренды, состояния забрал второй
+        PersistenceLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        second = self.make_persistence()
+        second.acquire(timeout=0)
+        second.update_user_data(42, {'step': 'второй'})
+        second.flush()
+
+        with self.assertLogs('events_bot.persistence', 'ERROR'), self.assertRaises(PersistenceLocked):
+            first.flush()
+        self.assertEqual(pickle.loads(bytes(UserData.objects.get(pk=42).data)), {'step': 'второй'})
+
+
+class MenuRouterTests(TestCase):
+    # Подписи, для которых до MenuRouter был отдельный MessageHandler, и их обработчики
+    LABELS = {
+        '📅 Мероприятие': 'event_menu',
+        '📝 Регистрация': 'registration_menu',
+        '🙋 Пообщаться': 'networking',
+        '🎁 Поддержать': 'donate',
+        '❓ Мои вопросы': 'show_unanswered_questions',
+        '📢 Сделать рассылку': 'mailing_start',
+        '📜 Программа': 'program',
+        '📋 Мои мероприятия': 'my_events_start',
+        '❓ Задать вопрос спикеру': 'ask_speaker_start',
+        '🎤 Кто выступает сейчас?': 'current_speaker',
+        '✅ Подписаться на рассылку': 'subscribe_start',
+        '❌ Отписаться от рассылки': 'unsubscribe_start',
+        '🔙 Назад': 'back_to_menu',
+        '👤 Зарегистрироваться участником': 'register_participant_start',
+        '🎤 Зарегистрироваться спикером': 'register_speaker_start',
+    }
+
+    def setUp(self):
+        patcher = mock.patch.multiple(
+            telegram_bot, **{name: mock.DEFAULT for name in set(self.LABELS.values()) | {'mailing_receive_message'}}
+        )
+        self.callbacks = patcher.start()
+        self.addCleanup(patcher.stop)
+        for callback in self.callbacks.values():
+            callback.return_value = ConversationHandler.END
+
+        self.bot = make_bot()
+        self.dispatcher = Dispatcher(self.bot, queue.Queue(), use_context=True, persistence=DictPersistence())
+        setup_dispatcher(self.dispatcher)
+        # Текст, который не разобрал ни один обработчик выше, должен дойти сюда
+        self.fallback = mock.Mock()
+        self.dispatcher.add_handler(MessageHandler(Filters.text, self.fallback))
+        self.updates = UpdateFactory(self.bot)
+
+    def send(self, text, user_id=42):
+        self.dispatcher.process_update(self.updates.message(user_id, text))
+
+    def called(self):
+        return {name for name, callback in self.callbacks.items() if callback.called}
+
+    def test_labels_reach_their_callbacks(self):
+        for label, name in self.LABELS.items():
+            with self.subTest(label=label):
+                for callback in self.callbacks.values():
+                    callback.reset_mock()
+                self.send(label)
+                self.assertEqual(self.called(), {name})
+                self.fallback.assert_not_called()
+
+    def test_other_text_falls_through(self):
+        for text in ('просто текст', '📜 Программа!', 'Программа', '🔙'):
+            with self.subTest(text=text):
+                self.fallback.reset_mock()
+                self.send(text)
+                self.assertEqual(self.called(), set())
+                self.fallback.assert_called_once()
+
+    def test_conversation_reentry(self):
+        self.callbacks['mailing_start'].return_value = telegram_bot.MAILING
+        self.send('📢 Сделать рассылку')
+        # Повторное нажатие кнопки внутри диалога начинает его заново, а не считается текстом рассылки
+        self.send('📢 Сделать рассылку')
+        self.assertEqual(self.callbacks['mailing_start'].call_count, 2)
+        self.callbacks['mailing_receive_message'].assert_not_called()
+
+        self.send('Начинаем через 10 минут')
+        self.callbacks['mailing_receive_message'].assert_called_once()
+
+
+class KeyedPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = KeyedPool(4, name='test-handlers')
+        self.addCleanup(self.pool.shutdown)
+
+    def test_same_key_in_order_and_not_concurrent(self):
+        order, running, overlaps = [], set(), []
+        lock = threading.Lock()
+
+        def task(key, index):
+            with lock:
+                if key in running:
+                    overlaps.append((key, index))
+                running.add(key)
+            time.sleep(0.002)
+            with lock:
+                running.discard(key)
+                order.append((key, index))
+
+        for index in range(20):
+            for key in ('a', 'b', 'c'):
+                self.pool.submit(key, task, key, index)
+        self.pool.join()
+
+        self.assertEqual(overlaps, [])
+        for key in ('a', 'b', 'c'):
+            self.assertEqual([index for k, index in order if k == key], list(range(20)))
+
+    def test_different_keys_run_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=2)
+        for key in range(3):
+            self.pool.submit(key, barrier.wait)
+        self.pool.join()
+        self.assertFalse(barrier.broken)
+
+    def test_stats_without_ordered_dispatcher(self):
+        # Синглтон может занять обычный Dispatcher, у него нет pool
+        dispatcher = Dispatcher(make_bot(), queue.Queue(), use_context=True)
+        with mock.patch.object(Dispatcher, 'get_instance', return_value=dispatcher):
+            self.assertEqual(handler_pool_stats()['processed'], 0)
+
+
+class SQLitePragmaCheckTests(TestCase):
+    databases = {'default'}
+
+    def test_warning_hint_matches_pragma(self):
+        # Тестовая база в памяти: WAL включить нельзя
+        warnings = [
+            message for message in check_sqlite_pragmas(None, databases=['default'])
+            if message.id == 'events_bot.W001'
+        ]
+        self.assertTrue(warnings)
+        for warning in warnings:
+            name = warning.msg.split('PRAGMA ')[1].split(' ')[0]
+            self.assertEqual(warning.hint, PRAGMA_HINTS[name])
+
+
+class BackgroundTests(SimpleTestCase):
+    def test_short_jobs_not_blocked_by_delivery(self):
+        release = threading.Event()
+        done = threading.Event()
+        run_delivery_in_background(release.wait, 5)
+        run_in_background(done.set)
+        try:
+            self.assertTrue(done.wait(2))
+        finally:
+            release.set()
+
+
+class TelegramPoolTests(SimpleTestCase):
+    def test_saturation_logged(self):
+        stats = PoolStats(1)
+        stats.acquire()
+        with self.assertLogs('events_bot.bot_client', 'WARNING'):
+            stats.acquire()
+        self.assertEqual(stats.as_dict()['saturated'], 1)
+
+    @override_settings(TG_CON_POOL_SIZE=4)
+    def test_small_pool_warning(self):
+        self.assertEqual([message.id for message in check_telegram_pool_size(None)], ['events_bot.W002'])
+
+
+@override_settings(TG_WEBHOOK_SECRET='secret')
+class WebhookTests(TestCase):
+    url = '/telegram/webhook/'
+
+    def post(self, body, secret='secret'):
+        return self.client.post(
+            self.url, body, content_type='application/json',
+            HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN=secret,
+        )
+
+    def test_wrong_secret_forbidden(self):
+        self.assertEqual(self.post('{}', secret='wrong').status_code, 403)
+
+    def test_bad_json_rejected(self):
+        self.assertEqual(self.post('{not json').status_code, 400)
+
+    def test_update_enqueued(self):
+        dispatcher = mock.Mock(update_queue=queue.Queue(), bot=make_bot())
+        update = UpdateFactory(dispatcher.bot).message(42, '/start')
+        with mock.patch('events_bot.webhook.get_dispatcher', return_value=dispatcher):
+            response = self.post(json.dumps(update.to_dict()))
+        self.assertEqual(response.status_code, 200)
+        queued = dispatcher.update_queue.get_nowait()
+        self.assertEqual((queued.update_id, queued.message.text), (update.update_id, '/start'))
+
+    def test_locked_persistence_unavailable(self):
+        # Состояниями владеет другой процесс: диспетчер не собирается, Telegram повторит позже
+        PersistenceLease.objects.create(
+            name='bot', owner='other', expires_at=timezone.now() + timedelta(minutes=1)
+        )
+        with self.assertLogs('events_bot.views', 'WARNING'):
+            self.assertEqual(self.post('{"update_id": 1}').status_code, 503)
+
+
+class MetricsTests(TestCase):
+    def test_handler_metrics_exposed(self):
+        bot = make_bot()
+        dispatcher = Dispatcher(bot, queue.Queue(), use_context=True, persistence=DictPersistence())
+        setup_dispatcher(dispatcher)
+        dispatcher.process_update(UpdateFactory(bot).message(42, '/start'))
+
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('bot_handler_duration_seconds_count{handler="start"}', body)
+        self.assertIn('bot_handler_db_queries_total{handler="start"}', body)
+        self.assertIn('db_queries_total{alias="default"}', body)
+        self.assertIn('cache_hit_ratio{cache="participant"}', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_hidden_without_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+
+    def test_server_refuses_public_host_without_token(self):
+        with self.assertLogs('events_bot.metrics', 'ERROR'):
+            self.assertIsNone(start_metrics_server(0, '0.0.0.0'))
+
+    def test_server_token_required(self):
+        server = start_metrics_server(0, '127.0.0.1', token='secret')
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url, timeout=5)
+        self.assertEqual(error.exception.code, 403)
+        request = urllib.request.Request(url, headers={'Authorization': 'Bearer secret'})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            self.assertEqual(response.status, 200)
+
+
+class AdminQueryCountTests(TestCase):
+    """Страницы админки не перебирают все строки больших таблиц."""
+
+    PAGES = (
+        'event', 'speaker', 'participant', 'question', 'donation', 'timeslot', 'eventnotification',
+    )
+    # Запросов на страницу: сессия и пользователь, счётчики, строки, фильтры
+    MAX_QUERIES = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def add_rows(self, count):
+        start = Participant.objects.count()
+        now = timezone.now()
+        for i in range(start, start + count):
+            event = Event.objects.create(title=f'Митап {i}', description='', date=now.date())
+            speaker = Speaker.objects.create(name=f'Спикер {i}', telegram_username=f'speaker{i}')
+            speaker.events.add(event)
+            participant = Participant.objects.create(telegram_id=200_000 + i, name=f'Участник {i}')
+            TimeSlot.objects.create(
+                event=event, speaker=speaker, title=f'Доклад {i}', description='',
+                start_time=now, end_time=now + timedelta(minutes=15),
+            )
+            Question.objects.create(event=event, speaker=speaker, participant=participant, text='Вопрос')
+            Donation.objects.create(event=event, participant=participant, amount=100, payment_id=f'payment-{i}')
+
+    def count_queries(self, page):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/events_bot/{page}/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.client.force_login(self.admin)
+        self.add_rows(2)
+        small = {page: self.count_queries(page) for page in self.PAGES}
+        self.add_rows(10)
+        for page in self.PAGES:
+            with self.subTest(page=page):
+                queries = self.count_queries(page)
+                self.assertEqual(queries, small[page])
+                self.assertLessEqual(queries, self.MAX_QUERIES)
+
+    def test_change_forms_do_not_list_participants(self):
+        self.client.force_login(self.admin)
+        self.add_rows(5)
+        for page in ('question', 'donation', 'eventnotification'):
+            with self.subTest(page=page):
+                response = self.client.get(f'/admin/events_bot/{page}/add/')
+                self.assertEqual(response.status_code, 200)
+                self.assertNotContains(response, 'Участник 3')
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        event = Event.objects.create(title='Митап', description='', date=timezone.now().date())
+        speaker = Speaker.objects.create(name='Спикер', telegram_username='speaker')
+        for i in range(5):
+            participant = Participant.objects.create(
+                telegram_id=300_000 + i, name=f'Участник {i}', bio='Python, "Django"\nи SQL'
+            )
+            Question.objects.create(event=event, speaker=speaker, participant=participant, text=f'Вопрос {i}')
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def test_command_streams_jsonl(self):
+        out = io.StringIO()
+        call_command('export_data', 'questions', '--format', 'jsonl', '--output', '-', '--chunk-size', '2', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['text'] for row in rows], [f'Вопрос {i}' for i in range(5)])
+        self.assertEqual(rows[0]['speaker'], 'Спикер')
+
+    def test_admin_action_streams_csv(self):
+        self.client.force_login(self.admin)
+        ids = Participant.objects.order_by('pk').values_list('pk', flat=True)[:3]
+        response = self.client.post('/admin/events_bot/participant/', {
+            'action': 'export_csv', 'index': '0', '_selected_action': [str(pk) for pk in ids],
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="participants-', response['Content-Disposition'])
+        body = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows[0][:4], ['id', 'telegram_id', 'telegram_username', 'name'])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][4], 'Python, "Django"\nи SQL')
+
+    def test_csv_neutralises_formulas(self):
+        participant = Participant.objects.create(telegram_id=300_100, name='=HYPERLINK("http://x")')
+        Question.objects.create(
+            event=Event.objects.get(), speaker=Speaker.objects.get(), participant=participant, text='-1+1'
+        )
+        out = io.StringIO()
+        call_command('export_data', 'questions', '--format', 'csv', '--output', '-', stdout=out)
+        row = list(csv.reader(io.StringIO(out.getvalue().lstrip('\ufeff'))))[-1]
+        self.assertEqual((row[3], row[5]), ('\'=HYPERLINK("http://x")', "'-1+1"))
+
+        out = io.StringIO()
+        call_command('export_data', 'questions', '--format', 'jsonl', '--output', '-', stdout=out)
+        self.assertEqual(json.loads(out.getvalue().splitlines()[-1])['text'], '-1+1')
+
+
+class ScheduleImportTests(TestCase):
+    CSV = (
+        'start,end,title,speaker,speaker_username,room\n'
+        '10:00,10:30,Открытие,Анна,@anna,Большой зал\n'
+        '10:30,11:00,Асинхронность,Борис,,Большой зал\n'
+        '10:15,10:45,Типизация,Вера,,Малый зал\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.event = Event.objects.create(title='Митап', description='', date=timezone.now().date())
+        cls.anna = Speaker.objects.create(name='Анна Иванова', telegram_username='Anna')
+
+    def test_csv_import_creates_slots_and_missing_speakers(self):
+        result = import_schedule(self.event, parse_schedule(self.CSV, self.event.date))
+
+        self.assertEqual((result.slots_created, result.speakers_created), (3, 2))
+        slots = list(self.event.time_slots.select_related('speaker').order_by('start_time'))
+        self.assertEqual([slot.title for slot in slots], ['Открытие', 'Типизация', 'Асинхронность'])
+        self.assertEqual(slots[0].speaker, self.anna)
+        self.assertEqual(slots[0].room, 'Большой зал')
+        self.assertEqual(slots[0].start_time.astimezone(timezone.get_current_timezone()).hour, 10)
+        self.assertEqual(self.event.speakers.count(), 3)
+
+    def test_overlaps_abort_import(self):
+        text = self.CSV + '10:20,10:40,Ещё доклад,Анна,anna,Малый зал\n'
+        with self.assertRaises(ScheduleImportError) as raised:
+            import_schedule(self.event, parse_schedule(text, self.event.date))
+
+        errors = '\n'.join(raised.exception.errors)
+        self.assertIn('у спикера «Анна» два доклада одновременно', errors)
+        self.assertIn('зал «Малый зал» занят', errors)
+        self.assertFalse(self.event.time_slots.exists())
+        self.assertEqual(Speaker.objects.count(), 1)
+
+    def test_conflict_with_existing_slot_and_replace(self):
+        import_schedule(self.event, parse_schedule(self.CSV, self.event.date))
+        with self.assertRaises(ScheduleImportError):
+            import_schedule(self.event, parse_schedule(self.CSV, self.event.date))
+
+        result = import_schedule(self.event, parse_schedule(self.CSV, self.event.date), replace=True)
+        self.assertEqual(result.slots_deleted, 3)
+        self.assertEqual(self.event.time_slots.count(), 3)
+
+    def test_ics_parsing(self):
+        text = (
+            'BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\n'
+            'DTSTART;TZID=Europe/Moscow:20261101T100000\r\nDURATION:PT45M\r\n'
+            'SUMMARY:Доклад\\, часть 1\r\nLOCATION:Зал А\r\n'
+            'ATTENDEE;CN="Анна";ROLE=CHAIR:mailto:anna@example.com\r\n'
+            'DESCRIPTION:Длинное описание\r\n  с переносом\r\n'
+            'END:VEVENT\r\nEND:VCALENDAR\r\n'
+        )
+        [row] = parse_schedule(text, self.event.date)
+        self.assertEqual(row.title, 'Доклад, часть 1')
+        self.assertEqual(row.speaker, 'Анна')
+        self.assertEqual(row.room, 'Зал А')
+        self.assertEqual(row.description, 'Длинное описание с переносом')
+        self.assertEqual(row.end - row.start, timedelta(minutes=45))
+
+
+class CalendarFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.event = Event.objects.create(title='Митап', description='', date=now.date())
+        speaker = Speaker.objects.create(name='Анна', telegram_username='anna')
+        cls.slots = [
+            TimeSlot.objects.create(
+                event=cls.event, speaker=speaker, title=f'Доклад {i}', description='',
+                start_time=now + timedelta(hours=i), end_time=now + timedelta(hours=i, minutes=45),
+                room='Большой зал',
+            )
+            for i in range(3)
+        ]
+        cls.participant = Participant.objects.create(telegram_id=400_000, name='Участник')
+        cls.participant.registered_events.add(cls.event)
+
+    def setUp(self):
+        feed_validators.clear()
+        self.url = f'/calendar/events/{self.event.pk}.ics'
+
+    def test_event_feed_revalidates_without_queries(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertEqual(response.content.decode().count('BEGIN:VEVENT'), 3)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_slot_changes_update_validators(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.slots[0].title = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.slots[0].save()
+            # Пока изменение не закоммичено, кэш хранит старую ленту
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Новое название', response.content.decode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.slots[1].delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode().count('BEGIN:VEVENT'), 2)
+
+    def test_participant_feed_requires_signed_token(self):
+        token = participant_token(self.participant.pk)
+        response = self.client.get(f'/calendar/participants/{token}.ics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode().count('BEGIN:VEVENT'), 3)
+
+        forged = f'{self.participant.pk + 1}.{token.split(".", 1)[1]}'
+        self.assertEqual(self.client.get(f'/calendar/participants/{forged}.ics').status_code, 404)
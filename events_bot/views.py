@@ -1,11 +1,30 @@
+import json
+import logging
+
 from django.conf import settings
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.db import transaction, models
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
+from .bot_client import get_bot
+from .ical import (
+    get_event_validators,
+    get_participant_validators,
+    participant_id_from_token,
+    render_feed,
+)
+from .metrics import CONTENT_TYPE, registry
+from .persistence import PersistenceLocked
+from .webhook import enqueue_update
 from .models import Event, Speaker, TimeSlot, Participant, Question
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from environs import Env
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 
+logger = logging.getLogger(__name__)
+
 env = Env()
 env.read_env()
 BOT_TOKEN = settings.TG_BOT_TOKEN
@@ -69,7 +88,7 @@ def get_chat_id_by_username(username):
 
 
 def send_question(speaker_username, participant_id, participant_name, text):
-    bot = Bot(token=BOT_TOKEN)
+    bot = get_bot()
 
     try:
         with transaction.atomic():
@@ -110,3 +129,89 @@ def send_question(speaker_username, participant_id, participant_name, text):
         raise Exception(f"Спикер @{speaker_username} не найден")
     except Exception as e:
         raise Exception(f"Ошибка при отправке вопроса: {str(e)}")
+
+
+@csrf_exempt
+@require_POST
+def telegram_webhook(request):
+    """Принимает обновление от Telegram и передаёт его диспетчеру бота"""
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if settings.TG_WEBHOOK_SECRET and not constant_time_compare(secret, settings.TG_WEBHOOK_SECRET):
+        return HttpResponseForbidden()
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest()
+
+    try:
+        enqueue_update(data)
+    except PersistenceLocked as e:
+        # Состояния бота ведёт другой процесс; Telegram повторит доставку позже
+        logger.warning('Обновление не принято: %s', e)
+        return HttpResponse(status=503)
+    return HttpResponse()
+
+
+@require_GET
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus; без METRICS_TOKEN не отдаются"""
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not constant_time_compare(token, settings.METRICS_TOKEN):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
+
+
+def calendar_response(body, filename):
+    response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    # Календарь может хранить ленту, но перед показом должен перепроверить её по ETag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def participant_calendar_validators(token):
+    participant_id = participant_id_from_token(token)
+    return get_participant_validators(participant_id) if participant_id else None
+
+
+def event_calendar_etag(request, event_id):
+    validators = get_event_validators(event_id)
+    return validators.etag if validators else None
+
+
+def event_calendar_last_modified(request, event_id):
+    validators = get_event_validators(event_id)
+    return validators.last_modified if validators else None
+
+
+def participant_calendar_etag(request, token):
+    validators = participant_calendar_validators(token)
+    return validators.etag if validators else None
+
+
+def participant_calendar_last_modified(request, token):
+    validators = participant_calendar_validators(token)
+    return validators.last_modified if validators else None
+
+
+@require_GET
+@condition(etag_func=event_calendar_etag, last_modified_func=event_calendar_last_modified)
+def event_calendar(request, event_id):
+    """Программа мероприятия в формате iCalendar"""
+    if get_event_validators(event_id) is None:
+        raise Http404
+    event = Event.objects.only('title').get(pk=event_id)
+    return calendar_response(render_feed(event.title, [event_id]), f'event-{event_id}.ics')
+
+
+@require_GET
+@condition(etag_func=participant_calendar_etag, last_modified_func=participant_calendar_last_modified)
+def participant_calendar(request, token):
+    """Личное расписание участника: слоты мероприятий, на которые он зарегистрирован"""
+    validators = participant_calendar_validators(token)
+    if validators is None:
+        raise Http404
+    return calendar_response(render_feed('Мои мероприятия', validators.event_ids), 'my-events.ics')
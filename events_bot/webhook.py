@@ -0,0 +1,70 @@
+"""Приём обновлений Telegram через webhook внутри Django-приложения.
+
+Обновления из HTTP-запроса кладутся в очередь диспетчера, собранного
+тем же setup_dispatcher, что и при polling. Диспетчер собирается при
+первом обновлении, а не при импорте приложения. Разбирает очередь
+отдельный поток и раздаёт обновления пулу обработчиков, поэтому ответ
+Telegram отправляется сразу.
+
+Обновления обрабатывает один процесс: состояния диалогов буферизуются
+в памяти (см. persistence.py), и владеет ими тот, кто держит аренду.
+Остальные процессы отвечают на webhook 503 и подхватывают обработку,
+когда аренда освободится или истечёт, то есть служат горячим резервом,
+а не делят нагрузку. Запускайте приложение с одним воркером.
+"""
+import atexit
+import queue
+import threading
+
+from django.conf import settings
+from django.urls import reverse
+from telegram import Update
+
+from events_bot.background import run_delivery_in_background
+from events_bot.bot_client import get_bot
+from events_bot.handler_pool import OrderedDispatcher
+from events_bot.outbox import deliver_pending_notifications
+from events_bot.persistence import DjangoPersistence
+
+_dispatcher = None
+_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Создаёт и запускает диспетчер при первом обращении."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _lock:
+            if _dispatcher is None:
+                from events_bot.telegram_bot import setup_dispatcher
+
+                bot = get_bot()
+                persistence = DjangoPersistence()
+                # Не ждём: запрос Telegram не должен висеть, пока аренду держит другой процесс
+                persistence.acquire(timeout=0)
+                dp = OrderedDispatcher(bot, queue.Queue(), use_context=True, persistence=persistence)
+                setup_dispatcher(dp)
+                threading.Thread(target=dp.start, name='dispatcher', daemon=True).start()
+                run_delivery_in_background(deliver_pending_notifications, bot)
+                # Сбрасываем буфер состояний при остановке процесса
+                atexit.register(persistence.stop)
+                _dispatcher = dp
+    return _dispatcher
+
+
+def enqueue_update(data):
+    dp = get_dispatcher()
+    dp.update_queue.put(Update.de_json(data, dp.bot))
+
+
+def get_webhook_url():
+    return settings.TG_WEBHOOK_URL.rstrip('/') + reverse('telegram-webhook')
+
+
+def set_webhook(bot):
+    """Регистрирует адрес webhook в Telegram."""
+    return bot.set_webhook(
+        url=get_webhook_url(),
+        secret_token=settings.TG_WEBHOOK_SECRET or None,
+        drop_pending_updates=False,
+    )
@@ -1,12 +1,23 @@
+import argparse
 import os
 import django
-from telegram.ext import Updater
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'meetup.settings')
 django.setup()
 
+from django.conf import settings
 from events_bot.telegram_bot import start_bot
 
 
 if __name__ == '__main__':
-    start_bot()
+    parser = argparse.ArgumentParser(description='Запуск Telegram-бота')
+    parser.add_argument(
+        '--mode',
+        choices=['polling', 'webhook'],
+        default=settings.TG_BOT_MODE,
+        help='polling — опрос Telegram из этого процесса; '
+             'webhook — регистрация адреса, обновления принимает meetup.asgi '
+             '(один процесс, остальные — резерв)'
+    )
+    args = parser.parse_args()
+    start_bot(args.mode)
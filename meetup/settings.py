@@ -16,7 +16,7 @@ TG_BOT_TOKEN =env.str('TG_BOT_TOKEN')
 
 
 DEBUG = True
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', [])
 
 
 INSTALLED_APPS = [
@@ -62,7 +62,7 @@ WSGI_APPLICATION = 'meetup.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'events_bot.sqlite_backend',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
@@ -106,3 +106,86 @@ YOOKASSA_SECRET_KEY = env.str('YOOKASSA_SECRET_KEY', '')
 #WEBHOOK_URL = 'https://домен/yookassa-webhook/'
 
 TG_BOT_USERNAME =env.str('TG_BOT_USERNAME', '')
+
+TG_BROADCAST_RATE = env.int('TG_BROADCAST_RATE', 30)
+TG_BROADCAST_WORKERS = env.int('TG_BROADCAST_WORKERS', 8)
+TG_BROADCAST_CHUNK_SIZE = env.int('TG_BROADCAST_CHUNK_SIZE', 500)
+TG_BROADCAST_PROGRESS_INTERVAL = env.int('TG_BROADCAST_PROGRESS_INTERVAL', 3)
+TG_OUTBOX_BATCH_SIZE = env.int('TG_OUTBOX_BATCH_SIZE', 100)
+# Через сколько секунд взятое в отправку уведомление снова считается ожидающим
+# (процесс упал, не успев записать результат)
+TG_OUTBOX_LEASE = env.int('TG_OUTBOX_LEASE', 300)
+
+# Потоки для обработки обновлений; обновления одного пользователя идут по порядку
+TG_HANDLER_WORKERS = env.int('TG_HANDLER_WORKERS', 8)
+
+# Общий клиент Telegram: пул соединений делят диспетчер, рассылки и views.
+# По умолчанию хватает на всех обработчиков, две одновременные рассылки
+# (от организатора и outbox) и getUpdates, фоновые задачи и views
+TG_CON_POOL_SIZE = env.int('TG_CON_POOL_SIZE', TG_HANDLER_WORKERS + 2 * TG_BROADCAST_WORKERS + 5)
+TG_CONNECT_TIMEOUT = env.float('TG_CONNECT_TIMEOUT', 5.0)
+TG_READ_TIMEOUT = env.float('TG_READ_TIMEOUT', 10.0)
+
+# Режим получения обновлений: polling или webhook
+TG_BOT_MODE = env.str('TG_BOT_MODE', 'polling')
+TG_WEBHOOK_URL = env.str('TG_WEBHOOK_URL', '')
+TG_WEBHOOK_SECRET = env.str('TG_WEBHOOK_SECRET', '')
+
+# Кэш участников в памяти процесса бота
+PARTICIPANT_CACHE_SIZE = env.int('PARTICIPANT_CACHE_SIZE', 10000)
+PARTICIPANT_CACHE_TTL = env.int('PARTICIPANT_CACHE_TTL', 300)
+ACTIVE_EVENT_CACHE_TTL = env.int('ACTIVE_EVENT_CACHE_TTL', 60)
+
+# Рекомендации анкет для знакомств
+RECOMMENDATIONS_TOP_K = env.int('RECOMMENDATIONS_TOP_K', 20)
+RECOMMENDATIONS_MAX_FEATURES = env.int('RECOMMENDATIONS_MAX_FEATURES', 2048)
+RECOMMENDATIONS_REFRESH_INTERVAL = env.int('RECOMMENDATIONS_REFRESH_INTERVAL', 600)
+
+# Состояния диалогов и user_data бота пишутся в базу пачками раз в N секунд
+TG_PERSISTENCE_FLUSH_INTERVAL = env.int('TG_PERSISTENCE_FLUSH_INTERVAL', 5)
+# Сколько секунд процесс владеет состояниями без продления. Бот в режиме polling
+# при старте ждёт, пока владение не освободится или не истечёт; webhook не ждёт
+# и отвечает 503, пока состояния ведёт другой процесс
+TG_PERSISTENCE_LEASE = env.int('TG_PERSISTENCE_LEASE', 30)
+
+# Прагмы SQLite для каждого соединения (см. events_bot/sqlite.py)
+SQLITE_JOURNAL_MODE = env.str('SQLITE_JOURNAL_MODE', 'wal')
+SQLITE_BUSY_TIMEOUT = env.int('SQLITE_BUSY_TIMEOUT', 5000)
+SQLITE_SYNCHRONOUS = env.str('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_MMAP_SIZE = env.int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+SQLITE_CACHE_SIZE = env.int('SQLITE_CACHE_SIZE', -20000)
+
+# Замеры обработчиков: пороги для предупреждений и интервал сводки в лог (0 — без сводки)
+HANDLER_SLOW_MS = env.int('HANDLER_SLOW_MS', 500)
+HANDLER_MAX_QUERIES = env.int('HANDLER_MAX_QUERIES', 20)
+HANDLER_STATS_INTERVAL = env.int('HANDLER_STATS_INTERVAL', 300)
+
+# Сколько секунд админка помнит число строк отфильтрованного списка больших таблиц
+ADMIN_COUNT_CACHE_TTL = env.int('ADMIN_COUNT_CACHE_TTL', 60)
+
+# Строк на одно чтение из базы при выгрузке в CSV/JSONL
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', 2000)
+
+# Ленты iCalendar: внешний адрес сайта для ссылок в боте и срок, на который процесс запоминает ETag ленты
+ICS_BASE_URL = env.str('ICS_BASE_URL', TG_WEBHOOK_URL)
+ICS_FEED_CACHE_TTL = env.int('ICS_FEED_CACHE_TTL', 60)
+
+# Метрики Prometheus: /metrics/ в Django; бот в режиме polling отдаёт их на METRICS_PORT (0 — выключено).
+# Без METRICS_TOKEN Django на /metrics/ отвечает 404, а METRICS_HOST может быть только loopback
+METRICS_TOKEN = env.str('METRICS_TOKEN', '')
+METRICS_PORT = env.int('METRICS_PORT', 0)
+METRICS_HOST = env.str('METRICS_HOST', '127.0.0.1')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'events_bot': {'handlers': ['console'], 'level': env.str('LOG_LEVEL', 'INFO')},
+    },
+}
@@ -1,6 +1,12 @@
 from django.contrib import admin
 from django.urls import path
 
+from events_bot.views import event_calendar, metrics, participant_calendar, telegram_webhook
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('telegram/webhook/', telegram_webhook, name='telegram-webhook'),
+    path('metrics/', metrics, name='metrics'),
+    path('calendar/events/<int:event_id>.ics', event_calendar, name='event-calendar'),
+    path('calendar/participants/<str:token>.ics', participant_calendar, name='participant-calendar'),
 ]